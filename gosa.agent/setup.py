@@ -85,6 +85,8 @@ setup(
         gosa-agent.httpd = gosa.agent.httpd:HTTPService
         gosa-agent.scheduler = gosa.agent.scheduler:SchedulerService
         gosa-agent.acl = gosa.agent.acl:ACLResolver
+        gosa-agent.ldap = gosa.agent.ldap_utils:LDAPUtils
+        gosa-agent.auth = gosa.agent.auth:Authenticator
         gosa-agent.jsonrpc_service = gosa.agent.jsonrpc_service:JSONRPCService
         gosa-agent.jsonrpc_om = gosa.agent.jsonrpc_objects:JSONRPCObjectMapper
         gosa-agent.plugins.samba.utils = gosa.agent.plugins.samba.utils:SambaUtils
@@ -93,6 +95,10 @@ setup(
         gosa-agent.plugins.goto.network = gosa.agent.plugins.goto.network:NetworkUtils
         gosa-agent.plugins.goto.client_service = gosa.agent.plugins.goto.client_service:ClientService
 
+        [gosa.auth.backend]
+        auth.amqp = gosa.agent.auth:AMQPAuth
+        auth.ldap = gosa.agent.auth:LDAPAuth
+
         [gosa.object.backend]
         backend.ldap = gosa.agent.objects.backend.back_ldap:LDAP
 
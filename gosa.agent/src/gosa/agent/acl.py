@@ -25,6 +25,8 @@ import os
 import json
 import ldap
 import logging
+from threading import RLock
+from collections import OrderedDict
 
 from zope.interface import implements
 from gosa.common.handler import IInterfaceHandler
@@ -43,6 +45,34 @@ class ACLException(Exception):
     pass
 
 
+def _invalidate():
+    """
+    Notify the active resolver that the rule set has been modified.
+    """
+    r = ACLResolver.instance
+    if r:
+        r.invalidate_cache()
+
+
+def compile_topic(topic):
+    """
+    Translate an ACL topic containing the ``#`` and ``*`` placeholders
+    into a compiled regular expression.
+
+    ============== =============
+    Key            Description
+    ============== =============
+    topic          The topic to compile, e.g. 'com.gosa.*'
+    ============== =============
+
+    ``Return``: compiled regular expression
+    """
+    test_act = re.escape(topic)
+    test_act = re.sub(r'(^|\\.)(\\\*)(\\.|$)', '\\1.*\\3', test_act)
+    test_act = re.sub(r'(^|\\.)(\\#)(\\.|$)', '\\1[^\.]*\\3', test_act)
+    return re.compile(test_act)
+
+
 class ACLSet(list):
     """
     The base class of all ACL assignments is the 'ACLSet' class which
@@ -108,6 +138,7 @@ class ACLSet(list):
         for acl in self:
             if user in acl.members:
                 acl.members.remove(user)
+                acl.set_members(acl.members)
 
     def remove_acl(self, acl):
         """
@@ -134,6 +165,7 @@ class ACLSet(list):
         for cur_acl in self:
             if cur_acl == acl:
                 self.remove(acl)
+                _invalidate()
                 return
 
         # Raise an exception about the unknown ID
@@ -171,6 +203,7 @@ class ACLSet(list):
 
         # Sort Acl items by id
         self.sort(key=lambda item: (item.priority * 1))
+        _invalidate()
 
     def __str__(self):
         return(self.repr_self())
@@ -291,6 +324,7 @@ class ACLRole(list):
 
         # Sort Acl items by id
         self.sort(key=lambda item: (item.priority * -1))
+        _invalidate()
 
     def get_name(self):
         """
@@ -415,6 +449,8 @@ class ACL(object):
 
         self.actions = []
         self.members = []
+        self.__compiled_actions = []
+        self.__compiled_members = []
 
         r = ACLResolver.instance
         self.id = r.get_next_acl_id()
@@ -447,6 +483,7 @@ class ACL(object):
         if rolename in r.acl_roles:
             self.uses_role = True
             self.role = rolename
+            _invalidate()
         else:
             raise ACLException("Unknown role '%s'!" % rolename)
 
@@ -470,6 +507,7 @@ class ACL(object):
             raise ACLException("A scope can only set for non-role bases ACLs.")
 
         self.scope = scope
+        _invalidate()
 
     def set_priority(self, priority):
         """
@@ -494,6 +532,7 @@ class ACL(object):
 
         """
         self.priority = priority
+        _invalidate()
 
     def set_members(self, members):
         """
@@ -517,6 +556,8 @@ class ACL(object):
             raise(ACLException("Requires a list of members!"))
 
         self.members = members
+        self.__compiled_members = [re.compile(member) for member in members]
+        _invalidate()
 
     def clear_actions(self):
         """
@@ -525,6 +566,8 @@ class ACL(object):
         self.role = None
         self.uses_role = False
         self.actions = []
+        self.__compiled_actions = []
+        _invalidate()
 
     def add_action(self, topic, acls, options=None):
         """
@@ -602,6 +645,11 @@ class ACL(object):
                 'options': options if options else {}}
         self.actions.append(acl)
 
+        # Keep a precompiled version of the topic and the acls, to
+        # avoid rebuilding them for every match.
+        self.__compiled_actions.append((compile_topic(topic), frozenset(acls), acl))
+        _invalidate()
+
     def get_members(self):
         """
         Returns the list of members this ACL is valid for.
@@ -653,8 +701,8 @@ class ACL(object):
             user_match = True
         else:
             user_match = False
-            for suser in self.members:
-                if re.match(suser, user):
+            for suser in self.__compiled_members:
+                if suser.match(user):
                     user_match = True
                     break
 
@@ -676,19 +724,15 @@ class ACL(object):
                         self.log.debug("ACL role entry matched for role '%s'" % self.role)
                         return (match, scope)
             else:
-                for act in self.actions:
-
-                    # check for # and * placeholders
-                    test_act = re.escape(act['topic'])
-                    test_act = re.sub(r'(^|\\.)(\\\*)(\\.|$)', '\\1.*\\3', test_act)
-                    test_act = re.sub(r'(^|\\.)(\\#)(\\.|$)', '\\1[^\.]*\\3', test_act)
+                required = set(acls)
+                for test_act, allowed, act in self.__compiled_actions:
 
                     # Check if the requested-action matches the acl-action.
-                    if not re.match(test_act, topic):
+                    if not test_act.match(topic):
                         continue
 
                     # Check if the required permission are allowed.
-                    if (set(acls) & set(act['acls'])) != set(acls):
+                    if not required <= allowed:
                         continue
 
                     # Check if all required options are given
@@ -778,6 +822,10 @@ class ACLResolver(Plugin):
         >>> acl = ACL(scope=ACL.ONE)
         >>> acls.add(acl)
         >>> acls
+
+    The results of ``check`` are kept in a bounded LRU cache which can be
+    configured using the ``core.acl-cache-size`` option. It is flushed
+    whenever the rule set gets modified.
     """
     implements(IInterfaceHandler)
     instance = None
@@ -786,6 +834,7 @@ class ACLResolver(Plugin):
     admins = []
 
     next_acl_id = 0
+    cache_size = 10000
 
     _priority_ = 0
     _target_ = 'core'
@@ -796,6 +845,14 @@ class ACLResolver(Plugin):
         self.log = logging.getLogger(__name__)
         self.log.debug("initializing ACL resolver")
 
+        # Prepare the decision cache
+        self.__cache_lock = RLock()
+        self.__cache = OrderedDict()
+        self.__index = None
+        self.__generation = 0
+        self.cache_size = int(self.env.config.get("core.acl-cache-size",
+            default=ACLResolver.cache_size))
+
         # Load override admins from configuration
         admins = self.env.config.get("core.admins", default=None)
         if admins:
@@ -821,14 +878,14 @@ class ACLResolver(Plugin):
 
     def get_next_acl_id(self):
 
-        used_ids = []
+        used_ids = set()
         for aclset in self.acl_sets:
             for acl in aclset:
-                used_ids.append(acl.id)
+                used_ids.add(acl.id)
 
         for aclrole in self.acl_roles:
             for acl in self.acl_roles[aclrole]:
-                used_ids.append(acl.id)
+                used_ids.add(acl.id)
 
         while self.next_acl_id in used_ids:
             self.next_acl_id += 1
@@ -842,6 +899,36 @@ class ACLResolver(Plugin):
 
         self.acl_sets = []
         self.acl_roles = {}
+        self.invalidate_cache()
+
+    def invalidate_cache(self):
+        """
+        Drops the cached ACL decisions and the base index. This is called
+        whenever the rule set gets modified.
+        """
+        with self.__cache_lock:
+            self.__generation += 1
+            self.__cache.clear()
+            self.__index = None
+
+    def get_cache_info(self):
+        """
+        Returns the current size and the limit of the decision cache.
+        """
+        return {'size': len(self.__cache), 'limit': self.cache_size}
+
+    def __get_index(self):
+        """
+        Returns the ACLSets indexed by their base, building the index on demand.
+        """
+        with self.__cache_lock:
+            if self.__index is None:
+                index = {}
+                for acl_set in self.acl_sets:
+                    index.setdefault(acl_set.base, []).append(acl_set)
+                self.__index = index
+
+            return self.__index
 
     def add_acl_set(self, acl):
         """
@@ -849,6 +936,7 @@ class ACLResolver(Plugin):
         """
         if not self.aclset_exists_by_base(acl.base):
             self.acl_sets.append(acl)
+            self.invalidate_cache()
 
         else:
             raise ACLException("An acl definition for base '%s' already exists!", acl.base)
@@ -901,6 +989,7 @@ class ACLResolver(Plugin):
         ============== =============
         """
         self.acl_roles[role.name] = role
+        self.invalidate_cache()
 
     def load_from_file(self):
         """
@@ -999,6 +1088,8 @@ class ACLResolver(Plugin):
                         acls.add(acl)
                 self.add_acl_set(acls)
 
+        self.invalidate_cache()
+
     def save_to_file(self):
         """
         Saves the acl definitions back the configured storage file.
@@ -1085,6 +1176,39 @@ class ACLResolver(Plugin):
         if not base:
             base = self.base
 
+        # Try to answer the request from the decision cache. Options that
+        # cannot be hashed simply bypass the cache.
+        try:
+            key = (user, base, topic, acls,
+                tuple(sorted(options.items())) if options else None)
+            hash(key)
+        except (TypeError, AttributeError):
+            key = None
+
+        with self.__cache_lock:
+            generation = self.__generation
+            if key is not None and key in self.__cache:
+                allowed = self.__cache.pop(key)
+                self.__cache[key] = allowed
+                return allowed
+
+        allowed = self.__check(user, topic, acls, options, base)
+
+        # Store the decision, unless the rule set has been changed meanwhile
+        if key is not None and self.cache_size > 0:
+            with self.__cache_lock:
+                if generation == self.__generation:
+                    self.__cache[key] = allowed
+                    if len(self.__cache) > self.cache_size:
+                        self.__cache.popitem(last=False)
+
+        return allowed
+
+    def __check(self, user, topic, acls, options, base):
+        """
+        Resolves the permissions for the given user and base without
+        using the decision cache.
+        """
         # Collect all acls matching the where statement
         allowed = False
         reset = False
@@ -1092,15 +1216,12 @@ class ACLResolver(Plugin):
         self.log.debug("checking ACL for %s/%s/%s" % (user, base, str(topic)))
 
         # Remove the first part of the dn, until we reach the ldap base.
+        index = self.__get_index()
         orig_loc = base
         while self.base in base:
 
-            # Check acls for each acl set.
-            for acl_set in self.acl_sets:
-
-                # Skip acls that do not match the current ldap base.
-                if base != acl_set.base:
-                    continue
+            # Check acls for each acl set that matches the current ldap base.
+            for acl_set in index.get(base, []):
 
                 # Check ACls
                 for acl in acl_set:
@@ -1236,11 +1357,13 @@ class ACLResolver(Plugin):
 
         # Remove all aclsets for the given base
         found = 0
-        for aclset in self.acl_sets:
+        for aclset in self.acl_sets[:]:
             if aclset.base == base:
                 self.acl_sets.remove(aclset)
                 found += 1
 
+        self.invalidate_cache()
+
         # Send a message if there were no ACLSets for the given base
         if  not found:
             raise ACLException("No acl definitions for base '%s' were found, removal aborted!")
@@ -1273,6 +1396,7 @@ class ACLResolver(Plugin):
                 raise ACLException("The role '%s' cannot be removed, it is still in use!" % name)
             else:
                 del(self.acl_roles[name])
+                self.invalidate_cache()
                 return True
         else:
             raise ACLException("No such role '%s', removal aborted!" % name)
@@ -1434,6 +1558,7 @@ class ACLResolver(Plugin):
 
                     # Remove the acl from the set.
                     aclset.remove(acl)
+                    self.invalidate_cache()
 
                     # We've removed the last acl for this base,  remove the aclset.
                     if len(aclset) == 0:
@@ -1952,6 +2077,7 @@ class ACLResolver(Plugin):
             for _acl in self.acl_roles[_aclrole]:
                 if _acl.id == role_id:
                     self.acl_roles[_aclrole].remove(_acl)
+                    self.invalidate_cache()
                     return
 
         raise ACLException("No such roleacl-id (%s) removal aborted!" % (role_id))
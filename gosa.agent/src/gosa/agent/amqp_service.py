@@ -240,4 +240,4 @@ class AMQPService(object):
         sender = ssn.sender(message.reply_to)
 
         # Get rid of it...
-        sender.send(Message(response))
+        sender.send(Message(response, correlation_id=message.correlation_id))
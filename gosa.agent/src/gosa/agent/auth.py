@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+The *Authenticator* verifies user credentials for the JSONRPC service. The
+actual check is done by an authentication backend which is loaded from the
+``gosa.auth.backend`` setuptools entry point:
+
+=============== ============
+Backend         Description
+=============== ============
+AMQPAuth        Authenticate against the SASL configuration of the AMQP broker
+LDAPAuth        Authenticate using a simple bind on the LDAP user entry
+=============== ============
+
+Successfully verified credentials are kept as salted hashes for a limited
+time, so that repeated logins do not need to contact the backend again.
+Users failing to authenticate too often are blocked for a while without
+querying the backend.
+
+It is configured thru the ``[auth]`` section of your GOsa configuration:
+
+=============== ============
+Key             Description
+=============== ============
+backend         Name of the authentication backend, defaults to *AMQPAuth*
+cache-ttl       Seconds a verified credential is kept, 0 disables the cache
+cache-size      Maximum number of cached credentials
+max-failures    Failed attempts after which a user gets blocked
+failure-window  Seconds in which failed attempts are counted
+lockout         Seconds a blocked user is rejected
+user-filter     LDAP filter to find the user entry for *LDAPAuth*
+=============== ============
+
+Example::
+
+    [auth]
+    backend = LDAPAuth
+    cache-ttl = 300
+    user-filter = (&(objectClass=inetOrgPerson)(uid=%s))
+
+------
+"""
+import os
+import time
+import hmac
+import hashlib
+import logging
+import ldap
+import ldap.filter
+import pkg_resources
+from threading import Lock
+from collections import OrderedDict
+from gosa.common import Environment
+from gosa.common.utils import N_
+from gosa.common.components import Command, Plugin, PluginRegistry
+from gosa.agent.ldap_utils import LDAPHandler
+
+
+class AuthBackend(object):
+    """
+    Base class for authentication backends.
+    """
+
+    def check(self, user, password):
+        """
+        Check the given credentials.
+
+        ``Return:`` True on success
+        """
+        raise NotImplementedError("authentication backend is missing check()")
+
+
+class AMQPAuth(AuthBackend):
+    """
+    Authenticate users using the AMQP service' SASL configuration.
+    """
+
+    def check(self, user, password):
+        amqp = PluginRegistry.getInstance('AMQPHandler')
+        return amqp.checkAuth(user, password)
+
+
+class LDAPAuth(AuthBackend):
+    """
+    Authenticate users by binding with their LDAP entry. The bind is done
+    on a connection of the :class:`gosa.agent.ldap_utils.LDAPHandler` pool,
+    which is restored afterwards.
+    """
+
+    def __init__(self):
+        self.env = Environment.getInstance()
+        self.log = logging.getLogger(__name__)
+        self.lh = LDAPHandler.get_instance()
+        self.user_filter = self.env.config.get("auth.user-filter",
+            default="(&(objectClass=inetOrgPerson)(uid=%s))")
+
+    def check(self, user, password):
+        if isinstance(user, unicode):
+            user = user.encode('utf-8')
+
+        fltr = ldap.filter.filter_format(self.user_filter, [user])
+
+        with self.lh.get_handle() as con:
+            res = con.search_s(self.lh.get_base(), ldap.SCOPE_SUBTREE, fltr,
+                ['objectClass'])
+
+            if len(res) != 1:
+                self.log.debug("no unique LDAP entry found for user '%s'" % user)
+                return False
+
+            if isinstance(password, unicode):
+                password = password.encode('utf-8')
+
+            try:
+                con.simple_bind_s(res[0][0], password)
+            except ldap.INVALID_CREDENTIALS as e:
+                self.log.debug("LDAP authentication for '%s' reports: %s" % (user, str(e)))
+                return False
+
+            finally:
+                self.lh.bind(con)
+
+        return True
+
+
+class Authenticator(Plugin):
+    """
+    Credential verification with caching and rate limiting of failed
+    attempts. See the module documentation for the configuration.
+    """
+    _target_ = 'core'
+
+    def __init__(self):
+        self.env = Environment.getInstance()
+        self.log = logging.getLogger(__name__)
+
+        get = self.env.config.get
+        self.cache_ttl = int(get("auth.cache-ttl", default=300))
+        self.cache_size = int(get("auth.cache-size", default=1000))
+        self.max_failures = int(get("auth.max-failures", default=5))
+        self.failure_window = int(get("auth.failure-window", default=60))
+        self.lockout = int(get("auth.lockout", default=60))
+
+        self.__lock = Lock()
+        self.__cache = OrderedDict()
+        self.__failures = {}
+        self.__stats = {'hits': 0, 'misses': 0, 'failures': 0, 'rejected': 0}
+
+        # Load the configured backend
+        name = get("auth.backend", default="AMQPAuth")
+        self.__backend = None
+        for entry in pkg_resources.iter_entry_points("gosa.auth.backend"):
+            clazz = entry.load()
+            if clazz.__name__ == name:
+                self.__backend = clazz()
+                break
+
+        if not self.__backend:
+            raise ValueError("no such authentication backend '%s'" % name)
+
+        self.log.info("using authentication backend '%s'" % name)
+
+    def authenticate(self, user, password):
+        """
+        Check a username / password combination.
+
+        =============== ============
+        Parameter       Description
+        =============== ============
+        user            Username
+        password        Password
+        =============== ============
+
+        ``Return:`` Bool, success or failure
+        """
+        # Don't allow blank authentication
+        if not user or not password:
+            return False
+
+        now = time.time()
+        secret = password.encode('utf-8') if isinstance(password, unicode) else password
+
+        with self.__lock:
+
+            # Reject users which failed too often
+            failures = self.__failures.get(user)
+            if failures and failures[2] > now:
+                self.__stats['rejected'] += 1
+                self.log.warning("rejecting login for '%s' - too many failed attempts" % user)
+                return False
+
+            # Try the credential cache
+            entry = self.__cache.get(user)
+            if entry and entry[2] > now and self.__compare(entry[1], self.__hash(entry[0], secret)):
+                self.__stats['hits'] += 1
+                return True
+
+            self.__stats['misses'] += 1
+
+        # Ask the backend
+        success = self.__backend.check(user, password)
+
+        with self.__lock:
+            if success:
+                self.__failures.pop(user, None)
+
+                if self.cache_ttl > 0:
+                    salt = os.urandom(16)
+                    self.__cache.pop(user, None)
+                    self.__cache[user] = (salt, self.__hash(salt, secret), now + self.cache_ttl)
+                    while len(self.__cache) > self.cache_size:
+                        self.__cache.popitem(last=False)
+
+            else:
+                self.__stats['failures'] += 1
+                self.__cache.pop(user, None)
+
+                # Count failures within the window and block if needed
+                count, first, blocked = self.__failures.get(user, (0, now, 0))
+                if now - first > self.failure_window:
+                    count, first = 0, now
+
+                count += 1
+                if count >= self.max_failures:
+                    blocked = now + self.lockout
+
+                self.__failures[user] = (count, first, blocked)
+
+                # Don't let the failure list grow without bounds
+                if len(self.__failures) > self.cache_size:
+                    for key, value in self.__failures.items():
+                        if value[2] < now and now - value[1] > self.failure_window:
+                            del self.__failures[key]
+
+        return success
+
+    def invalidate(self, user=None):
+        """
+        Drop cached credentials for the given user or for everyone.
+        """
+        with self.__lock:
+            if user:
+                self.__cache.pop(user, None)
+            else:
+                self.__cache.clear()
+
+    @Command(__help__=N_("Return statistics of the authentication cache."))
+    def getAuthenticationStatistics(self):
+        """
+        Return statistics of the authentication cache.
+
+        ============== =============
+        Key            Description
+        ============== =============
+        hits           Logins verified by the cache
+        misses         Logins verified by the backend
+        failures       Failed logins
+        rejected       Logins rejected due to too many failures
+        size           Number of cached credentials
+        blocked        Number of currently blocked users
+        ============== =============
+
+        ``Return:`` dict with statistics
+        """
+        now = time.time()
+        with self.__lock:
+            stats = dict(self.__stats)
+            stats['size'] = len(self.__cache)
+            stats['blocked'] = len([f for f in self.__failures.values() if f[2] > now])
+
+        return stats
+
+    def __hash(self, salt, password):
+        return hashlib.sha256(salt + password).digest()
+
+    def __compare(self, a, b):
+        # Constant time comparison where available
+        if hasattr(hmac, 'compare_digest'):
+            return hmac.compare_digest(a, b)
+
+        return a == b
@@ -41,7 +41,7 @@ import logging
 import datetime
 import gettext
 from pkg_resources import resource_filename
-from threading import Event
+from threading import Event, Condition, Lock
 from inspect import getargspec, getmembers, ismethod
 from zope.interface import implements
 from gosa.common.components import PluginRegistry, ObjectRegistry, Command
@@ -49,8 +49,10 @@ from gosa.common.handler import IInterfaceHandler
 from gosa.common import Environment
 from gosa.common.event import EventMaker
 from gosa.common.utils import stripNs, N_
-from gosa.common.components import AMQPServiceProxy, Plugin
+from gosa.common.components import AMQPServiceProxy, Plugin, JSONRPCException
 from gosa.common.components.amqp import EventConsumer
+from gosa.common.components.cache import Cache
+from gosa.agent.routing import NodeRouter
 
 
 # Global command types
@@ -92,6 +94,14 @@ class CommandRegistry(Plugin):
         self.log = logging.getLogger(__name__)
         self.log.info("initializing command registry")
         self.processing = Event()
+        self.fanout_timeout = float(self.env.config.get('core.fanout-timeout', default=10))
+        self.call_timeout = float(self.env.config.get('core.call-timeout', default=60))
+        self.router = NodeRouter(
+            node_timeout=int(self.env.config.get('core.node-timeout', default=60)),
+            failure_threshold=int(self.env.config.get('core.route-failure-threshold', default=5)),
+            reset_timeout=int(self.env.config.get('core.route-reset-timeout', default=30)))
+        self.__stats = {}
+        self.__stats_lock = Lock()
 
     @Command(__help__=N_("List available service nodes on the bus."))
     def getNodes(self):
@@ -245,10 +255,14 @@ class CommandRegistry(Plugin):
         Dispatch will...
 
           * ... forward *unknown* commands to nodes that
-            are capable of processing them - ordered by load.
+            are capable of processing them - chosen by the
+            :class:`gosa.agent.routing.NodeRouter`. Forwarded calls
+            fail after *core.call-timeout* seconds.
 
           * ... will take care about the modes *NORMAL*, *FIRSTRESULT*,
-            *CUMULATIVE* like defined in the *Command* decorator.
+            *CUMULATIVE* like defined in the *Command* decorator. The
+            latter two are sent to all providers concurrently and wait
+            at most *core.fanout-timeout* seconds for the answers.
 
         ``Return:`` the real methods result
         """
@@ -299,73 +313,292 @@ class CommandRegistry(Plugin):
                 return PluginRegistry.modules[clazz].\
                         __getattribute__(method)(*arg, **larg)
             else:
-                # Sort nodes by load, use first which is in [func][provider]
-                provider = None
-                nodes = self.get_load_sorted_nodes()
-
-                # Get first match that is a provider for this function
-                for provider, node in nodes:
-                    if provider in self.capabilities[func]['provider']:
-                        break
+                # Let the router choose the provider
+                provider = self.router.select(func)
+                if not provider:
+                    raise CommandInvalid("no node available for function '%s'" % func)
 
                 # Set target queue directly to the evaulated node which provides that method
                 target = self.env.domain + '.command.%s.%s' % (self.capabilities[func]['target'], provider)
 
-                # Load amqp service proxy for that queue if not already present
-                if not target in self.proxy:
-                    amqp = PluginRegistry.getInstance("AMQPHandler")
-                    self.proxy[target] = AMQPServiceProxy(amqp.url['source'], target)
-
                 # Run the query
-                methodCall = getattr(self.proxy[target], method)
-                return methodCall(*arg, **larg)
+                methodCall = getattr(self.__get_proxy(target), func)
+                started = time.time()
+                try:
+                    result = methodCall(*arg, **larg)
+
+                # Errors raised by the method itself don't tell anything about the node
+                except JSONRPCException:
+                    self.router.record(provider, time.time() - started)
+                    raise
+
+                except Exception:
+                    self.router.record(provider, time.time() - started, True)
+                    raise
+
+                self.router.record(provider, time.time() - started)
+                return result
 
-        # FIRSTRESULT: try all providers, return on first non exception
-        # CUMMULATIVE: try all providers, merge non exception results
+        # FIRSTRESULT: ask all providers at once, return the first non exception result
+        # CUMULATIVE: ask all providers at once, merge non exception results
         elif methodType == FIRSTRESULT or methodType == CUMULATIVE:
-            # Walk thru nodes
-            result = None
-            for node in self.nodes.keys():
+            return self.__fan_out(func, methodType, arg, larg)
 
-                # Don't bother with non provider nodes, just skip them
-                if not node in self.capabilities[func]['provider']:
-                    continue
+        else:
+            raise CommandInvalid("no method type '%s' defined" % methodType)
+
+    def __fan_out(self, func, methodType, arg, larg):
+        """
+        Send the call to all nodes providing *func* concurrently and
+        collect their answers until *core.fanout-timeout* is reached.
+        Nodes failing or not answering in time are logged and recorded
+        in the node statistics, the results of the others are used.
 
-                # Is it me?
-                if node == self.env.id:
-                    (clazz, method) = self.path2method(self.commands[func]['path'])
-                    methodCall = PluginRegistry.modules[clazz].__getattribute__(method)
+        ``Return:`` first result or dict of results indexed by node
+        """
+        deadline = time.time() + self.fanout_timeout
+        providers = [node for node in self.nodes.keys()
+            if node in self.capabilities[func]['provider']]
+
+        cond = Condition()
+        futures = {}
+        finished = []
+
+        def collect(node, started):
+            def done(future):
+                if future.cancelled():
+                    self.__record(node, func, time.time() - started, timeout=True)
                 else:
-                    # Set target queue directly to the evaulated node which provides that method
-                    target = self.env.domain + '.command.%s.%s' % (self.capabilities[func]['target'], node)
+                    self.__record(node, func, time.time() - started, future.exception(0))
+                with cond:
+                    finished.append(node)
+                    cond.notify()
+            return done
+
+        # Send the remote calls first, so that they run while we're
+        # processing the local one
+        for node in providers:
+            if node == self.env.id:
+                continue
+
+            # Set target queue directly to the evaulated node which provides that method
+            target = self.env.domain + '.command.%s.%s' % (self.capabilities[func]['target'], node)
+
+            try:
+                future = getattr(self.__get_proxy(target), func).future(*arg, **larg)
+            except Exception as e:
+                self.__record(node, func, 0, e)
+                continue
+
+            futures[node] = future
+            future.add_done_callback(collect(node, time.time()))
+
+        result = None
+
+        # Is it me?
+        if self.env.id in providers:
+            (clazz, method) = self.path2method(self.commands[func]['path'])
+            started = time.time()
+
+            try:
+                tmp = PluginRegistry.modules[clazz].__getattribute__(method)(*arg, **larg)
+                self.__record(self.env.id, func, time.time() - started)
+
+                if methodType == FIRSTRESULT:
+                    self.__cancel(func, futures)
+                    return tmp
+
+                result = {self.env.id: tmp}
+
+            # We do not care, go to the next..., pylint: disable=W0703
+            except Exception as e:
+                self.__record(self.env.id, func, time.time() - started, e)
+
+        # Wait for the remote nodes
+        index = 0
+        while True:
+            with cond:
+                while index == len(finished) and len(finished) < len(futures):
+                    left = deadline - time.time()
+                    if left <= 0:
+                        break
+                    cond.wait(left)
 
-                    # Load amqp service proxy for that queue if not already present
-                    if not target in self.proxy:
-                        amqp = PluginRegistry.getInstance("AMQPHandler")
-                        self.proxy[target] = AMQPServiceProxy(amqp.url['source'], target)
+                done = finished[index:]
+                index = len(finished)
 
-                    methodCall = getattr(self.proxy[target], method)
+            if not done:
+                break
+
+            for node in done:
+                if futures[node].exception(0):
+                    continue
 
-                # Finally do the call
                 try:
-                    tmp = methodCall(*arg, **larg)
+                    tmp = futures[node].result(0)
 
-                    if methodType == FIRSTRESULT:
-                        return tmp
-                    else:
-                        if result == None:
-                            result = {}
+                # Conversion of the result failed, pylint: disable=W0703
+                except Exception as e:
+                    self.log.warning("failed to process result of '%s' from node %s: %s" % (func, node, str(e)))
+                    continue
 
-                        result[node] = tmp
+                if methodType == FIRSTRESULT:
+                    self.__cancel(func, futures)
+                    return tmp
+
+                if result == None:
+                    result = {}
+
+                result[node] = tmp
+
+        self.__cancel(func, futures)
+        return result
+
+    def __get_proxy(self, target):
+        """ Load amqp service proxy for that queue if not already present. """
+        if not target in self.proxy:
+            amqp = PluginRegistry.getInstance("AMQPHandler")
+            self.proxy[target] = AMQPServiceProxy(amqp.url['source'], target,
+                timeout=self.call_timeout)
+
+        return self.proxy[target]
+
+    def __cancel(self, func, futures):
+        """ Stop waiting for calls which have not been answered yet. """
+        for node, future in futures.iteritems():
+            if future.cancel():
+                self.log.debug("cancelled call of '%s' on node %s" % (func, node))
+
+    def __record(self, node, func, duration, error=None, timeout=False):
+        """ Update the call statistics of a node. """
+        if error:
+            self.log.warning("call of '%s' on node %s failed: %s" % (func, node, str(error)))
+
+        if node != self.env.id:
+            self.router.record(node, duration, timeout or
+                (error is not None and not isinstance(error, JSONRPCException)))
+
+        with self.__stats_lock:
+            if not node in self.__stats:
+                self.__stats[node] = {'calls': 0, 'failures': 0, 'timeouts': 0,
+                    'time_total': 0.0, 'time_max': 0.0, 'last_error': None}
+
+            stats = self.__stats[node]
+            if timeout:
+                stats['timeouts'] += 1
+                return
+
+            stats['calls'] += 1
+            stats['time_total'] += duration
+            stats['time_max'] = max(stats['time_max'], duration)
+            if error:
+                stats['failures'] += 1
+                stats['last_error'] = "%s: %s" % (func, str(error))
+
+    @Command(__help__=N_("Return call statistics of the known nodes."))
+    def getNodeStatistics(self):
+        """
+        Return statistics about the calls which have been sent to other
+        nodes - or processed locally - for *FIRSTRESULT* and *CUMULATIVE*
+        commands, indexed by node:
+
+        ============== =============
+        Key            Description
+        ============== =============
+        calls          Number of answered calls
+        failures       Number of calls that failed
+        timeouts       Number of calls not answered in time or not needed anymore
+        time_avg       Average call duration in seconds
+        time_max       Maximum call duration in seconds
+        last_error     Last reported error
+        ============== =============
+
+        ``Return:`` dict with statistics
+        """
+        res = {}
+        with self.__stats_lock:
+            for node, stats in self.__stats.iteritems():
+                res[node] = dict(stats)
+                res[node]['time_avg'] = stats['time_total'] / stats['calls'] if stats['calls'] else 0.0
+                del res[node]['time_total']
 
-                # We do not care, go to the next..., pylint: disable=W0703
-                except Exception:
-                    pass
+        return res
 
-            return result
+    @Command(__help__=N_("Return routing information of the known nodes."))
+    def getNodeRouting(self):
+        """
+        Return the information used to route calls to other nodes,
+        indexed by node:
+
+        ============== =============
+        Key            Description
+        ============== =============
+        alive          Node has sent a status update within *core.node-timeout*
+        circuit        *closed*, *open* if the node is skipped due to failures, *half-open* while testing it again
+        cost           Estimated cost of a call, lower is better
+        latency        Moving average of the call duration in seconds
+        failure_rate   Moving average of failed calls
+        calls          Number of calls sent to the node
+        failures       Number of calls that failed
+        ============== =============
+
+        ``Return:`` dict with routing information
+        """
+        return self.router.get_statistics()
 
-        else:
-            raise CommandInvalid("no method type '%s' defined" % methodType)
+    @Command(__help__=N_("Return statistics of the caches of this node."))
+    def getCacheStatistics(self, name=None):
+        """
+        Return the usage statistics of the named caches, indexed by
+        cache name:
+
+        ============== =============
+        Key            Description
+        ============== =============
+        size           Number of cached entries
+        max_size       Maximum number of entries
+        hits           Number of lookups answered from the cache
+        misses         Number of lookups not found in the cache
+        waits          Number of lookups which waited for a concurrent load
+        evictions      Number of entries removed to stay within *max_size*
+        expired        Number of entries removed after their time to live
+        ============== =============
+
+        ========== ============
+        Parameter  Description
+        ========== ============
+        name       only return the statistics of this cache
+        ========== ============
+
+        ``Return:`` dict with statistics
+        """
+        return dict((n, c.get_statistics()) for n, c in Cache.get_caches().iteritems()
+                    if name is None or n == name)
+
+    @Command(__help__=N_("Remove all entries from the caches of this node."))
+    def invalidateCache(self, name=None):
+        """
+        Remove all entries from the named caches.
+
+        ========== ============
+        Parameter  Description
+        ========== ============
+        name       only clear this cache
+        ========== ============
+
+        ``Return:`` list of cleared caches
+        """
+        caches = Cache.get_caches()
+        if name is not None and not name in caches:
+            raise ValueError("unknown cache '%s'" % name)
+
+        res = []
+        for n, c in caches.iteritems():
+            if name is None or n == name:
+                c.clear()
+                res.append(n)
+
+        return res
 
     def path2method(self, path):
         """
@@ -449,7 +682,7 @@ class CommandRegistry(Plugin):
 
         ``Return:`` list
         """
-        return sorted(self.nodes.items(), lambda x, y: cmp(x[1]['load'], y[1]['load']))
+        return sorted(self.nodes.items(), key=lambda x: x[1]['load'])
 
     def __del__(self):
         self.log.debug("shutting down command registry")
@@ -471,7 +704,7 @@ class CommandRegistry(Plugin):
         methods = []
         for command in self.commands:
             info = self.commands[command]
-            mtype = {1: 'NORMAL', 2: 'FIRSTRESULT', 3: 'CUMMULATIVE'}[info['type']]
+            mtype = {NORMAL: 'NORMAL', FIRSTRESULT: 'FIRSTRESULT', CUMULATIVE: 'CUMMULATIVE'}[info['type']]
             methods.append(
                 e.NodeMethod(
                     e.Name(command),
@@ -506,7 +739,7 @@ class CommandRegistry(Plugin):
         for method in data.NodeMethod:
             methodName = method.Name.text
             if not methodName in self.capabilities:
-                mtype = {'NORMAL': 1, 'FIRSTRESULT': 2, 'CUMMULATIVE': 3}
+                mtype = {'NORMAL': NORMAL, 'FIRSTRESULT': FIRSTRESULT, 'CUMMULATIVE': CUMULATIVE}
                 self.capabilities[methodName] = {
                     'path': method.Path.text,
                     'target': method.Target.text,
@@ -518,6 +751,7 @@ class CommandRegistry(Plugin):
 
             # Append the sender as a new provider
             self.capabilities[methodName]['provider'].append(data.Id.text)
+            self.router.add_provider(methodName, data.Id.text)
 
         # Add objects
         if hasattr(data, 'NodeObject'):
@@ -546,6 +780,8 @@ class CommandRegistry(Plugin):
             'latency': float(data.Latency),
             'workers': int(data.Workers),
             'received': time.mktime(t.timetuple())}
+        self.router.update_status(data.Id.text, float(data.Load),
+            float(data.Latency), int(data.Workers))
 
     def _handleNodeLeave(self, data):
         """ Receive goodbye messages and act accordingly. """
@@ -556,6 +792,7 @@ class CommandRegistry(Plugin):
         # Remove node from nodes
         if sender in self.nodes:
             del self.nodes[sender]
+        self.router.remove_node(sender)
 
         # Remove node from capabilites
         capabilities = {}
@@ -563,7 +800,7 @@ class CommandRegistry(Plugin):
             if sender in info['provider']:
                 info['provider'].remove(sender)
             if len(info['provider']):
-                self.capabilities[name] = info
+                capabilities[name] = info
         self.capabilities = capabilities
 
     def updateNodes(self):
@@ -572,7 +809,7 @@ class CommandRegistry(Plugin):
         in the configured interval.
         """
         nodes = {}
-        timeout = self.env.config.get('core.node-timeout', 60)
+        timeout = int(self.env.config.get('core.node-timeout', default=60))
 
         for node, info in self.nodes.iteritems():
             t = datetime.datetime.utcnow()
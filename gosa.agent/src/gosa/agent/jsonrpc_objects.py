@@ -1,11 +1,190 @@
 # -*- coding: utf-8 -*-
+"""
+Objects opened by remote clients are kept on a stack until they are
+closed again. Clients which vanish without closing their objects would
+let the stack grow forever, so objects expire after being idle for a
+configurable time and the number of objects per user and in total is
+limited - the least recently used objects are dropped first.
+
+The stack is configured thru the ``[jsonrpc]`` section of your GOsa
+configuration:
+
+================ ============
+Key              Description
+================ ============
+object-ttl       Seconds an object may be idle before it expires
+object-size      Maximum number of objects on the stack
+object-user-size Maximum number of objects per user
+object-sweep     Seconds between two runs of the expiry sweep
+================ ============
+
+------
+"""
 import uuid
+import time
+import logging
+from threading import Lock
+from collections import OrderedDict
 from types import MethodType
 from gosa.common import Environment
 from gosa.common.utils import N_
 from gosa.common.components import Command, PluginRegistry, ObjectRegistry, AMQPServiceProxy, Plugin
 
 
+class ObjectStack(object):
+    """
+    Size limited store for opened objects. Objects which are not
+    accessed for *ttl* seconds expire.
+
+    =============== ============
+    Parameter       Description
+    =============== ============
+    ttl             Seconds an object may be idle before it expires
+    size            Maximum number of objects
+    user_size       Maximum number of objects per user
+    =============== ============
+    """
+
+    #: Upper bounds of the age classes reported by get_statistics
+    age_classes = [60, 300, 900, 3600]
+
+    def __init__(self, ttl=600, size=10000, user_size=100):
+        self.ttl = ttl
+        self.size = size
+        self.user_size = user_size
+        self.log = logging.getLogger(__name__)
+
+        self.__lock = Lock()
+        self.__entries = OrderedDict()
+        self.__users = {}
+        self.__evicted = 0
+        self.__expired = 0
+
+    def add(self, ref, user, entry):
+        """
+        Put an object description on the stack. If a limit is
+        exceeded, the least recently used objects are dropped.
+        """
+        now = time.time()
+        entry['user'] = user
+        entry['created'] = now
+        entry['expires'] = now + self.ttl
+
+        with self.__lock:
+            self.__entries[ref] = entry
+            refs = self.__users.setdefault(user, OrderedDict())
+            refs[ref] = None
+
+            while len(refs) > self.user_size:
+                self.__drop(refs.iterkeys().next())
+                self.__evicted += 1
+
+            while len(self.__entries) > self.size:
+                self.__drop(self.__entries.iterkeys().next())
+                self.__evicted += 1
+
+    def get(self, ref):
+        """
+        Return the object description and refresh its expiry time.
+
+        ``Return``: dict or None
+        """
+        now = time.time()
+        with self.__lock:
+            entry = self.__entries.pop(ref, None)
+            if not entry:
+                return None
+
+            if entry['expires'] < now:
+                self.__drop_user(ref, entry['user'])
+                self.__expired += 1
+                return None
+
+            # Re-insert to keep the LRU order
+            entry['expires'] = now + self.ttl
+            self.__entries[ref] = entry
+            refs = self.__users[entry['user']]
+            del refs[ref]
+            refs[ref] = None
+
+            return entry
+
+    def remove(self, ref):
+        """
+        Remove the object from the stack.
+
+        ``Return``: True if it has been on the stack
+        """
+        with self.__lock:
+            if not ref in self.__entries:
+                return False
+
+            self.__drop(ref)
+            return True
+
+    def sweep(self):
+        """
+        Remove all expired objects.
+
+        ``Return``: number of removed objects
+        """
+        now = time.time()
+        with self.__lock:
+            expired = [ref for ref, entry in self.__entries.iteritems() if entry['expires'] < now]
+            for ref in expired:
+                self.__drop(ref)
+
+            self.__expired += len(expired)
+
+        return len(expired)
+
+    def get_statistics(self):
+        """
+        ``Return``: dict of stack statistics, see
+        :meth:`gosa.agent.jsonrpc_objects.JSONRPCObjectMapper.getObjectStackStatistics`
+        """
+        now = time.time()
+        ages = [0] * (len(self.age_classes) + 1)
+        oldest = 0
+
+        with self.__lock:
+            for entry in self.__entries.itervalues():
+                age = now - entry['created']
+                oldest = max(oldest, age)
+                for i, limit in enumerate(self.age_classes):
+                    if age < limit:
+                        ages[i] += 1
+                        break
+                else:
+                    ages[-1] += 1
+
+            return {
+                'size': len(self.__entries),
+                'users': len(self.__users),
+                'max_user_size': max([len(r) for r in self.__users.values()] or [0]),
+                'oldest': oldest,
+                'ages': dict(zip(["<%d" % l for l in self.age_classes] + [">=%d" % self.age_classes[-1]], ages)),
+                'evicted': self.__evicted,
+                'expired': self.__expired}
+
+    def __drop(self, ref):
+        entry = self.__entries.pop(ref)
+        self.__drop_user(ref, entry['user'])
+        self.log.debug("dropped object %s (%s) of user '%s'" % (ref, entry['oid'], entry['user']))
+
+    def __drop_user(self, ref, user):
+        refs = self.__users[user]
+        del refs[ref]
+        if not refs:
+            del self.__users[user]
+
+    def __contains__(self, ref):
+        return self.get(ref) is not None
+
+    def __len__(self):
+        return len(self.__entries)
+
+
 class JSONRPCObjectMapper(Plugin):
     """
     The *JSONRPCObjectMapper* is a GOsa agent plugin that implements a stack
@@ -26,15 +205,58 @@ class JSONRPCObjectMapper(Plugin):
         >>>
 
     This will indirectly use the object mapper on the agent side.
+
+    Opened objects are kept on a :class:`gosa.agent.jsonrpc_objects.ObjectStack`,
+    see the module documentation for its configuration.
     """
     _target_ = 'core'
 
     #TODO: move store to object registry using memcache, DB or whatever
     #      to allow shared objects accross agent instances, maybe it's
     #      better to move all the stuff to the ObjectRegistry.
-    __store = {}
     __proxy = {}
 
+    def __init__(self):
+        self.env = Environment.getInstance()
+        self.log = logging.getLogger(__name__)
+
+        get = self.env.config.get
+        self.__stack = ObjectStack(int(get('jsonrpc.object-ttl', default=600)),
+            int(get('jsonrpc.object-size', default=10000)),
+            int(get('jsonrpc.object-user-size', default=100)))
+
+        # Let the scheduler remove expired objects
+        sched = PluginRegistry.getInstance('SchedulerService').sched
+        sched.add_interval_job(self.sweep, seconds=int(get('jsonrpc.object-sweep',
+            default=60)), tag='_internal')
+
+    def sweep(self):
+        """ Remove expired objects from the stack. """
+        count = self.__stack.sweep()
+        if count:
+            self.log.debug("removed %d expired objects" % count)
+
+    @Command(__help__=N_("Return statistics of the object stack."))
+    def getObjectStackStatistics(self):
+        """
+        Return statistics of the object stack.
+
+        ============== =============
+        Key            Description
+        ============== =============
+        size           Number of objects on the stack
+        users          Number of users owning objects
+        max_user_size  Number of objects of the user with the most objects
+        oldest         Age of the oldest object in seconds
+        ages           Number of objects per age class in seconds
+        evicted        Objects dropped due to the size limits
+        expired        Objects dropped due to the idle time
+        ============== =============
+
+        ``Return:`` dict with statistics
+        """
+        return self.__stack.get_statistics()
+
     @Command(__help__=N_("List available object OIDs"))
     def listObjectOIDs(self):
         """
@@ -57,11 +279,9 @@ class JSONRPCObjectMapper(Plugin):
         ref               UUID / object reference
         ================= ==========================
         """
-        if not ref in JSONRPCObjectMapper.__store:
+        if not self.__stack.remove(ref):
             raise ValueError("reference %s not found" % ref)
 
-        del JSONRPCObjectMapper.__store[ref]
-
     @Command(__help__=N_("Set property for object on stack"))
     def setObjectProperty(self, ref, name, value):
         """
@@ -75,16 +295,15 @@ class JSONRPCObjectMapper(Plugin):
         value             Property value
         ================= ==========================
         """
-        if not ref in JSONRPCObjectMapper.__store:
-            raise ValueError("reference %s not found" % ref)
-        if not name in JSONRPCObjectMapper.__store[ref]['properties']:
+        entry = self.__get_entry(ref)
+        if not name in entry['properties']:
             raise ValueError("property %s not found" % name)
 
-        if not self.__can_be_handled_locally(ref):
-            proxy = self.__get_proxy(ref)
+        if not self.__can_oid_be_handled_locally(entry['oid']):
+            proxy = self.__get_proxy_by_oid(entry['oid'])
             return proxy.setObjectProperty(ref, name, value)
 
-        return setattr(JSONRPCObjectMapper.__store[ref]['object'], name, value)
+        return setattr(entry['object'], name, value)
 
     @Command(__help__=N_("Get property from object on stack"))
     def getObjectProperty(self, ref, name):
@@ -100,16 +319,82 @@ class JSONRPCObjectMapper(Plugin):
 
         ``Return``: mixed
         """
-        if not ref in JSONRPCObjectMapper.__store:
-            raise ValueError("reference %s not found" % ref)
-        if not name in JSONRPCObjectMapper.__store[ref]['properties']:
+        entry = self.__get_entry(ref)
+        if not name in entry['properties']:
             raise ValueError("property %s not found" % name)
 
-        if not self.__can_be_handled_locally(ref):
-            proxy = self.__get_proxy(ref)
+        if not self.__can_oid_be_handled_locally(entry['oid']):
+            proxy = self.__get_proxy_by_oid(entry['oid'])
             return proxy.getObjectProperty(ref, name)
 
-        return getattr(JSONRPCObjectMapper.__store[ref]['object'], name)
+        return getattr(entry['object'], name)
+
+    @Command(__help__=N_("Get several properties from object on stack"))
+    def getObjectProperties(self, ref, names=None):
+        """
+        Get several properties of an existing stack object in one call.
+
+        ================= ==========================
+        Parameter         Description
+        ================= ==========================
+        ref               UUID / object reference
+        names             List of property names, defaults to all properties
+        ================= ==========================
+
+        ``Return``: dict of property values
+        """
+        entry = self.__get_entry(ref)
+        if names is None:
+            names = entry['properties']
+
+        for name in names:
+            if not name in entry['properties']:
+                raise ValueError("property %s not found" % name)
+
+        if not self.__can_oid_be_handled_locally(entry['oid']):
+            proxy = self.__get_proxy_by_oid(entry['oid'])
+            return proxy.getObjectProperties(ref, names)
+
+        obj = entry['object']
+        return dict([(name, getattr(obj, name)) for name in names])
+
+    @Command(__help__=N_("Set several properties for object on stack"))
+    def setObjectProperties(self, ref, values):
+        """
+        Set several properties on an existing stack object in one call.
+        The properties are set in the order of their names, a failing
+        property does not stop the others from being set.
+
+        ================= ==========================
+        Parameter         Description
+        ================= ==========================
+        ref               UUID / object reference
+        values            Dict of property names and values
+        ================= ==========================
+
+        ``Return``: dict with an error message for every property that
+        could not be set, empty on success
+        """
+        entry = self.__get_entry(ref)
+
+        if not self.__can_oid_be_handled_locally(entry['oid']):
+            proxy = self.__get_proxy_by_oid(entry['oid'])
+            return proxy.setObjectProperties(ref, values)
+
+        obj = entry['object']
+        errors = {}
+        for name in sorted(values.keys()):
+            if not name in entry['properties']:
+                errors[name] = "property %s not found" % name
+                continue
+
+            try:
+                setattr(obj, name, values[name])
+            except Exception as e:
+                self.log.debug("setting property %s of %s failed: %s" % (name, ref, str(e)))
+                errors[name] = str(e)
+
+        return errors
 
     @Command(__help__=N_("Call method from object on stack"))
     def dispatchObjectMethod(self, ref, method, *args):
@@ -126,19 +411,18 @@ class JSONRPCObjectMapper(Plugin):
 
         ``Return``: mixed
         """
-        if not ref in JSONRPCObjectMapper.__store:
-            raise ValueError("reference %s not found" % ref)
-        if not method in JSONRPCObjectMapper.__store[ref]['methods']:
+        entry = self.__get_entry(ref)
+        if not method in entry['methods']:
             raise ValueError("method %s not found" % method)
 
-        if not self.__can_be_handled_locally(ref):
-            proxy = self.__get_proxy(ref)
+        if not self.__can_oid_be_handled_locally(entry['oid']):
+            proxy = self.__get_proxy_by_oid(entry['oid'])
             return proxy.dispatchObjectMethod(ref, method, *args)
 
-        return getattr(JSONRPCObjectMapper.__store[ref]['object'], method)(*args)
+        return getattr(entry['object'], method)(*args)
 
-    @Command(__help__=N_("Instantiate object and place it on stack"))
-    def openObject(self, oid, *args, **kwargs):
+    @Command(needsUser=True, __help__=N_("Instantiate object and place it on stack"))
+    def openObject(self, user, oid, *args, **kwargs):
         """
         Open object on the agent side. This creates an instance on the
         stack and returns an a JSON description of the object and it's
@@ -157,8 +441,6 @@ class JSONRPCObjectMapper(Plugin):
             proxy = self.__get_proxy_by_oid(oid)
             return proxy.openObject(oid, *args)
 
-        env = Environment.getInstance()
-
         # Use oid to find the object type
         obj_type = self.__get_object_type(oid)
         methods, properties = self.__inspect(obj_type)
@@ -168,12 +450,12 @@ class JSONRPCObjectMapper(Plugin):
 
         # Make object instance and store it
         obj = obj_type(*args, **kwargs)
-        JSONRPCObjectMapper.__store[ref] = {
-                'node': env.id,
+        self.__stack.add(ref, user, {
+                'node': self.env.id,
                 'oid': oid,
                 'object': obj,
                 'methods': methods,
-                'properties': properties}
+                'properties': properties})
 
         # Build property dict
         propvals = {}
@@ -186,6 +468,13 @@ class JSONRPCObjectMapper(Plugin):
 
         return result
 
+    def __get_entry(self, ref):
+        entry = self.__stack.get(ref)
+        if not entry:
+            raise ValueError("reference %s not found" % ref)
+
+        return entry
+
     def __get_object_type(self, oid):
         if not oid in ObjectRegistry.objects:
             raise ValueError("Unknown object OID %s" % oid)
@@ -207,19 +496,11 @@ class JSONRPCObjectMapper(Plugin):
 
         return methods, properties
 
-    def __can_be_handled_locally(self, ref):
-        return self.__can_oid_be_handled_locally(
-                JSONRPCObjectMapper.__store[ref]['oid'])
-
     def __can_oid_be_handled_locally(self, oid):
         if not oid in ObjectRegistry.objects:
             raise ValueError("Unknown object OID %s" % oid)
         return oid in ObjectRegistry.objects
 
-    def __get_proxy(self, ref):
-        return self.__get_proxy_by_oid(
-                JSONRPCObjectMapper.__store[ref]['oid'])
-
     def __get_proxy_by_oid(self, oid):
         # Choose a possible node
         cr = PluginRegistry.getInstance('CommandRegistry')
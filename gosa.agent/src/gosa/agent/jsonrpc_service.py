@@ -12,6 +12,7 @@ import sys
 import uuid
 import traceback
 import logging
+from threading import Semaphore
 from zope.interface import implements
 from gosa.common.json import loads, dumps
 from webob import exc, Request, Response
@@ -20,6 +21,8 @@ from gosa.common.utils import repr2json, f_print
 from gosa.common.handler import IInterfaceHandler
 from gosa.common import Environment
 from gosa.common.components import PluginRegistry, ZeroconfService, JSONRPCException
+from gosa.common.components.scheduler.threadpool import ThreadPool
+from gosa.agent.session import get_session_store
 
 
 class JSONRPCService(object):
@@ -36,6 +39,8 @@ class JSONRPCService(object):
     =============== ============
     path            Path to register the service in HTTP
     cookie-lifetime Seconds of authentication cookie lifetime
+    batch-worker    Number of threads processing batches and notifications
+    session-*       Session store settings, see :mod:`gosa.agent.session`
     =============== ============
 
     Example::
@@ -43,6 +48,7 @@ class JSONRPCService(object):
         [jsonrpc]
         path = /rpc
         cookie-lifetime = 3600
+        batch-worker = 10
     """
     implements(IInterfaceHandler)
     _priority_ = 11
@@ -58,6 +64,7 @@ class JSONRPCService(object):
 
         self.__zeroconf = None
         self.__http = None
+        self.__sessions = None
 
     def serve(self):
         """ Start JSONRPC service for this GOsa service provider. """
@@ -67,7 +74,8 @@ class JSONRPCService(object):
         cr = PluginRegistry.getInstance('CommandRegistry')
 
         # Register ourselves
-        app = JsonRpcApp(cr)
+        self.__sessions = get_session_store()
+        app = JsonRpcApp(cr, self.__sessions)
         self.__http.app.register(self.path, AuthCookieHandler(app,
             timeout=self.env.config.get('jsonrpc.cookie-lifetime',
             default=1800), cookie_name='GOsaRPC',
@@ -81,6 +89,11 @@ class JSONRPCService(object):
             text="path=%s\001service=gosa" % self.path)
         self.__zeroconf.publish()
 
+        # Let the scheduler remove expired sessions
+        sched = PluginRegistry.getInstance('SchedulerService').sched
+        sched.add_interval_job(self.sweep, seconds=int(self.env.config.get(
+            'jsonrpc.session-sweep', default=60)), tag='_internal')
+
         self.log.info("ready to process incoming requests")
 
     def stop(self):
@@ -88,20 +101,45 @@ class JSONRPCService(object):
         self.log.debug("shutting down JSON RPC service provider")
         self.__http.app.unregister(self.path)
 
+        sched = PluginRegistry.getInstance('SchedulerService').sched
+        try:
+            sched.unschedule_func(self.sweep)
+        except KeyError:
+            pass
+
+    def sweep(self):
+        """ Remove expired sessions from the session store. """
+        count = self.__sessions.sweep()
+        if count:
+            self.log.debug("removed %d expired sessions" % count)
+
 
 class JsonRpcApp(object):
     """
     This is the WSGI application wich is responsible for serving the
     :class:`gosa.agent.command.CommandRegistry` via HTTP/JSONRPC.
-    """
 
-    # Simple authentication saver
-    __session = {}
+    Next to single calls, it accepts JSON-RPC 2.0 style batches - a list
+    of calls which get executed concurrently and are answered by a list
+    of results in the same order. Calls without an ``id`` are treated as
+    notifications: they are executed in the background and the client
+    gets no result for them::
+
+        [{"method": "getObjectProperty", "params": [ref, "cn"], "id": 1},
+         {"method": "getObjectProperty", "params": [ref, "sn"], "id": 2},
+         {"method": "closeObject", "params": [ref]}]
 
-    def __init__(self, dispatcher):
+    Sessions are kept in a :class:`gosa.agent.session.SessionStore`. If
+    none is passed, the store is created from the configuration.
+    """
+
+    def __init__(self, dispatcher, sessions=None):
         self.dispatcher = dispatcher
+        self.__session = sessions if sessions is not None else get_session_store()
         self.env = Environment.getInstance()
         self.log = logging.getLogger(__name__)
+        self.__pool = ThreadPool(max_threads=int(self.env.config.get(
+            'jsonrpc.batch-worker', default=10)))
 
     def __call__(self, environ, start_response):
         req = Request(environ)
@@ -136,19 +174,11 @@ class JsonRpcApp(object):
         except ValueError, e:
             raise ValueError('Bad JSON: %s' % e)
 
-        try:
-            method = json['method']
-            params = json['params']
-            jid = json['id']
-        except KeyError, e:
-            raise ValueError(
-                "JSON body missing parameter: %s" % e)
-        if method.startswith('_'):
-            raise exc.HTTPForbidden(
-                "Bad method name %s: must not start with _" % method).exception
-        if not isinstance(params, list) and not isinstance(params, dict):
-            raise ValueError(
-                "bad params %r: must be a list or dict" % params)
+        # Batch requests are handled separately
+        if isinstance(json, list):
+            return self.process_batch(json, environ)
+
+        method, params, jid = self.__parse(json)
 
         # Create an authentication cookie on login
         if method == 'login':
@@ -157,15 +187,15 @@ class JsonRpcApp(object):
             # Check password and create session id on success
             if self.authenticate(user, password):
                 sid = str(uuid.uuid1())
-                self.__session[sid] = user
+                self.__session.create(sid, user)
                 environ['REMOTE_USER'] = user
                 environ['REMOTE_SESSION'] = sid
                 result = True
                 self.log.info("login succeeded for user '%s'" % user)
             else:
                 # Remove current sid if present
-                if 'REMOTE_SESSION' in environ and sid in self.__session:
-                    del self.__session[sid]
+                if 'REMOTE_SESSION' in environ:
+                    self.__session.remove(environ['REMOTE_SESSION'])
 
                 result = False
                 self.log.error("login failed for user '%s'" % user)
@@ -181,18 +211,14 @@ class JsonRpcApp(object):
                                 id=jid)))
 
         # Don't let calls pass beyond this point if we've no valid session ID
-        if not environ.get('REMOTE_SESSION') in self.__session:
-            self.log.error("blocked unauthenticated call of method '%s'" % method)
-            raise exc.HTTPUnauthorized(
-                    "Please use the login method to authorize yourself.",
-                    allow='POST').exception
+        self.__check_session(environ, method)
 
         # Remove remote session on logout
         if method == 'logout':
 
             # Remove current sid if present
-            if 'REMOTE_SESSION' in environ and environ.get('REMOTE_SESSION') in self.__session:
-                del self.__session[environ.get('REMOTE_SESSION')]
+            if 'REMOTE_SESSION' in environ:
+                self.__session.remove(environ.get('REMOTE_SESSION'))
 
             # Show logout message
             if 'REMOTE_USER' in environ:
@@ -205,26 +231,130 @@ class JsonRpcApp(object):
                                 error=None,
                                 id=jid)))
 
+        user = environ.get('REMOTE_USER')
+
+        # Notifications are processed in the background
+        if not 'id' in json:
+            self.__pool.submit(self.__dispatch, user, method, params, jid)
+            return Response(status=204)
+
+        status, body = self.__dispatch(user, method, params, jid)
+        return Response(
+            status=status,
+            content_type='application/json',
+            charset='utf8',
+            body=dumps(body))
+
+    def process_batch(self, batch, environ):
+        """
+        Process a list of JSONRPC requests. The calls are dispatched
+        concurrently, the results are returned in the order of the
+        requests. Notifications - calls without ``id`` - are not part
+        of the result.
+
+        ================= ==========================
+        Parameter         Description
+        ================= ==========================
+        batch             List of decoded JSONRPC calls
+        environ           WSGI environment
+        ================= ==========================
+
+        ``Return``: Response
+        """
+        if not batch:
+            raise ValueError("empty batch request")
+
+        self.__check_session(environ, "batch")
+        user = environ.get('REMOTE_USER')
+
+        results = []
+        pending = []
+        for call in batch:
+            try:
+                if not isinstance(call, dict):
+                    raise ValueError("bad batch entry %r: must be an object" % call)
+
+                method, params, jid = self.__parse(call)
+                if method in ['login', 'logout']:
+                    raise ValueError("method '%s' is not allowed in batch requests" % method)
+
+            except (ValueError, exc.HTTPException), e:
+                results.append(self.__error(str(e), call.get('id') if isinstance(call, dict) else None))
+                continue
+
+            if 'id' in call:
+                results.append(None)
+                pending.append((len(results) - 1, method, params, jid))
+            else:
+                self.__pool.submit(self.__dispatch, user, method, params, None)
+
+        # Run the calls on the worker pool and wait for all of them
+        done = Semaphore(0)
+
+        def run(idx, method, params, jid):
+            try:
+                results[idx] = self.__dispatch(user, method, params, jid)[1]
+            finally:
+                done.release()
+
+        for entry in pending:
+            self.__pool.submit(run, *entry)
+        for entry in pending:
+            done.acquire()
+
+        if not results:
+            return Response(status=204)
+
+        return Response(
+            content_type='application/json',
+            charset='utf8',
+            body=dumps(results))
+
+    def __parse(self, json):
+        try:
+            method = json['method']
+            params = json['params']
+        except KeyError, e:
+            raise ValueError(
+                "JSON body missing parameter: %s" % e)
+        if method.startswith('_'):
+            raise exc.HTTPForbidden(
+                "Bad method name %s: must not start with _" % method).exception
+        if not isinstance(params, list) and not isinstance(params, dict):
+            raise ValueError(
+                "bad params %r: must be a list or dict" % params)
+
+        return method, params, json.get('id')
+
+    def __check_session(self, environ, method):
+        if self.__session.get(environ.get('REMOTE_SESSION')) is None:
+            self.log.error("blocked unauthenticated call of method '%s'" % method)
+            raise exc.HTTPUnauthorized(
+                    "Please use the login method to authorize yourself.",
+                    allow='POST').exception
+
+    def __error(self, text, jid):
+        error_value = dict(
+            name='JSONRPCError',
+            code=100,
+            message=text,
+            error=text)
+        return dict(result=None, error=error_value, id=jid)
+
+    def __dispatch(self, user, method, params, jid):
+        """
+        Dispatch a single call thru the *CommandRegistry*.
+
+        ``Return``: tuple of HTTP status and response body
+        """
         # Try to call method with local dispatcher
         if not self.dispatcher.hasMethod(method):
             text = "No such method '%s'" % method
-            error_value = dict(
-                name='JSONRPCError',
-                code=100,
-                message=text,
-                error=text)
             self.log.warning(text)
+            return 500, self.__error(text, jid)
 
-            return Response(
-                status=500,
-                content_type='application/json',
-                charset='utf8',
-                body=dumps(dict(result=None,
-                                error=error_value,
-                                id=jid)))
         try:
             self.log.debug("calling method %s(%s)" % (method, params))
-            user = environ.get('REMOTE_USER')
 
             # Automatically prepend queue option for current
             if self.dispatcher.capabilities[method]['needsQueue']:
@@ -241,7 +371,7 @@ class JsonRpcApp(object):
             # Don't process messages if the command registry thinks it's not ready
             if not self.dispatcher.processing.is_set():
                 self.log.warning("waiting for registry to get ready")
-                if not self.__cr.processing.wait(5):
+                if not self.dispatcher.processing.wait(5):
                     self.log.error("aborting call [%s] for %s: %s(%s) - timed out" % (jid, user, method, params))
                     raise RuntimeError("registry not ready")
 
@@ -258,13 +388,8 @@ class JsonRpcApp(object):
                 message=str(exc_value),
                 error=e.error)
             self.log.error(e.error)
-            return Response(
-                status=500,
-                content_type='application/json',
-                charset='utf8',
-                body=dumps(dict(result=None,
-                                error=error_value,
-                                id=jid)))
+            return 500, dict(result=None, error=error_value, id=jid)
+
         except Exception as e:
             text = traceback.format_exc()
             exc_value = sys.exc_info()[1]
@@ -287,25 +412,16 @@ class JsonRpcApp(object):
             self.log.error("returning call [%s]: %s / %s" % (jid, None, f_print(err)))
             self.log.error(text)
 
-            return Response(
-                content_type='application/json',
-                charset='utf8',
-                body=dumps(dict(result=None,
-                                error=error_value,
-                                id=jid)))
+            return 200, dict(result=None, error=error_value, id=jid)
 
         self.log.debug("returning call [%s]: %s / %s" % (jid, result, None))
 
-        return Response(
-            content_type='application/json',
-            charset='utf8',
-            body=dumps(dict(result=result,
-                            error=None,
-                            id=jid)))
+        return 200, dict(result=result, error=None, id=jid)
 
     def authenticate(self, user=None, password=None):
         """
-        Use the AMQP connection to authenticate the incoming HTTP request.
+        Use the :class:`gosa.agent.auth.Authenticator` to authenticate the
+        incoming HTTP request.
 
         ================= ==========================
         Parameter         Description
@@ -316,5 +432,5 @@ class JsonRpcApp(object):
 
         ``Return``: True on success
         """
-        amqp = PluginRegistry.getInstance('AMQPHandler')
-        return amqp.checkAuth(user, password)
+        auth = PluginRegistry.getInstance('Authenticator')
+        return auth.authenticate(user, password)
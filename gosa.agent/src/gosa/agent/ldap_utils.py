@@ -5,12 +5,34 @@ make LDAP connections a little bit easier to use.
 
 ------
 """
+import time
 import ldapurl
 import ldap.sasl
 import types
 import logging
+from threading import Thread, Condition, Lock
 from contextlib import contextmanager
 from gosa.common import Environment
+from gosa.common.components import Command, Plugin
+from gosa.common.utils import N_
+
+
+class LDAPPoolTimeout(Exception):
+    """
+    Exception which is raised when no pool connection got available in time.
+    """
+    pass
+
+
+class PoolEntry(object):
+    """
+    Bookkeeping information for a single pooled LDAP connection.
+    """
+    __slots__ = ('conn', 'created', 'last_used')
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created = self.last_used = time.time()
 
 
 class LDAPHandler(object):
@@ -36,6 +58,11 @@ class LDAPHandler(object):
     a LDAP connection. **Please note that you've to release a LDAP connection
     after you've used it.**
 
+    If all connections of the pool are in use, *get_connection* waits for
+    a connection to be released. An :class:`LDAPPoolTimeout` is raised if
+    that does not happen within ``pool_timeout`` seconds. Idle connections
+    are probed and recycled in the background.
+
     The *LDAPHandler* creates connections based on what's configured in the
     ``[ldap]`` section of the GOsa configuration files. Here's a list of valid
     keywords:
@@ -47,6 +74,10 @@ class LDAPHandler(object):
     bind_dn        DN to connect with
     bind_secret    Password to connect with
     pool_size      Number of parallel connections in the pool
+    pool_timeout   Seconds to wait for a free connection before giving up
+    pool_max_idle  Seconds an unused connection is kept open, 0 for unlimited
+    pool_max_age   Seconds after which a connection is recycled, 0 for unlimited
+    pool_probe     Interval in seconds to check idle connections, 0 to disable
     retry_max      How often a connection should be tried after the service is considered dead
     retry_delay    Time delta on which to try a reconnection
     ============== =============
@@ -65,9 +96,11 @@ class LDAPHandler(object):
         an object abstraction layer which does related things automatically.
         See `Object abstraction <objects>`_.
     """
-    connection_handle = []
-    connection_usage  = []
     instance = None
+    instance_lock = Lock()
+
+    # Upper bounds (in seconds) of the wait time histogram
+    wait_buckets = (0.001, 0.01, 0.1, 1, 10)
 
     def __init__(self):
         self.env = Environment.getInstance()
@@ -80,14 +113,35 @@ class LDAPHandler(object):
         self.__bind_dn = get('ldap.bind_dn', default=None)
         self.__bind_secret = get('ldap.bind_secret', default=None)
         self.__pool = int(get('ldap.pool_size', default=10))
+        self.__timeout = float(get('ldap.pool_timeout', default=10))
+        self.__max_idle = int(get('ldap.pool_max_idle', default=300))
+        self.__max_age = int(get('ldap.pool_max_age', default=3600))
+        self.__probe_interval = int(get('ldap.pool_probe', default=60))
 
         # Sanity check
         if self.__bind_user and not ldap.SASL_AVAIL:
             raise Exception("bind_user needs SASL support, which doesn't seem to be available in python-ldap")
 
-        # Initialize static pool
-        LDAPHandler.connection_handle = [None] * self.__pool
-        LDAPHandler.connection_usage = [False] * self.__pool
+        # Initialize pool
+        self.__cond = Condition()
+        self.__idle = []
+        self.__used = {}
+        self.__size = 0
+        self.__waiters = 0
+        self.__stats = {
+            'checkouts': 0,
+            'timeouts': 0,
+            'created': 0,
+            'discarded': 0,
+            'wait_total': 0.0,
+            'wait_max': 0.0,
+            'wait_histogram': [0] * (len(self.wait_buckets) + 1)}
+
+        # Start liveness probing of idle connections
+        if self.__probe_interval > 0:
+            probe = Thread(target=self.__probe_loop, name="LDAPPoolProbe")
+            probe.setDaemon(True)
+            probe.start()
 
     def get_base(self):
         """
@@ -97,63 +151,71 @@ class LDAPHandler(object):
         """
         return self.__url.dn
 
-    def get_connection(self):
+    def get_connection(self, timeout=None):
         """
-        Get a new connection from the pool.
+        Get a connection from the pool. If all connections are in use,
+        wait until one gets released.
+
+        ================= ==========================
+        Parameter         Description
+        ================= ==========================
+        timeout           Seconds to wait for a free connection, defaults to ``pool_timeout``
+        ================= ==========================
 
         ``Return``: LDAP connection
         """
-        # Are there free connections in the pool?
+        start = time.time()
+        deadline = start + (self.__timeout if timeout is None else timeout)
+        expired = []
+
         try:
-            next_free = LDAPHandler.connection_usage.index(False)
-        except ValueError:
-            raise Exception("no free LDAP connection available")
-
-        # Need to initialize?
-        if not LDAPHandler.connection_handle[next_free]:
-            get = self.env.config.get
-            self.log.debug("initializing LDAP connection to %s" %
-                    str(self.__url))
-            conn = ldap.ldapobject.ReconnectLDAPObject("%s://%s" % (self.__url.urlscheme,
-                self.__url.hostport),
-                retry_max=int(get("ldap.retry_max", default=3)),
-                retry_delay=int(get("ldap.retry_delay", default=5)))
-
-            # We only want v3
-            conn.protocol_version = ldap.VERSION3
-
-            # If no SSL scheme used, try TLS
-            if ldap.TLS_AVAIL and self.__url.urlscheme != "ldaps":
-                try:
-                    conn.start_tls_s()
-                except ldap.PROTOCOL_ERROR as detail:
-                    self.log.debug("cannot use TLS, falling back to unencrypted session")
+            with self.__cond:
+                while True:
+
+                    # Reuse an idle connection if there's one left
+                    while self.__idle:
+                        entry = self.__idle.pop()
+                        if self.__expired(entry):
+                            self.__discard(entry)
+                            expired.append(entry)
+                            continue
+
+                        self.__checkout(entry, start)
+                        return entry.conn
+
+                    # Reserve a slot for a new connection
+                    if self.__size < self.__pool:
+                        self.__size += 1
+                        break
+
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        self.__stats['timeouts'] += 1
+                        raise LDAPPoolTimeout("no free LDAP connection available within %ss" %
+                            (self.__timeout if timeout is None else timeout))
+
+                    self.__waiters += 1
+                    try:
+                        self.__cond.wait(remaining)
+                    finally:
+                        self.__waiters -= 1
+        finally:
+            self.__close(expired)
 
-            try:
-                # Simple bind?
-                if self.__bind_dn:
-                    self.log.debug("starting simple bind using '%s'" %
-                        self.__bind_dn)
-                    conn.simple_bind_s(self.__bind_dn, self.__bind_secret)
-                elif self.__bind_user:
-                    self.log.debug("starting SASL bind using '%s'" %
-                        self.__bind_user)
-                    auth_tokens = ldap.sasl.digest_md5(self.__bind_user, self.__bind_secret)
-                    conn.sasl_interactive_bind_s("", auth_tokens)
-                else:
-                    self.log.debug("starting anonymous bind")
-                    conn.simple_bind_s()
-
-            except ldap.INVALID_CREDENTIALS as detail:
-                self.log.error("LDAP authentication failed: %s" %
-                        str(detail))
-
-            LDAPHandler.connection_handle[next_free] = conn
-
-        # Lock entry
-        LDAPHandler.connection_usage[next_free] = True
-
-        return LDAPHandler.connection_handle[next_free]
+        # Connecting may take a while - don't block the pool meanwhile
+        try:
+            conn = self.__connect()
+        except:
+            with self.__cond:
+                self.__size -= 1
+                self.__cond.notify()
+            raise
+
+        with self.__cond:
+            self.__stats['created'] += 1
+            self.__checkout(PoolEntry(conn), start)
+
+        return conn
 
     def free_connection(self, conn):
         """
@@ -165,8 +227,23 @@ class LDAPHandler(object):
         conn              Allocated LDAP connection
         ================= ==========================
         """
-        index = LDAPHandler.connection_handle.index(conn)
-        LDAPHandler.connection_usage[index] = False
+        with self.__cond:
+            entry = self.__used.pop(id(conn), None)
+            if not entry:
+                self.log.warning("trying to free an unknown LDAP connection")
+                return
+
+            entry.last_used = time.time()
+            expired = self.__expired(entry)
+            if expired:
+                self.__discard(entry)
+            else:
+                self.__idle.append(entry)
+
+            self.__cond.notify()
+
+        if expired:
+            self.__close([entry])
 
     @contextmanager
     def get_handle(self):
@@ -182,6 +259,162 @@ class LDAPHandler(object):
         finally:
             self.free_connection(conn)
 
+    def get_statistics(self):
+        """
+        Return usage information about the connection pool.
+
+        ``Return``: dict with pool metrics
+        """
+        with self.__cond:
+            stats = dict(self.__stats)
+            stats['wait_histogram'] = dict(zip(
+                ["<%ss" % b for b in self.wait_buckets] + [">=%ss" % self.wait_buckets[-1]],
+                self.__stats['wait_histogram']))
+            stats['size'] = self.__pool
+            stats['open'] = self.__size
+            stats['idle'] = len(self.__idle)
+            stats['in_use'] = len(self.__used)
+            stats['waiters'] = self.__waiters
+
+        return stats
+
+    def __checkout(self, entry, start):
+        # Mark the entry as used and record the time spent waiting for it
+        self.__used[id(entry.conn)] = entry
+
+        waited = time.time() - start
+        self.__stats['checkouts'] += 1
+        self.__stats['wait_total'] += waited
+        self.__stats['wait_max'] = max(self.__stats['wait_max'], waited)
+
+        for idx, bucket in enumerate(self.wait_buckets):
+            if waited < bucket:
+                break
+        else:
+            idx = len(self.wait_buckets)
+        self.__stats['wait_histogram'][idx] += 1
+
+    def __expired(self, entry):
+        now = time.time()
+        if self.__max_age and now - entry.created > self.__max_age:
+            return True
+        if self.__max_idle and now - entry.last_used > self.__max_idle:
+            return True
+        return False
+
+    def __discard(self, entry):
+        # Free the slot of a connection which is not used anymore - must
+        # be called with the condition held. The connection has to be
+        # closed after releasing it.
+        self.__size -= 1
+        self.__stats['discarded'] += 1
+
+    def __close(self, entries):
+        # Unbinding may hang on a slow server, don't hold the pool meanwhile
+        for entry in entries:
+            try:
+                entry.conn.unbind_s()
+            except ldap.LDAPError:
+                pass
+
+    def __probe_loop(self):
+        while True:
+            time.sleep(self.__probe_interval)
+            try:
+                self.__probe()
+            except Exception as e:
+                self.log.error("probing LDAP connections failed: %s" % str(e))
+
+    def __probe(self):
+        with self.__cond:
+            expired = [e for e in self.__idle if self.__expired(e)]
+            for entry in expired:
+                self.__idle.remove(entry)
+                self.__discard(entry)
+
+            # Recently used connections are known to work
+            now = time.time()
+            entries = [e for e in self.__idle if now - e.last_used >= self.__probe_interval]
+
+        self.__close(expired)
+
+        # Check one connection at a time, so that the others stay
+        # available while a probe hangs on a slow server
+        for entry in entries:
+            with self.__cond:
+                if not entry in self.__idle:
+                    continue
+                self.__idle.remove(entry)
+
+            try:
+                entry.conn.whoami_s()
+            except ldap.LDAPError as e:
+                self.log.debug("dropping dead LDAP connection: %s" % str(e))
+                with self.__cond:
+                    self.__discard(entry)
+                    self.__cond.notify()
+
+                self.__close([entry])
+                continue
+
+            # Put it back as least recently used entry
+            with self.__cond:
+                self.__idle.insert(0, entry)
+                self.__cond.notify()
+
+    def __connect(self):
+        get = self.env.config.get
+        self.log.debug("initializing LDAP connection to %s" %
+                str(self.__url))
+        conn = ldap.ldapobject.ReconnectLDAPObject("%s://%s" % (self.__url.urlscheme,
+            self.__url.hostport),
+            retry_max=int(get("ldap.retry_max", default=3)),
+            retry_delay=int(get("ldap.retry_delay", default=5)))
+
+        # We only want v3
+        conn.protocol_version = ldap.VERSION3
+
+        # If no SSL scheme used, try TLS
+        if ldap.TLS_AVAIL and self.__url.urlscheme != "ldaps":
+            try:
+                conn.start_tls_s()
+            except ldap.PROTOCOL_ERROR:
+                self.log.debug("cannot use TLS, falling back to unencrypted session")
+
+        self.bind(conn)
+        return conn
+
+    def bind(self, conn):
+        """
+        (Re-)bind a connection using the configured credentials. This is
+        needed to restore a pooled connection which has been used to
+        bind as another user.
+
+        ================= ==========================
+        Parameter         Description
+        ================= ==========================
+        conn              LDAP connection
+        ================= ==========================
+        """
+        try:
+            # Simple bind?
+            if self.__bind_dn:
+                self.log.debug("starting simple bind using '%s'" %
+                    self.__bind_dn)
+                conn.simple_bind_s(self.__bind_dn, self.__bind_secret)
+            elif self.__bind_user:
+                self.log.debug("starting SASL bind using '%s'" %
+                    self.__bind_user)
+                auth_tokens = ldap.sasl.digest_md5(self.__bind_user, self.__bind_secret)
+                conn.sasl_interactive_bind_s("", auth_tokens)
+            else:
+                self.log.debug("starting anonymous bind")
+                conn.simple_bind_s()
+
+        except ldap.INVALID_CREDENTIALS as detail:
+            self.log.error("LDAP authentication failed: %s" %
+                    str(detail))
+
     @staticmethod
     def get_instance():
         """
@@ -190,10 +423,65 @@ class LDAPHandler(object):
         ``Return``: LDAPHandler instance
         """
         if not LDAPHandler.instance:
-            LDAPHandler.instance = LDAPHandler()
+            with LDAPHandler.instance_lock:
+                if not LDAPHandler.instance:
+                    LDAPHandler.instance = LDAPHandler()
         return LDAPHandler.instance
 
 
+class LDAPUtils(Plugin):
+    """
+    Exports information about the LDAP connection pool.
+    """
+    _target_ = 'core'
+
+    @Command(__help__=N_("Return usage statistics of the LDAP connection pool."))
+    def getLDAPPoolStatistics(self):
+        """
+        Return usage statistics of the local LDAP connection pool.
+
+        ============== =============
+        Key            Description
+        ============== =============
+        size           Configured pool size
+        open           Number of currently open connections
+        idle           Number of open, unused connections
+        in_use         Number of connections currently checked out
+        waiters        Number of threads waiting for a connection
+        checkouts      Total number of checkouts
+        timeouts       Number of checkouts that timed out
+        created        Number of connections that have been opened
+        discarded      Number of connections that have been closed
+        wait_total     Accumulated wait time in seconds
+        wait_max       Maximum wait time in seconds
+        wait_histogram Number of checkouts per wait time bucket
+        ============== =============
+
+        ``Return``: dict with pool metrics
+        """
+        return LDAPHandler.get_instance().get_statistics()
+
+    @Command(__help__=N_("Return statistics of the uuid / DN cache of the LDAP object backend."))
+    def getLDAPCacheStatistics(self):
+        """
+        Return statistics of the uuid / DN cache of the LDAP object
+        backend.
+
+        ============== =============
+        Key            Description
+        ============== =============
+        size           Number of cached entries
+        hits           Lookups answered by the cache
+        misses         Lookups which needed a search
+        ============== =============
+
+        ``Return``: dict with cache metrics
+        """
+        from gosa.agent.objects.backend.registry import ObjectBackendRegistry
+        ObjectBackendRegistry.getInstance()
+        return ObjectBackendRegistry.getBackend('LDAP').get_statistics()
+
+
 def map_ldap_value(value):
     """
     Method to map various data into LDAP compatible values. Maps
@@ -25,6 +25,50 @@ class ObjectBackend(object):
         """
         raise NotImplementedError("object backend is missing load()")
 
+    def load_many(self, uuids, info):
+        """
+        Load given keys from the entries with the given uuids. Backends
+        should override this to fetch the entries with as few requests as
+        possible - the default implementation calls *load* for each entry.
+
+        ``Return:`` dict of (dn, keys) tuples indexed by uuid. The DN is
+        None if the backend doesn't know about it. Missing entries are
+        not included.
+        """
+        res = {}
+        for uuid in uuids:
+            try:
+                res[uuid] = (None, self.load(uuid, info))
+            except EntryNotFound:
+                pass
+
+        return res
+
+    def search(self, fltr, info):
+        """
+        Load given keys from all entries matching the backend specific
+        filter.
+
+        ``Return:`` dict of (dn, keys) tuples indexed by uuid
+        """
+        raise NotImplementedError("object backend is not capable of searching")
+
+    def dn2uuid_many(self, dns):
+        """
+        Convert a list of DNs to uuids.
+
+        ``Return:`` dict of uuids indexed by DN. Missing entries are not
+        included.
+        """
+        res = {}
+        for dn in dns:
+            try:
+                res[dn] = self.dn2uuid(dn)
+            except EntryNotFound:
+                pass
+
+        return res
+
     def move(self, uuid, new_base):
         """
         Move object to new base.
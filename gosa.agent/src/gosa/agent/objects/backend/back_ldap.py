@@ -4,11 +4,17 @@ import ldap.dn
 import ldap.filter
 import ldap.schema
 import ldap.modlist
+import ldap.controls
 import time
 import datetime
+from threading import Lock
 from itertools import permutations
+from collections import OrderedDict
 from logging import getLogger
 from gosa.common import Environment
+from gosa.common.event import EventMaker
+from gosa.common.components import PluginRegistry
+from gosa.common.components.amqp import EventConsumer
 from gosa.agent.ldap_utils import LDAPHandler
 from gosa.agent.objects.backend import ObjectBackend, EntryNotFound, EntryNotUnique
 
@@ -21,6 +27,109 @@ class DNGeneratorError(Exception):
     pass
 
 
+class DNCache(object):
+    """
+    Bounded, thread safe mapping between uuids and DNs in both directions.
+    Entries expire after *ttl* seconds and the least recently used ones
+    are dropped if there are more than *size* of them.
+    """
+
+    def __init__(self, size=10000, ttl=300):
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.__lock = Lock()
+        self.__uuids = OrderedDict()
+        self.__dns = {}
+
+    def add(self, uuid, dn):
+        """
+        Remember that the entry with *uuid* is located at *dn*.
+        """
+        if not self.size:
+            return
+
+        key = self.__key(dn)
+        with self.__lock:
+            self.__drop(uuid)
+            self.__drop(self.__dns.get(key))
+            self.__uuids[uuid] = (dn, time.time() + self.ttl)
+            self.__dns[key] = uuid
+
+            while len(self.__uuids) > self.size:
+                old, (old_dn, expires) = self.__uuids.popitem(last=False)
+                self.__dns.pop(self.__key(old_dn), None)
+
+    def get_dn(self, uuid):
+        """
+        ``Return:`` DN of the entry with *uuid* or None
+        """
+        with self.__lock:
+            entry = self.__lookup(uuid)
+            return entry[0] if entry else None
+
+    def get_uuid(self, dn):
+        """
+        ``Return:`` uuid of the entry at *dn* or None
+        """
+        with self.__lock:
+            uuid = self.__dns.get(self.__key(dn))
+            return uuid if self.__lookup(uuid) else None
+
+    def invalidate(self, uuid=None, dn=None):
+        """
+        Forget the entry with *uuid* and everything at or below *dn*.
+        """
+        with self.__lock:
+            self.__drop(uuid)
+
+            if dn is not None:
+                key = self.__key(dn)
+                suffix = "," + key
+                self.__drop(self.__dns.get(key))
+                for child in [k for k in self.__dns if k.endswith(suffix)]:
+                    self.__drop(self.__dns[child])
+
+    def clear(self):
+        with self.__lock:
+            self.__uuids.clear()
+            self.__dns.clear()
+
+    def get_statistics(self):
+        """
+        ``Return:`` dict with size, hits and misses
+        """
+        with self.__lock:
+            return {'size': len(self.__uuids), 'hits': self.hits, 'misses': self.misses}
+
+    def __lookup(self, uuid):
+        entry = self.__uuids.pop(uuid, None) if uuid else None
+        if entry and entry[1] < time.time():
+            self.__dns.pop(self.__key(entry[0]), None)
+            entry = None
+
+        if not entry:
+            self.misses += 1
+            return None
+
+        # Re-insert to keep the LRU order
+        self.__uuids[uuid] = entry
+        self.hits += 1
+        return entry
+
+    def __drop(self, uuid):
+        entry = self.__uuids.pop(uuid, None) if uuid else None
+        if entry:
+            self.__dns.pop(self.__key(entry[0]), None)
+
+    def __key(self, dn):
+        if isinstance(dn, unicode):
+            dn = dn.encode('utf-8')
+
+        return dn.lower()
+
+
 class LDAP(ObjectBackend):
 
     def __init__(self):
@@ -28,12 +137,33 @@ class LDAP(ObjectBackend):
         self.env = Environment.getInstance()
         self.log = getLogger(__name__)
 
+        # Connections are only checked out of the pool for the
+        # duration of a single operation.
         self.lh = LDAPHandler.get_instance()
-        self.con = self.lh.get_connection()
         self.uuid_entry = self.env.config.get("ldap.uuid_attribute", "entryUUID")
 
-    def __del__(self):
-        self.lh.free_connection(self.con)
+        # Number of uuids combined in one OR filter and the page size for
+        # bulk searches.
+        self.bulk_size = int(self.env.config.get("ldap.bulk_size", default=100))
+        self.page_size = int(self.env.config.get("ldap.page_size", default=500))
+
+        # Cache uuid / DN relations, optionally kept in sync with the other
+        # agents by ObjectChanged events.
+        self.cache = DNCache(int(self.env.config.get("ldap.dn_cache_size", default=10000)),
+            int(self.env.config.get("ldap.dn_cache_ttl", default=300)))
+        self.cache_events = self.env.config.get("ldap.dn_cache_events", default="false").lower() == "true"
+
+        if self.cache_events:
+            amqp = PluginRegistry.getInstance("AMQPHandler")
+            EventConsumer(self.env,
+                amqp.getConnection(),
+                xquery="""
+                    declare namespace f='http://www.gonicus.de/Events';
+                    let $e := ./f:Event
+                    return $e/f:ObjectChanged
+                        and $e/f:ObjectChanged/f:Id != '%s'
+                """ % self.env.id,
+                callback=self.__eventProcessor)
 
     def load(self, uuid, info):
         keys = info.keys()
@@ -42,28 +172,128 @@ class LDAP(ObjectBackend):
 
         self.log.debug("searching with filter '%s' on base '%s'" % (fltr,
             self.lh.get_base()))
-        res = self.con.search_s(self.lh.get_base(), ldap.SCOPE_SUBTREE, fltr,
-            keys)
+        with self.lh.get_handle() as con:
+            res = con.search_s(self.lh.get_base(), ldap.SCOPE_SUBTREE, fltr,
+                keys)
 
         # Check if res is valid
         self.__check_res(uuid, res)
+        self.cache.add(uuid, res[0][0])
+
+        return self.__convert(res[0][1], info)
+
+    def load_many(self, uuids, info):
+        """
+        Load the entries in chunks of OR combined uuid filters, so that
+        loading N entries needs N / bulk_size searches instead of N.
+        """
+        keys = info.keys() + [self.uuid_entry]
+        uuids = list(set(uuids))
+        res = {}
+
+        with self.lh.get_handle() as con:
+            for i in range(0, len(uuids), self.bulk_size):
+                chunk = uuids[i:i + self.bulk_size]
+                fltr = "(|%s)" % "".join(ldap.filter.filter_format("(%s=%%s)" % self.uuid_entry, [uuid])
+                        for uuid in chunk)
+
+                self.log.debug("bulk loading %d entries on base '%s'" % (len(chunk),
+                    self.lh.get_base()))
+                res.update(self.__search(con, self.lh.get_base(), fltr, keys))
+
+        return self.__convert_many(res, info)
+
+    def search(self, fltr, info):
+        keys = info.keys() + [self.uuid_entry]
+
+        self.log.debug("bulk loading entries with filter '%s' on base '%s'" % (fltr,
+            self.lh.get_base()))
+        with self.lh.get_handle() as con:
+            res = self.__search(con, self.lh.get_base(), fltr, keys)
+
+        return self.__convert_many(res, info)
+
+    def dn2uuid_many(self, dns):
+        """
+        Resolve the DNs with base searches which are all sent at once and
+        collected afterwards.
+        """
+        res = {}
+        with self.lh.get_handle() as con:
+            msgids = [(dn, con.search_ext(dn.encode('utf-8'), ldap.SCOPE_BASE,
+                '(objectClass=*)', [self.uuid_entry])) for dn in set(dns)]
+
+            for dn, msgid in msgids:
+                try:
+                    entries = con.result3(msgid)[1]
+                except ldap.NO_SUCH_OBJECT:
+                    continue
+
+                if len(entries) == 1 and self.uuid_entry in entries[0][1]:
+                    res[dn] = entries[0][1][self.uuid_entry][0]
+                    self.cache.add(res[dn], dn)
+
+        return res
+
+    def __search(self, con, base, fltr, keys):
+        """
+        Subtree search using the paged results control.
+
+        ``Return:`` dict of entries indexed by DN
+        """
+        res = {}
+        page = ldap.controls.SimplePagedResultsControl(True, size=self.page_size, cookie='')
+
+        while True:
+            msgid = con.search_ext(base, ldap.SCOPE_SUBTREE, fltr, keys,
+                serverctrls=[page])
+            rtype, rdata, rmsgid, rctrls = con.result3(msgid)
+
+            for dn, entry in rdata:
+                # Skip referrals
+                if dn is not None:
+                    res[dn] = entry
+
+            cookie = None
+            for ctrl in rctrls:
+                if ctrl.controlType == ldap.controls.SimplePagedResultsControl.controlType:
+                    cookie = ctrl.cookie
+
+            if not cookie:
+                break
+
+            page.cookie = cookie
+
+        return res
+
+    def __convert_many(self, res, info):
+        items = {}
+        for dn, entry in res.iteritems():
+            if not self.uuid_entry in entry:
+                continue
+
+            uuid = entry[self.uuid_entry][0]
+            items[uuid] = (dn, self.__convert(entry, info))
+            self.cache.add(uuid, dn)
 
+        return items
+
+    def __convert(self, entry, info):
         # Do value conversation
-        items = dict((k,v) for k, v in res[0][1].iteritems() if k in keys)
-        for key, value in items.items():
-            cnv = getattr(self, "_convert_from_%s" % info[key].lower())
-            lcnv = []
-            for lvalue in items[key]:
-                lcnv.append(cnv(lvalue))
-            items[key] = lcnv
+        items = {}
+        for key, values in entry.iteritems():
+            if key in info:
+                cnv = getattr(self, "_convert_from_%s" % info[key].lower())
+                items[key] = [cnv(value) for value in values]
 
         return items
 
     def identify(self, dn, params):
         ocs = ["(objectClass=%s)" % o.strip() for o in params['objectClasses'].split(",")]
         fltr = "(&" + "".join(ocs) + ")"
-        res = self.con.search_s(dn.encode('utf-8'), ldap.SCOPE_BASE, fltr,
-                [self.uuid_entry])
+        with self.lh.get_handle() as con:
+            res = con.search_s(dn.encode('utf-8'), ldap.SCOPE_BASE, fltr,
+                    [self.uuid_entry])
 
         return len(res) == 1
 
@@ -72,12 +302,14 @@ class LDAP(ObjectBackend):
             fltr_tpl = "%s=%%s" % self.uuid_entry
             fltr = ldap.filter.filter_format(fltr_tpl, [misc])
 
-            res = self.con.search_s(self.lh.get_base(), ldap.SCOPE_SUBTREE,
-                    fltr, [self.uuid_entry])
+            with self.lh.get_handle() as con:
+                res = con.search_s(self.lh.get_base(), ldap.SCOPE_SUBTREE,
+                        fltr, [self.uuid_entry])
 
         else:
-            res = self.con.search_s(misc, ldap.SCOPE_ONELEVEL, '(objectClass=*)',
-                [self.uuid_entry])
+            with self.lh.get_handle() as con:
+                res = con.search_s(misc, ldap.SCOPE_ONELEVEL, '(objectClass=*)',
+                    [self.uuid_entry])
 
         if not res:
             return False
@@ -85,29 +317,34 @@ class LDAP(ObjectBackend):
         return len(res) == 1
 
     def remove(self, uuid, recursive=False):
-        dn = self.uuid2dn(uuid)
+        return self.__with_dn(uuid, lambda dn: self.__remove(uuid, dn, recursive))
 
-        if recursive:
-            return self.__delete_children(dn)
+    def __remove(self, uuid, dn, recursive):
+        try:
+            with self.lh.get_handle() as con:
+                if recursive:
+                    return self.__delete_children(con, dn)
 
-        else:
-            self.log.debug("removing entry '%s'" % dn)
-            return self.con.delete_s(dn)
+                else:
+                    self.log.debug("removing entry '%s'" % dn)
+                    return con.delete_s(dn)
+
+        finally:
+            self.__invalidate(uuid, dn, "remove")
 
-    def __delete_children(self, dn):
-        res = self.con.search_s(dn, ldap.SCOPE_ONELEVEL, '(objectClass=*)',
+    def __delete_children(self, con, dn):
+        res = con.search_s(dn, ldap.SCOPE_ONELEVEL, '(objectClass=*)',
                 [self.uuid_entry])
 
         for c_dn, entry in res:
-            self.__delete_children(c_dn)
+            self.__delete_children(con, c_dn)
 
         # Delete ourselves
         self.log.debug("removing entry '%s'" % dn)
-        return self.con.delete_s(dn)
+        return con.delete_s(dn)
 
     def retract(self, uuid, data, params):
         # Remove defined data from the specified object
-        dn = self.uuid2dn(uuid)
         mod_attrs = []
 
         # We know about object classes - remove them
@@ -119,21 +356,31 @@ class LDAP(ObjectBackend):
         for key in data:
             mod_attrs.append((ldap.MOD_DELETE, key, None))
 
-        self.con.modify_s(dn, mod_attrs)
+        def modify(dn):
+            with self.lh.get_handle() as con:
+                con.modify_s(dn, mod_attrs)
+
+        self.__with_dn(uuid, modify)
 
     def extend(self, uuid, data, params, foreign_keys):
-        dn = self.uuid2dn(uuid)
-        return self.create(dn, data, params, foreign_keys)
+        return self.__with_dn(uuid, lambda dn: self.create(dn, data, params, foreign_keys))
 
     def move_extension(self, uuid, new_base):
         # There is no need to handle this inside of the LDAP backend
         pass
 
     def move(self, uuid, new_base):
-        dn = self.uuid2dn(uuid)
+        return self.__with_dn(uuid, lambda dn: self.__move(uuid, dn, new_base))
+
+    def __move(self, uuid, dn, new_base):
         self.log.debug("moving entry '%s' to new base '%s'" % (dn, new_base))
         rdn = ldap.dn.explode_dn(dn, flags=ldap.DN_FORMAT_LDAPV3)[0]
-        return self.con.rename_s(dn, rdn, new_base)
+        try:
+            with self.lh.get_handle() as con:
+                return con.rename_s(dn, rdn, new_base)
+
+        finally:
+            self.__invalidate(uuid, dn, "move")
 
     def create(self, base, data, params, foreign_keys=None):
         mod_attrs = []
@@ -183,19 +430,21 @@ class LDAP(ObjectBackend):
         # Write...
         self.log.debug("saving entry '%s'" % dn)
 
-        if foreign_keys == None:
-            self.con.add_s(dn, mod_attrs)
-        else:
-            self.con.modify_s(dn, mod_attrs)
+        with self.lh.get_handle() as con:
+            if foreign_keys == None:
+                con.add_s(dn, mod_attrs)
+            else:
+                con.modify_s(dn, mod_attrs)
 
         # Return automatic uuid
         return self.dn2uuid(dn)
 
     def update(self, uuid, data):
+        return self.__with_dn(uuid, lambda dn: self.__update(uuid, dn, data))
 
-        # Assemble a proper modlist
-        dn = self.uuid2dn(uuid)
+    def __update(self, uuid, dn, data):
 
+        # Assemble a proper modlist
         mod_attrs = []
         self.log.debug("gathering modifications for entry '%s'" % dn)
         for attr, entry in data.iteritems():
@@ -235,42 +484,101 @@ class LDAP(ObjectBackend):
 
         # Build new target DN and check if it has changed...
         tdn = ldap.dn.dn2str([new_rdn_parts] + rdns[1:])
-        if tdn != dn:
-            self.log.debug("entry needs a rename from '%s' to '%s'" % (dn, tdn))
-            self.con.rename_s(dn, ldap.dn.dn2str([new_rdn_parts]))
-
-        # Write back...
-        self.log.debug("saving entry '%s'" % tdn)
-        return self.con.modify_s(tdn, mod_attrs)
+        with self.lh.get_handle() as con:
+            if tdn != dn:
+                self.log.debug("entry needs a rename from '%s' to '%s'" % (dn, tdn))
+                try:
+                    con.rename_s(dn, ldap.dn.dn2str([new_rdn_parts]))
+                finally:
+                    self.__invalidate(uuid, dn, "rename")
+
+            # Write back...
+            self.log.debug("saving entry '%s'" % tdn)
+            return con.modify_s(tdn, mod_attrs)
 
     def uuid2dn(self, uuid):
+        return self.cache.get_dn(uuid) or self.__search_dn(uuid)
+
+    def __with_dn(self, uuid, operation):
+        """
+        Run *operation* with the DN of the entry. A cached DN is outdated if
+        the entry has been moved or renamed by someone else - forget it and
+        try again with a fresh lookup.
+        """
+        dn = self.cache.get_dn(uuid)
+        if not dn:
+            return operation(self.__search_dn(uuid))
+
+        try:
+            return operation(dn)
+
+        except ldap.NO_SUCH_OBJECT:
+            self.log.debug("cached DN '%s' of '%s' is outdated" % (dn, uuid))
+            self.cache.invalidate(uuid, dn)
+            return operation(self.__search_dn(uuid))
+
+    def __search_dn(self, uuid):
         # Get DN of entry
         fltr_tpl = "%s=%%s" % self.uuid_entry
         fltr = ldap.filter.filter_format(fltr_tpl, [uuid])
 
         self.log.debug("searching with filter '%s' on base '%s'" % (fltr,
             self.lh.get_base()))
-        res = self.con.search_s(self.lh.get_base(), ldap.SCOPE_SUBTREE, fltr,
-                [self.uuid_entry])
+        with self.lh.get_handle() as con:
+            res = con.search_s(self.lh.get_base(), ldap.SCOPE_SUBTREE, fltr,
+                    [self.uuid_entry])
 
         self.__check_res(uuid, res)
+        self.cache.add(uuid, res[0][0])
 
         return res[0][0]
 
     def dn2uuid(self, dn):
-        res = self.con.search_s(dn.encode('utf-8'), ldap.SCOPE_BASE, '(objectClass=*)',
-                [self.uuid_entry])
+        uuid = self.cache.get_uuid(dn)
+        if uuid:
+            return uuid
+
+        with self.lh.get_handle() as con:
+            res = con.search_s(dn.encode('utf-8'), ldap.SCOPE_BASE, '(objectClass=*)',
+                    [self.uuid_entry])
 
         # Check if res is valid
         self.__check_res(dn, res)
-
-        return res[0][1][self.uuid_entry][0]
+        uuid = res[0][1][self.uuid_entry][0]
+        self.cache.add(uuid, dn)
+
+        return uuid
+
+    def get_statistics(self):
+        """
+        ``Return:`` dict with the statistics of the uuid / DN cache
+        """
+        return self.cache.get_statistics()
+
+    def __invalidate(self, uuid, dn, reason):
+        self.cache.invalidate(uuid, dn)
+
+        # Tell the other agents about it
+        if self.cache_events:
+            e = EventMaker()
+            amqp = PluginRegistry.getInstance("AMQPHandler")
+            amqp.sendEvent(e.Event(e.ObjectChanged(
+                e.Id(self.env.id),
+                e.UUID(uuid),
+                e.DN(dn.decode('utf-8') if isinstance(dn, str) else dn),
+                e.Reason(reason))))
+
+    def __eventProcessor(self, data):
+        data = data.ObjectChanged
+        self.log.debug("invalidating cached DN of '%s' (%s)" % (data.UUID, data.Reason))
+        self.cache.invalidate(str(data.UUID), unicode(data.DN))
 
     def get_uniq_dn(self, rdns, base, data):
         try:
-            for dn in self.build_dn_list(rdns, base, data):
-                res = self.con.search_s(dn.encode('utf-8'), ldap.SCOPE_BASE, '(objectClass=*)',
-                    [self.uuid_entry])
+            with self.lh.get_handle() as con:
+                for dn in self.build_dn_list(rdns, base, data):
+                    res = con.search_s(dn.encode('utf-8'), ldap.SCOPE_BASE, '(objectClass=*)',
+                        [self.uuid_entry])
 
         except ldap.NO_SUCH_OBJECT:
             return dn
@@ -286,8 +594,9 @@ class LDAP(ObjectBackend):
 
         self.log.debug("uniq test with filter '%s' on base '%s'" % (fltr,
             self.lh.get_base()))
-        res = self.con.search_s(self.lh.get_base(), ldap.SCOPE_SUBTREE, fltr,
-            [self.uuid_entry])
+        with self.lh.get_handle() as con:
+            res = con.search_s(self.lh.get_base(), ldap.SCOPE_SUBTREE, fltr,
+                [self.uuid_entry])
 
         return len(res) == 0
 
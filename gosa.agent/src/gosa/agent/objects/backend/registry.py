@@ -16,6 +16,9 @@ class ObjectBackendRegistry(object):
     def dn2uuid(self, backend, dn):
         return ObjectBackendRegistry.backends[backend].dn2uuid(dn)
 
+    def dn2uuid_many(self, backend, dns):
+        return ObjectBackendRegistry.backends[backend].dn2uuid_many(dns)
+
     @staticmethod
     def getInstance():
         if not ObjectBackendRegistry.instance:
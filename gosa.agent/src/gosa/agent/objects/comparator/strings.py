@@ -80,11 +80,11 @@ class stringLength(ElementComparator):
         maxSize = int(maxSize)
 
         # Each item of value has to match the given length-rules
-        for entry in value:
+        for cnt, entry in enumerate(value):
             if minSize >= 0 and len(entry) < minSize:
-                errors.append("Item %s (%s) is to small, at least %s characters are required!" % (cnt, item, minSize))
+                errors.append("Item %s (%s) is to small, at least %s characters are required!" % (cnt, entry, minSize))
                 return False
             elif maxSize >=0 and len(entry) > maxSize:
-                errors.append("Item %s (%s) is to great, at max %s characters are allowed!" % (cnt, item, maxSize))
+                errors.append("Item %s (%s) is to great, at max %s characters are allowed!" % (cnt, entry, maxSize))
                 return False
         return True
@@ -32,15 +32,43 @@ Here are some examples on how to instatiate on new object:
 >>> person->sn = "Surname"
 >>> person->commit()
 
+Schema cache
+^^^^^^^^^^^^
+
+Validating the XML definitions against the object schema is expensive.
+Definitions which passed the validation are kept in a cache file and
+loaded without validation on the next start, as long as the size and
+modification time - or the content hash - of their file did not change.
+A changed ``object.xsd`` or cache format invalidates the whole cache.
+
+After loading, the meta-classes of all object types are built in the
+background, so that the first request does not have to wait for them.
+The background thread is stopped when the interpreter exits or
+:meth:`gosa.agent.objects.factory.GOsaObjectFactory.stop` is called.
+
+It is configured thru the ``[core]`` section of your GOsa configuration:
+
+=============== ============
+Key             Description
+=============== ============
+schema-cache    Path of the cache file, defaults to *schema.cache* in the working directory
+schema-preload  Build the meta-classes in the background, defaults to *True*
+=============== ============
+
 """
 import pkg_resources
 import os
 import time
-import copy
+import hashlib
+import marshal
 import datetime
 import re
 import logging
+import atexit
 import zope.event
+from functools import partial
+from weakref import ref
+from threading import Thread, RLock, Event
 from zope.interface import Interface, implements
 from lxml import etree, objectify
 from gosa.common import Environment
@@ -50,6 +78,9 @@ from gosa.agent.objects.comparator import get_comparator
 from gosa.agent.objects.operator import get_operator
 from logging import getLogger
 
+# Namespace of the object definitions
+NS = "{http://www.gonicus.de/Objects}"
+
 # Map XML base types to python values
 TYPE_MAP = {
         'Boolean': bool,
@@ -61,14 +92,170 @@ TYPE_MAP = {
         'Binary': None
         }
 
+# Version of the schema cache format
+SCHEMA_CACHE_VERSION = 2
+
 # Status
 STATUS_OK = 0
 STATUS_CHANGED = 1
 
 
+# Stop the preload threads before the interpreter is torn down, they are
+# daemonic and would otherwise keep building classes during the shutdown.
+_factories = set()
+
+
+def _stop_all():
+    for factory_ref in tuple(_factories):
+        factory = factory_ref()
+        if factory:
+            factory.stop()
+
+atexit.register(_stop_all)
+
+
 class FactoryException(Exception):
     pass
 
+
+class Property(object):
+    """
+    Per object state of a property. The schema information - types,
+    filters, validators and flags - is shared by all objects of a type,
+    only the values and the status are kept per object.
+
+    Properties can be accessed like dictionaries, which is what the
+    filters expect. Writing a schema key - i.e. if a filter changes the
+    backend - stores the new value in the property itself and leaves the
+    shared schema untouched. Lists and dictionaries are copied into the
+    property when they are read, so they can be modified in place, too.
+    """
+    __slots__ = ('schema', 'value', 'orig_value', 'old', 'status', 'local')
+    state = frozenset(__slots__[1:5])
+
+    def __init__(self, schema, value=None, status=STATUS_OK):
+        self.schema = schema
+        self.value = self.orig_value = self.old = value
+        self.status = status
+        self.local = None
+
+    @staticmethod
+    def create(prop):
+        """
+        ``Return:`` the given property, properties created by
+        :meth:`gosa.agent.objects.factory.GOsaObjectFactory.createNewProperty`
+        are converted.
+        """
+        if isinstance(prop, Property):
+            return prop
+
+        res = Property(prop, prop['value'], prop['status'])
+        res.orig_value = prop.get('orig_value', res.value)
+        res.old = prop.get('old', res.value)
+        return res
+
+    def copy(self):
+        """
+        ``Return:`` copy of the property to be passed to the filters
+        """
+        res = Property(self.schema, self.value, self.status)
+        res.orig_value = self.orig_value
+        res.old = self.old
+        res.local = dict(self.local) if self.local else {}
+
+        # Filters may add dependencies
+        res.local['dependsOn'] = list(self['dependsOn'])
+        return res
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+    def keys(self):
+        return list(Property.state.union(self.schema, self.local or ()))
+
+    def __getitem__(self, name):
+        if name in Property.state:
+            return getattr(self, name)
+
+        if self.local and name in self.local:
+            return self.local[name]
+
+        # Mutable values are shared by all objects, hand out a private copy
+        value = self.schema[name]
+        if isinstance(value, (list, dict)):
+            value = type(value)(value)
+            self[name] = value
+
+        return value
+
+    def __setitem__(self, name, value):
+        if name in Property.state:
+            setattr(self, name, value)
+        else:
+            if self.local is None:
+                self.local = {}
+
+            self.local[name] = value
+
+    def __contains__(self, name):
+        return name in Property.state or name in self.schema or bool(self.local and name in self.local)
+
+
+class PropertyView(object):
+    """
+    Dictionary like view on the properties of an object which is passed
+    to the out-filters. Properties are copied when they are accessed by a
+    filter, the object itself stays untouched.
+    """
+
+    def __init__(self, props):
+        self.__props = props
+        self.__changed = {}
+        self.__removed = set()
+
+    def touched(self):
+        """
+        ``Return:`` list of the keys which have been accessed and may have
+        been modified
+        """
+        return self.__changed.keys()
+
+    def keys(self):
+        return [k for k in self.__props if not k in self.__removed and not k in self.__changed] + \
+            self.__changed.keys()
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+    def __getitem__(self, name):
+        if not name in self.__changed:
+            if name in self.__removed or not name in self.__props:
+                raise KeyError(name)
+
+            self.__changed[name] = self.__props[name].copy()
+
+        return self.__changed[name]
+
+    def __setitem__(self, name, value):
+        self.__removed.discard(name)
+        self.__changed[name] = value
+
+    def __delitem__(self, name):
+        if not name in self:
+            raise KeyError(name)
+
+        self.__changed.pop(name, None)
+        self.__removed.add(name)
+
+    def __contains__(self, name):
+        return name in self.__changed or (name in self.__props and not name in self.__removed)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
 class GOsaObjectFactory(object):
     """
     This class reads GOsa-object defintions and generates python-meta classes
@@ -77,11 +264,16 @@ class GOsaObjectFactory(object):
     """
     __xml_defs = {}
     __classes = {}
+    __class_lock = RLock()
     __var_regex = re.compile('^[a-z_][a-z0-9\-_]*$', re.IGNORECASE)
 
     def __init__(self):
         self.env = Environment.getInstance()
         self.log = logging.getLogger(__name__)
+        self.__timings = {}
+        self.__preloader = None
+        self.__stopped = Event()
+        start = time.time()
 
         # Initialize parser
         #pylint: disable=E1101
@@ -90,12 +282,35 @@ class GOsaObjectFactory(object):
         schema_root = etree.XML(schema_doc)
         schema = etree.XMLSchema(schema_root)
         self.__parser = objectify.makeparser(schema=schema)
+        self.__trusted_parser = objectify.makeparser()
+        self.__cache_tag = (SCHEMA_CACHE_VERSION, hashlib.sha1(schema_doc).hexdigest())
+        self.__timings['xsd'] = time.time() - start
 
         self.log.info("object factory initialized")
 
         # Load and parse schema
         self.loadSchema()
 
+        # Build the meta-classes before they're requested
+        if str(self.env.config.get("core.schema-preload", default="True")).lower() in ["true", "1", "yes"]:
+            _factories.add(ref(self))
+            self.__preloader = Thread(target=self.__preload, name="SchemaPreload")
+            self.__preloader.setDaemon(True)
+            self.__preloader.start()
+
+    def stop(self):
+        """
+        Stop building the meta-classes in the background and wait for
+        the preload thread to finish. Classes which have not been built
+        yet are built on request.
+        """
+        self.__stopped.set()
+        _factories.discard(ref(self))
+
+        if self.__preloader:
+            self.__preloader.join()
+            self.__preloader = None
+
 #-TODO-needs-re-work-------------------------------------------------------------------------------
 
     #@Command()
@@ -138,10 +353,146 @@ class GOsaObjectFactory(object):
 
         """
         self.log.debug("object of type '%s' requested %s" % (name, args))
-        if not name in self.__classes:
-            self.__classes[name] = self.__build_class(name)
+        return self.__get_class(name)(*args, **kwargs)
+
+    def getObjects(self, name, ids):
+        """
+        Returns GOsa-object instances for a list of DNs or UUIDs. In
+        contrast to calling
+        :meth:`gosa.agent.objects.factory.GOsaObjectFactory.getObject`
+        for each of them, the objects are loaded with one bulk request
+        per backend.
+
+        e.g.:
+
+        >>> people = f.getObjects('Person', [u"cn=Klaus Mustermann,ou=people,dc=gonicus,dc=de",
+        ...     "410ad9f0-c4c0-11e0-962b-0800200c9a66"])
 
-        return self.__classes[name](*args, **kwargs)
+        =============== ============
+        Parameter       Description
+        =============== ============
+        name            Object type
+        ids             List of DNs or UUIDs
+        =============== ============
+
+        ``Return:`` list of objects in the order of *ids*, objects which
+        could not be found are skipped
+        """
+        self.log.debug("%d objects of type '%s' requested" % (len(ids), name))
+        klass = self.__get_class(name)
+        be = ObjectBackendRegistry.getBackend(klass._backend)
+
+        # Resolve the DNs in one go
+        dns = [i for i in ids if not be.is_uuid(i)]
+        uuids = be.dn2uuid_many(dns) if dns else {}
+        order = [uuids.get(i) if i in uuids else i for i in ids if i in uuids or be.is_uuid(i)]
+
+        return self.__load_objects(klass, order, be.load_many)
+
+    def findObjects(self, name, fltr):
+        """
+        Returns GOsa-object instances for all entries of the primary
+        backend of the object type matching the given backend specific
+        filter.
+
+        e.g.:
+
+        >>> people = f.findObjects('Person', "(&(objectClass=inetOrgPerson)(sn=Mustermann))")
+
+        =============== ============
+        Parameter       Description
+        =============== ============
+        name            Object type
+        fltr            Filter for the primary backend
+        =============== ============
+
+        ``Return:`` list of objects
+        """
+        self.log.debug("objects of type '%s' matching '%s' requested" % (name, fltr))
+        klass = self.__get_class(name)
+        be = ObjectBackendRegistry.getBackend(klass._backend)
+
+        return self.__load_objects(klass, None, lambda uuids, info: be.search(fltr, info))
+
+    def getStatistics(self):
+        """
+        Returns the timings of the schema loading.
+
+        ============== =============
+        Key            Description
+        ============== =============
+        xsd            Seconds used to load the object schema
+        load           Seconds used to load the object definitions
+        preload        Seconds used to build the meta-classes, if done
+        files          Number of definition files
+        cached         Number of definitions taken from the cache
+        validated      Number of definitions which had to be validated
+        classes        Number of meta-classes built so far
+        ============== =============
+
+        ``Return:`` dict with statistics
+        """
+        stats = dict(self.__timings)
+        stats['classes'] = len(self.__classes)
+        return stats
+
+    def __get_class(self, name):
+        klass = self.__classes.get(name)
+        if klass is None:
+            with self.__class_lock:
+                klass = self.__classes.get(name)
+                if klass is None:
+                    klass = self.__classes[name] = self.__build_class(name)
+
+        return klass
+
+    def __preload(self):
+        start = time.time()
+        for name in self.__xml_defs.keys():
+            if self.__stopped.is_set():
+                self.log.debug("meta-class preload stopped")
+                return
+
+            try:
+                self.__get_class(name)
+            except Exception as e:
+                self.log.error("failed to build meta-class for object-type '%s': %s" % (name, str(e)))
+
+        self.__timings['preload'] = time.time() - start
+        self.log.info("built %d meta-classes in %.3fs" % (len(self.__classes), self.__timings['preload']))
+
+    def __load_objects(self, klass, uuids, load):
+        """
+        Load the attributes of many objects with one request per backend
+        and create the objects from them. *load* is used to load the
+        primary backend and has the signature of
+        :meth:`gosa.agent.objects.backend.ObjectBackend.load_many`.
+        """
+        props = getattr(klass, '__properties')
+        p_backend = klass._backend
+
+        # Group attributes by backend, starting with the primary one
+        infos = {p_backend: {}}
+        for key, prop in props.iteritems():
+            infos.setdefault(prop['backend'], {})[key] = prop['backend_type']
+
+        # The primary backend decides which objects are there
+        primary = load(uuids, infos[p_backend])
+        if uuids is None:
+            uuids = primary.keys()
+
+        data = dict((uuid, {p_backend: primary[uuid][1]}) for uuid in uuids if uuid in primary)
+
+        for backend, info in infos.iteritems():
+            if backend == p_backend or not info:
+                continue
+
+            res = ObjectBackendRegistry.getBackend(backend).load_many(data.keys(), info)
+            for uuid, (dn, attrs) in res.iteritems():
+                data[uuid][backend] = attrs
+
+        # Create the objects and run their in-filters
+        return [klass(primary[uuid][0], data=(uuid, data[uuid])) for uuid in uuids if uuid in data]
 
     #@Command()
     def createObject(self, name, *args, **kwargs):
@@ -211,34 +562,133 @@ class GOsaObjectFactory(object):
 
         These meta-classes are used for object instantiation later.
 
+        Definitions found in the schema cache are not validated again.
         """
+        start = time.time()
+        files = []
+
         #pylint: disable=E1101
         path = pkg_resources.resource_filename('gosa.agent', 'data/objects')
 
         # Include built in schema
         for f in [n for n in os.listdir(path) if n.endswith(os.extsep + 'xml')]:
-            self.__parse_schema(os.path.join(path, f))
+            files.append(os.path.join(path, f))
 
         # Include additional schema configuration
         path = os.path.join(self.env.config.getBaseDir(), 'schema')
         if os.path.isdir(path):
             for f in [n for n in os.listdir(path) if n.endswith(os.extsep + 'xml')]:
-                self.__parse_schema(os.path.join(path, f))
+                files.append(os.path.join(path, f))
+
+        cache_file = self.__get_cache_file()
+        cache = self.__read_cache(cache_file) if cache_file else {}
+        entries = {}
+        cached = 0
+
+        for path in files:
+            entry = self.__load_cached(path, cache.get(path))
+            if entry:
+                cached += 1
+            else:
+                entry = self.__parse_schema(path)
+
+            entries[path] = entry
+
+        if cache_file and entries != cache:
+            self.__write_cache(cache_file, entries)
+
+        self.__timings.update({'load': time.time() - start, 'files': len(files),
+            'cached': cached, 'validated': len(files) - cached})
+        self.log.info("loaded %d schema files in %.3fs (%d from cache, %d validated, object schema %.3fs)" %
+            (len(files), self.__timings['load'], cached, len(files) - cached, self.__timings['xsd']))
 
     def __parse_schema(self, path):
         """
         Parses a schema file using the
         :meth:`gosa.agent.objects.factory.GOsaObjectFactory.__parser`
         method.
+
+        ``Return:`` cache entry for the file
         """
+        data = open(path).read()
+        stat = os.stat(path)
+
         try:
-            xml = objectify.fromstring(open(path).read(), self.__parser)
-            self.__xml_defs[str(xml.Object['Name'][0])] = xml
-            self.log.info("loaded schema file for '%s' (%s)" % (str(xml.Object['Name'][0]),path))
+            xml = objectify.fromstring(data, self.__parser)
+            self.__add_schema(path, xml)
 
         except etree.XMLSyntaxError as e:
             raise FactoryException("Error loading object-schema file: %s, %s" % (path, e))
 
+        return (stat.st_size, stat.st_mtime, hashlib.sha1(data).hexdigest(), data)
+
+    def __add_schema(self, path, xml):
+        name = str(xml.Object['Name'][0])
+        self.__xml_defs[name] = xml
+        self.log.info("loaded schema file for '%s' (%s)" % (name, path))
+
+    def __load_cached(self, path, entry):
+        """
+        Load a definition which passed the validation before, if its file
+        did not change since.
+
+        ``Return:`` cache entry for the file or None
+        """
+        if not entry:
+            return None
+
+        size, mtime, digest, data = entry
+        stat = os.stat(path)
+
+        # Only touched files still match the content hash
+        if stat.st_size != size or stat.st_mtime != mtime:
+            if stat.st_size != size or hashlib.sha1(open(path).read()).hexdigest() != digest:
+                return None
+
+        self.__add_schema(path, objectify.fromstring(data, self.__trusted_parser))
+        return (stat.st_size, stat.st_mtime, digest, data)
+
+    def __get_cache_file(self):
+        workdir = self.env.config.get("core.workdir")
+        return self.env.config.get("core.schema-cache",
+            default=os.path.join(workdir, "schema.cache") if workdir else None)
+
+    def __read_cache(self, path):
+        try:
+            with open(path, "rb") as f:
+                tag, entries = marshal.load(f)
+
+            if tag != self.__cache_tag:
+                self.log.info("schema cache '%s' is outdated" % path)
+                return {}
+
+            # Only accept what __write_cache produces
+            if not all(isinstance(e, tuple) and len(e) == 4 for e in entries.itervalues()):
+                raise ValueError("unexpected cache entry")
+
+        except IOError:
+            return {}
+
+        except Exception as e:
+            self.log.warning("ignoring broken schema cache '%s': %s" % (path, str(e)))
+            return {}
+
+        return entries
+
+    def __write_cache(self, path, entries):
+        # Write to a temporary file first, other agents may read the cache
+        tmp = "%s.%d" % (path, os.getpid())
+        try:
+            with open(tmp, "wb") as f:
+                marshal.dump((self.__cache_tag, entries), f)
+            os.rename(tmp, path)
+            self.log.debug("wrote schema cache '%s'" % path)
+
+        except (IOError, OSError) as e:
+            self.log.warning("failed to write schema cache '%s': %s" % (path, str(e)))
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+
     def __build_class(self, name):
         """
         This method builds a meta-class for each object defintion read from the
@@ -399,7 +849,7 @@ class GOsaObjectFactory(object):
                         cParams.append(str(param['Value']))
 
                 # Now add the method to the object
-                def funk(*args, **kwargs):
+                def funk(caller_object, *args, **kwargs):
 
                     # Convert all given parameters into named arguments
                     # The eases up things a lot.
@@ -428,8 +878,8 @@ class GOsaObjectFactory(object):
                     # Collect all property values of this GOsa-object to be able to fill in
                     # placeholders in command-parameters later.
                     propList = {}
-                    for key in props:
-                        propList[key] = props[key]['value']
+                    for key, prop in getattr(caller_object, '__properties').iteritems():
+                        propList[key] = prop.value
 
                     # Add method-parameters passed to this method.
                     for entry in arguments:
@@ -460,58 +910,91 @@ class GOsaObjectFactory(object):
         setattr(klass, '__methods', methods)
         return klass
 
-    def __build_filter(self, element, out=None):
+    def __build_filter(self, element):
+        """
+        Attributes of GOsa objects can be checked using validators.
+
+        This method compiles the read XML validator-elements of the
+        defintion into a callable, which is run for every value that gets
+        assigned to the property::
+
+            res, errors = validator(obj, key, value)
+
+        """
+        steps = []
+        for el in element.iterchildren():
+            if el.tag == NS + "Condition":
+                steps.append(self.__handleCondition(el, True))
+            elif el.tag == NS + "ConditionOperator":
+                steps.append(self.__handleConditionOperator(el, True))
+
+        log = self.log
+
+        def validator(obj, key, value):
+            state = {'last': "", 'errors': []}
+
+            res = None
+            for step in steps:
+                res = step(obj, key, value, state)
+
+            # Attach last error message
+            if not res and state['last'] != "":
+                state['errors'].append(state['last'])
+
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug(" validator for '%s' returned %s" % (key, res))
+
+            return res, state['errors']
+
+        return validator
+
+    def __handleFilterChain(self, element):
         """
         Attributes of GOsa objects can be filtered using in- and out-filters.
         These filters can manipulate the raw-values while they are read form
         the backend or they can manipulate values that have to be written to
         the backend.
 
-        This method converts the read XML filter-elements of the defintion into
-        a process lists. This list can then be easily executed line by line for
-        each property, using the method:
+        This method compiles a 'FilterChain' element of the definition into
+        a callable, which is run for each property when it is loaded or
+        saved::
 
-        :meth:`gosa.agent.objects.factory.GOsaObject.__processFilter`
+            prop = chain(obj, key, prop)
 
+        Occurrence: OutFilter->FilterChain
         """
+        steps = self.__compileFilterChain(element)
+        log = self.log
 
-        # Parse each <FilterChain>, <Condition>, <ConditionChain>
-        out = {}
-        for el in element.iterchildren():
-            if el.tag == "{http://www.gonicus.de/Objects}FilterChain":
-                out = self.__handleFilterChain(el, out)
-            elif  el.tag == "{http://www.gonicus.de/Objects}Condition":
-                out = self.__handleCondition(el, out)
-            elif  el.tag == "{http://www.gonicus.de/Objects}ConditionOperator":
-                out = self.__handleConditionOperator(el, out)
+        def chain(obj, key, prop):
+            for step in steps:
+                key, prop = step(obj, key, prop)
 
-        return out
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug(" filter chain for '%s' ended" % key)
 
-    def __handleFilterChain(self, element, out=None):
-        """
-        This method is used in '__build_filter' to generate a process
-        list for the in and out filters.
+            return prop
 
-        The 'FilterChain' element is handled here.
+        return chain
 
-        Occurrence: OutFilter->FilterChain
+    def __compileFilterChain(self, element):
+        """
+        ``Return:`` list of steps for the filter entries of a
+        'FilterChain' element.
         """
-        if not out:
-            out = {}
 
         # FilterChains can contain muliple "FilterEntry" tags.
         # But at least one.
         # Here we forward these elements to their handler.
+        steps = []
         for el in element.iterchildren():
-            if el.tag == "{http://www.gonicus.de/Objects}FilterEntry":
-                out = self.__handleFilterEntry(el, out)
-        return out
+            if el.tag == NS + "FilterEntry":
+                steps += self.__handleFilterEntry(el)
 
-    def __handleFilterEntry(self, element, out):
-        """
-        This method is used in '__build_filter' to generate a process
-        list for the in and out filters.
+        return steps
 
+    def __handleFilterEntry(self, element):
+        """
         The 'FilterEntry' element is handled here.
 
         Occurrence: OutFilter->FilterChain->FilterEntry
@@ -519,57 +1002,77 @@ class GOsaObjectFactory(object):
 
         # FilterEntries contain a "Filter" OR a "Choice" tag.
         # Here we forward the elements to their handler.
+        steps = []
         for el in element.iterchildren():
-            if el.tag == "{http://www.gonicus.de/Objects}Filter":
-                out = self.__handleFilter(el, out)
-            elif el.tag == "{http://www.gonicus.de/Objects}Choice":
-                out = self.__handleChoice(el, out)
-        return out
+            if el.tag == NS + "Filter":
+                steps.append(self.__handleFilter(el))
+            elif el.tag == NS + "Choice":
+                steps += self.__handleChoice(el)
 
-    def __handleFilter(self, element, out):
-        """
-        This method is used in '__build_filter' to generate a process
-        list for the in and out filters.
+        return steps
 
-        The 'Filter' element is handled here.
+    def __handleFilter(self, element):
+        """
+        The 'Filter' element is handled here. The filter is run with the
+        object, the key, the property dictionary and the parameters.
 
         Occurrence: OutFilter->FilterChain->FilterEntry->Filter
         """
 
-        # Get the <Name> and the <Param> element values to be able
-        # to create a process list entry.
+        # Get the <Name> and the <Param> element values.
         name = str(element.__dict__['Name'])
         params = []
         for entry in element.iterchildren():
-            if entry.tag == "{http://www.gonicus.de/Objects}Param":
+            if entry.tag == NS + "Param":
                 params.append(entry.text)
 
-        # Attach the collected filter and parameter value to the process list.
-        cnt = len(out) + 1
-        out[cnt] = {'filter': get_filter(name)(self), 'params': params}
-        return out
+        process = get_filter(name)(self).process
+        bind = self.__bindParameters(params)
 
-    def __handleChoice(self, element, out):
-        """
-        This method is used in '__build_filter' to generate a process
-        list for the in and out filters.
+        def step(obj, key, prop):
+            try:
+                key, prop = process(obj, key, prop, *bind(obj))
+            except Exception as e:
+                raise FactoryException("Filter '%s' execution failed for '%s'! Error was: %s" % (name, key, e))
+
+            # Ensure that the processed data is still valid.
+            # Filter may mess things up and then the next cannot process correctly.
+            if (key not in prop):
+                raise FactoryException("Filter '%s' returned invalid key property key '%s'!" % (name, key))
+
+            # Check if the filter returned all expected property values. Only
+            # properties touched by filters need to be checked.
+            for pk in (prop.touched() if isinstance(prop, PropertyView) else prop):
+                if not all(k in prop[pk] for k in ('backend', 'value', 'type')):
+                    missing = ", ".join(set(['backend', 'value', 'type']) - set(prop[pk].keys()))
+                    raise FactoryException("Filter '%s' does not return all expected property values! '%s' missing." % (name, missing))
+
+                # Check if the returned value-type is list or None.
+                if type(prop[pk]['value']) not in [list, type(None)]:
+                    raise FactoryException("Filter '%s' does not return a 'list' as value for key %s (%s)!" % (
+                        name, pk, type(prop[pk]['value'])))
+
+            return key, prop
+
+        return step
 
+    def __handleChoice(self, element):
+        """
         The 'Choice' element is handled here.
 
         Occurrence: OutFilter->FilterChain->FilterEntry->Choice
         """
 
         # We just forward <When> tags to their handler.
+        steps = []
         for el in element.iterchildren():
-            if el.tag == "{http://www.gonicus.de/Objects}When":
-                out = self.__handleWhen(el, out)
-        return(out)
+            if el.tag == NS + "When":
+                steps.append(self.__handleWhen(el))
 
-    def __handleWhen(self, element, out):
-        """
-        This method is used in '__build_filter' to generate a process
-        list for the in and out filters.
+        return steps
 
+    def __handleWhen(self, element):
+        """
         The 'When' element is handled here.
 
         Occurrence: OutFilter->FilterChain->FilterEntry->Choice->When
@@ -579,112 +1082,102 @@ class GOsaObjectFactory(object):
         # an optional <Else> tag.
         #  The <FilterChain> is only executed when the <ConditionChain> matches
         #  the given values.)
-
-        # Forward the tags to their correct handler.
-        filterChain = {}
-        elseChain = {}
+        condition = None
+        filterChain = []
+        elseChain = []
         for el in element.iterchildren():
-            if el.tag == "{http://www.gonicus.de/Objects}ConditionChain":
-                out = self.__handleConditionChain(el, out)
-            if el.tag == "{http://www.gonicus.de/Objects}FilterChain":
-                filterChain = self.__handleFilterChain(el, filterChain)
-            elif el.tag == "{http://www.gonicus.de/Objects}Else":
-                elseChain = self.__handleElse(el, elseChain)
-
-        # Collect jump points
-        cnt = len(out)
-        match = cnt + 2
-        endMatch = match + len(filterChain)
-        noMatch = endMatch + 1
-        endNoMatch = noMatch + len(elseChain)
-
-        # Add jump point for this condition
-        cnt = len(out)
-        out[cnt + 1] = {'jump': 'conditional', 'onTrue': match, 'onFalse': noMatch}
-
-        # Add the <FilterChain> process.
-        cnt = len(out)
-        for entry in filterChain:
-            cnt = cnt + 1
-            out[cnt] = filterChain[entry]
-
-        # Add jump point to jump over the else chain
-        cnt = len(out)
-        out[cnt + 1] = {'jump': 'non-conditional', 'to': endNoMatch}
-
-        # Add the <Else> process.
-        cnt = len(out)
-        for entry in elseChain:
-            cnt = cnt + 1
-            out[cnt] = elseChain[entry]
-
-        return(out)
-
-    def __handleElse(self, element, out):
-        """
-        This method is used in '__build_filter' to generate a process
-        list for the in and out filters.
+            if el.tag == NS + "ConditionChain":
+                condition = self.__handleConditionChain(el, False)
+            if el.tag == NS + "FilterChain":
+                filterChain += self.__compileFilterChain(el)
+            elif el.tag == NS + "Else":
+                elseChain += self.__handleElse(el)
 
+        def step(obj, key, prop):
+            for sub in (filterChain if condition(obj, key, None, None) else elseChain):
+                key, prop = sub(obj, key, prop)
+
+            return key, prop
+
+        return step
+
+    def __handleElse(self, element):
+        """
         The 'Else' element is handled here.
 
         Occurrence: OutFilter->FilterChain->FilterEntry->Choice->Else
         """
 
         # Handle <FilterChain> elements of this else tree.
+        steps = []
         for el in element.iterchildren():
-            if el.tag == "{http://www.gonicus.de/Objects}FilterChain":
-                out = self.__handleFilterChain(el, out)
+            if el.tag == NS + "FilterChain":
+                steps += self.__compileFilterChain(el)
 
-        return out
+        return steps
 
-    def __handleConditionChain(self, element, out):
+    def __handleConditionChain(self, element, validator):
         """
-        This method is used in '__build_filter' to generate a process
-        list for the in and out filters.
-
-        The 'ConditionChain' element is handled here.
+        The 'ConditionChain' element is handled here. The resulting
+        callable returns the result of the last condition.
 
         Occurrence: OutFilter->FilterChain->FilterEntry->Choice->When->ConditionChain
         """
 
         # Forward <Condition> tags to their handler.
+        steps = []
         for el in element.iterchildren():
-            if el.tag == "{http://www.gonicus.de/Objects}Condition":
-                out = self.__handleCondition(el, out)
-            elif el.tag == "{http://www.gonicus.de/Objects}ConditionOperator":
-                out = self.__handleConditionOperator(el, out)
+            if el.tag == NS + "Condition":
+                steps.append(self.__handleCondition(el, validator))
+            elif el.tag == NS + "ConditionOperator":
+                steps.append(self.__handleConditionOperator(el, validator))
 
-        return out
+        def chain(obj, key, value, state):
+            res = None
+            for step in steps:
+                res = step(obj, key, value, state)
 
-    def __handleConditionOperator(self, element, out):
-        """
-        This method is used in '__build_filter' to generate a process
-        list for the in and out filters.
+            return res
+
+        return chain
 
+    def __handleConditionOperator(self, element, validator):
+        """
         The 'ConditionOperator' element is handled here.
 
         Occurrence: OutFilter->FilterChain->FilterEntry->Choice->When->ConditionChain->ConditionOperator
         """
 
         # Forward <Left and <RightConditionChains> to the ConditionChain handler.
-        out = self.__handleConditionChain(element.__dict__['LeftConditionChain'], out)
-        out = self.__handleConditionChain(element.__dict__['RightConditionChain'], out)
+        left = self.__handleConditionChain(element.__dict__['LeftConditionChain'], validator)
+        right = self.__handleConditionChain(element.__dict__['RightConditionChain'], validator)
 
-        # Append operator
-        cnt = len(out)
         if element.__dict__['Operator'] == "or":
-            out[cnt + 1] = {'operator': get_operator('Or')(self)}
+            process = get_operator('Or')(self).process
         else:
-            out[cnt + 1] = {'operator': get_operator('And')(self)}
+            process = get_operator('And')(self).process
 
-        return out
+        def operator(obj, key, value, state):
+            # Both sides are evaluated to collect their error messages
+            v2 = left(obj, key, value, state)
+            v1 = right(obj, key, value, state)
+            res = process(v1, v2)
 
-    def __handleCondition(self, element, out):
-        """
-        This method is used in '__build_filter' to generate a process
-        list for the in and out filters.
+            # Add last error message
+            if not res and state is not None:
+                state['errors'].append(state['last'])
+                state['last'] = ""
 
-        The 'Condition' element is handled here.
+            return res
+
+        return operator
+
+    def __handleCondition(self, element, validator):
+        """
+        The 'Condition' element is handled here. Conditions of validators
+        get the value to check passed and report their errors, conditions
+        in filters only get the key and have their placeholders replaced
+        like filters.
 
         Occurrence: OutFilter->FilterChain->FilterEntry->Choice->When->ConditionChain->Condition
         """
@@ -695,13 +1188,54 @@ class GOsaObjectFactory(object):
         name = str(element.__dict__['Name'])
         params = []
         for entry in element.iterchildren():
-            if entry.tag == "{http://www.gonicus.de/Objects}Param":
+            if entry.tag == NS + "Param":
                 params.append(entry.text)
 
-        # Append the condition to the process list.
-        cnt = len(out) + 1
-        out[cnt] = {'condition': get_comparator(name)(self), 'params': params}
-        return(out)
+        process = get_comparator(name)(self).process
+
+        if not validator:
+            bind = self.__bindParameters(params)
+            return lambda obj, key, value, state: process(key, *bind(obj))
+
+        def condition(obj, key, value, state):
+            errors = []
+            res = process(key, value, *params, errors=errors)
+            if not res and len(errors):
+                state['last'] = errors.pop()
+
+            return res
+
+        return condition
+
+    def __bindParameters(self, params):
+        """
+        ``Return:`` callable returning the filter parameters for an
+        object. Placeholders like ``%(sn)s`` are replaced by the values
+        of the object when the filter is run.
+        """
+        if not any('%' in p for p in params if p):
+            params = tuple(params)
+            return lambda obj: params
+
+        def bind(obj):
+            # Collect all property values
+            propList = {}
+            for key, prop in getattr(obj, '__properties').iteritems():
+                if prop['multivalue']:
+                    propList[key] = prop.value
+                else:
+                    propList[key] = prop.value[0] if prop.value else None
+
+            res = []
+            for p in params:
+                try:
+                    res.append(p % propList)
+                except:
+                    res.append(p)
+
+            return res
+
+        return bind
 
 
 class GOsaObject(object):
@@ -726,7 +1260,7 @@ class GOsaObject(object):
     dn = None
     log = None
 
-    def __init__(self, dn=None, mode="update"):
+    def __init__(self, dn=None, mode="update", data=None):
 
         # Instantiate Backend-Registry
         self._reg = ObjectBackendRegistry.getInstance()
@@ -735,9 +1269,13 @@ class GOsaObject(object):
         self.log.debug("new object instantiated '%s'" % (type(self).__name__))
         self.log.debug("object dn '%s'" % (dn))
 
+        # Every instance gets its own property values, the class only
+        # holds the definitions.
+        props = dict((key, Property(schema)) for key, schema in getattr(type(self), '__properties').iteritems())
+        self.__dict__['__properties'] = props
+
         # Group attributes by Backend
         propsByBackend = {}
-        props = getattr(self, '__properties')
         for key in props:
 
             # Initialize an empty array for each backend
@@ -750,8 +1288,10 @@ class GOsaObject(object):
         self._propsByBackend = propsByBackend
         self._mode = mode
 
-        # Initialize object using a DN
-        if dn and mode != "create":
+        # Initialize object using a DN or already loaded data
+        if data:
+            self._load(*data)
+        elif dn and mode != "create":
             self._read(dn)
 
     def listProperties(self):
@@ -770,12 +1310,10 @@ class GOsaObject(object):
         props = getattr(self, '__properties')
 
         # Instantiate Backend-Registry
-        self.uuid = self._reg.dn2uuid(self._backend, dn)
+        uuid = self._reg.dn2uuid(self._backend, dn)
 
         # Load attributes for each backend.
-        # And then assign the values to the properties.
-        obj = self
-        self.log.debug("object uuid: %s" % (self.uuid))
+        data = {}
         for backend in self._propsByBackend:
 
             try:
@@ -784,7 +1322,7 @@ class GOsaObject(object):
                 info = dict([(k, props[k]['backend_type']) for k in self._propsByBackend[backend]])
                 self.log.debug("loading attributes for backend '%s': %s" % (backend, str(info)))
                 be = ObjectBackendRegistry.getBackend(backend)
-                attrs = be.load(self.uuid, info)
+                data[backend] = be.load(uuid, info)
 
             except ValueError as e:
                 #raise FactoryException("Error reading properties for backend '%s'!" % (backend,))
@@ -792,6 +1330,28 @@ class GOsaObject(object):
                 traceback.print_exc()
                 exit()
 
+        self._load(uuid, data)
+
+    def _load(self, uuid, data):
+        """
+        This method assigns the attributes loaded from the backends to the
+        properties and runs the in-filters.
+
+        =============== ============
+        Parameter       Description
+        =============== ============
+        uuid            UUID of the object
+        data            dict of the loaded attributes indexed by backend
+        =============== ============
+        """
+        props = getattr(self, '__properties')
+        self.uuid = uuid
+
+        # Assign the values to the properties.
+        self.log.debug("object uuid: %s" % (self.uuid))
+        for backend in self._propsByBackend:
+            attrs = data.get(backend, {})
+
             # Assign fetched value to the properties.
             for key in self._propsByBackend[backend]:
 
@@ -801,46 +1361,45 @@ class GOsaObject(object):
                     continue
 
                 # Keep original values, they may be overwritten in the in-filters.
-                props[key]['orig_value'] = props[key]['value'] = attrs[key]
-                self.log.debug("%s: %s" % (key, props[key]['value']))
+                props[key].orig_value = props[key].value = attrs[key]
 
             # Once we've loaded all properties from the backend, execute the
             # in-filters.
             for key in self._propsByBackend[backend]:
+                prop = props[key]
 
                 # Skip loading in-filters for None values
-                if props[key]['value'] == None:
-                    props[key]['orig_value'] = props[key]['value'] = []
+                if prop.value == None:
+                    prop.orig_value = prop.value = []
                     continue
 
                 # Execute defined in-filters.
-                if len(props[key]['in_filter']):
-                    self.log.debug("found %s in-filter(s)  for attribute '%s'" % (str(len(props[key]['in_filter'])),key))
-                    value = props[key]['value']
-
+                in_filter = prop['in_filter']
+                if len(in_filter):
+                    self.log.debug("found %s in-filter(s)  for attribute '%s'" % (str(len(in_filter)),key))
                     # Execute each in-filter
-                    for in_f in props[key]['in_filter']:
-                        valDict = {key: copy.deepcopy(props[key])}
-                        self.__processFilter(in_f, key, valDict)
+                    for in_f in in_filter:
+                        valDict = {key: props[key].copy()}
+                        in_f(self, key, valDict)
 
                         # Assign filter results
                         for new_key in valDict:
                             self.log.debug("in-filter returned %s: '%s'" % (new_key, valDict[new_key]['value']))
-                            props[new_key] =  valDict[new_key]
+                            props[new_key] = Property.create(valDict[new_key])
 
         # Convert the received type into the target type if not done already
-        for key in props:
-            if props[key]['type'] == 'Object':
+        for key, prop in props.iteritems():
+            ptype = prop['type']
+            if ptype == 'Object':
                 continue
 
-            if props[key]['value'] and \
-                    TYPE_MAP[props[key]['type']] and \
-                    not all(map(lambda x: type(x) == TYPE_MAP[props[key]['type']], props[key]['value'])):
-                props[key]['value'] = map(lambda x: TYPE_MAP[props[key]['type']](x), props[key]['value'])
-                self.log.debug("converted '%s' to type '%s'!" % (key,props[key]['type']))
+            cnv = TYPE_MAP[ptype]
+            if prop.value and cnv and not all(type(x) == cnv for x in prop.value):
+                prop.value = [cnv(x) for x in prop.value]
+                self.log.debug("converted '%s' to type '%s'!" % (key, ptype))
 
             # Keep the initial value
-            props[key]['old'] = props[key]['value']
+            prop.old = prop.value
 
     def _delattr_(self, name):
         """
@@ -853,7 +1412,7 @@ class GOsaObject(object):
             if props[name]['readonly']:
                 raise AttributeError("Cannot write to readonly attribute '%s'" % name)
 
-            props[name]['value'] = []
+            props[name].value = []
         else:
             raise AttributeError("no such property '%s'" % name)
 
@@ -885,7 +1444,9 @@ class GOsaObject(object):
             if props[name]['readonly']:
                 raise AttributeError("Cannot write to readonly attribute '%s'" % name)
 
-            current = copy.deepcopy(props[name]['value'])
+            # Values are replaced, not modified - keeping the reference is
+            # enough.
+            current = props[name].value
 
             # Run type check (Multi-value and single-value separately)
             if props[name]['multivalue']:
@@ -918,7 +1479,7 @@ class GOsaObject(object):
 
             # Validate value
             if props[name]['validator']:
-                res, error = self.__processValidator(props[name]['validator'], name, new_value)
+                res, error = props[name]['validator'](self, name, new_value)
                 if not res:
                     if len(error):
                         raise ValueError("Property (%s) validation failed! Last error was: %s" % (name, error[0]))
@@ -932,13 +1493,13 @@ class GOsaObject(object):
             #        raise FactoryException("The property value '%s' for property %s is not unique!" % (value, name))
 
             # Assign the properties new value.
-            props[name]['value'] = new_value
+            props[name].value = new_value
             self.log.debug("updated property value of [%s|%s] %s:%s" % (type(self).__name__, self.uuid, name, new_value))
 
             # Update status if there's a change
-            if current != props[name]['value'] and props[name]['status'] != STATUS_CHANGED:
-                props[name]['status'] = STATUS_CHANGED
-                props[name]['old'] = current
+            if current != new_value and props[name].status != STATUS_CHANGED:
+                props[name].status = STATUS_CHANGED
+                props[name].old = current
 
         else:
             raise AttributeError("no such property '%s'" % name)
@@ -957,16 +1518,16 @@ class GOsaObject(object):
 
             # We can have single and multivalues, return the correct type here.
             if props[name]['multivalue']:
-                return props[name]['value']
+                return props[name].value
             else:
-                if len(props[name]['value']):
-                    return props[name]['value'][0]
+                if len(props[name].value):
+                    return props[name].value[0]
                 else:
                     return None
 
         # The requested property-name seems to be a method, return the method reference.
         elif name in methods:
-            return methods[name]['ref']
+            return partial(methods[name]['ref'], self)
 
         else:
             raise AttributeError("no such property '%s'" % name)
@@ -1003,20 +1564,18 @@ class GOsaObject(object):
 
         # Collect values by store and process the property filters
         toStore = {}
-        for key in props:
+        for key, cprop in props.iteritems():
 
-            # Adapt status from dependent properties.
-            for propname in props[key]['dependsOn']:
-                props[key]['status'] |= props[propname]['status'] & STATUS_CHANGED
+            # Adapt status from dependent properties. Read them directly,
+            # this loop runs over all properties.
+            local = cprop.local
+            for propname in (local['dependsOn'] if local and 'dependsOn' in local else cprop.schema['dependsOn']):
+                cprop.status |= props[propname].status & STATUS_CHANGED
 
             # Do not save untouched values
-            if not props[key]['status'] & STATUS_CHANGED:
+            if not cprop.status & STATUS_CHANGED:
                 continue
 
-            # Get the new value for the property and execute the out-filter
-            value = props[key]['value']
-            new_key = key
-
             self.log.debug("changed: %s" % (key,))
 
             # Process each and every out-filter with a clean set of input values,
@@ -1025,31 +1584,37 @@ class GOsaObject(object):
 
                 self.log.debug(" found %s out-filter for %s" % (str(len(props[key]['out_filter'])), key,))
                 for out_f in props[key]['out_filter']:
-                    valDict = copy.deepcopy(props)
-                    valDict = self.__processFilter(out_f, key, valDict)
+                    valDict = PropertyView(props)
+                    valDict = out_f(self, key, valDict)
+
+                    # Collect the properties touched by the filter by
+                    # backend, the others are handled on their own.
+                    touched = set(valDict.touched())
+                    if key in valDict:
+                        touched.add(key)
 
-                    # Collect properties by backend
-                    for prop_key in valDict:
+                    for prop_key in touched:
+                        prop = valDict[prop_key]
 
                         # Do not save untouched values
-                        if not valDict[prop_key]['status'] & STATUS_CHANGED:
+                        if not prop['status'] & STATUS_CHANGED:
                             continue
 
                         # do not save properties that are marked with 'skip_save'
-                        #self.log.debug(" outfilter returned %s:(%s) %s" % (prop_key, valDict[prop_key]['type'], valDict[prop_key]['value']))
-                        if valDict[prop_key]['skip_save']:
+                        #self.log.debug(" outfilter returned %s:(%s) %s" % (prop_key, prop['type'], prop['value']))
+                        if prop['skip_save']:
                             continue
 
                         # Create backend entry in the target list.
-                        be = valDict[prop_key]['backend']
+                        be = prop['backend']
                         if not be in toStore:
                             toStore[be] = {}
 
                         # Append entry to be sored.
                         toStore[be][prop_key] = {'foreign': props[key]['foreign'],
-                                                 'orig': props[key]['orig_value'],
-                                                 'value': valDict[prop_key]['value'],
-                                                 'type': valDict[prop_key]['backend_type']}
+                                                 'orig': props[key].orig_value,
+                                                 'value': prop['value'],
+                                                 'type': prop['backend_type']}
             else:
 
                 # do not save properties that are marked with 'skip_save'
@@ -1062,8 +1627,8 @@ class GOsaObject(object):
                     toStore[be] = {}
 
                 toStore[be][key] = {'foreign': props[key]['foreign'],
-                                    'orig': props[key]['orig_value'],
-                                    'value': props[key]['value'],
+                                    'orig': props[key].orig_value,
+                                    'value': props[key].value,
                                     'type': props[key]['backend_type']}
 
         # Handle by backend
@@ -1107,7 +1672,7 @@ class GOsaObject(object):
         """
         props = getattr(self, '__properties')
         for key in props:
-            props[key]['value'] = props[key]['old']
+            props[key].value = props[key].old
 
         self.log.debug("reverted object modifications for [%s|%s]" % (type(self).__name__, self.uuid))
 
@@ -1119,222 +1684,6 @@ class GOsaObject(object):
         props = getattr(self, '__properties')
         return [x for x, y in props.items() if y['foreign']]
 
-    def __processValidator(self, fltr, key, value):
-        """
-        This method processes a given process-list (fltr) for a given property (prop).
-        And return TRUE if the value matches the validator set and FALSE if
-        not.
-        """
-
-        # This is our process-line pointer it points to the process-list line
-        #  we're executing at the moment
-        lptr = 0
-
-        # Our filter result stack
-        stack = list()
-        self.log.debug(" validator started (%s)" % (key))
-        self.log.debug("  value: %s" % (value, ))
-
-        # Process the list till we reach the end..
-        lasterrmsg = ""
-        errormsgs = []
-        while (lptr + 1) in fltr:
-
-            # Get the current line and increase the process list pointer.
-            lptr = lptr + 1
-            curline = fltr[lptr]
-
-            # A condition matches for something and returns a boolean value.
-            # We'll put this value on the stack for later use.
-            if 'condition' in curline:
-
-                # Build up argument list
-                args = [key, value] + curline['params']
-
-                # Process condition and keep results
-                errors = []
-                named = {'errors': errors}
-                fname = type(curline['condition']).__name__
-                v = (curline['condition']).process(*args, **named)
-
-                # Log what happend!
-                self.log.debug("  %s: [Filter]  %s(%s) called and returned: %s" % (
-                    lptr, fname, ", ".join(map(lambda x : "\"" + x + "\"",  curline['params'])), v))
-
-                # Append the result to the stack.
-                stack.append(v)
-                if not v:
-                    if len(errors):
-                        lasterrmsg =  errors.pop()
-
-            # A comparator compares two values from the stack and then returns a single
-            #  boolean value.
-            elif 'operator' in curline:
-                v1 = stack.pop()
-                v2 = stack.pop()
-                fname = type(curline['operator']).__name__
-                res = (curline['operator']).process(v1, v2)
-                stack.append(res)
-
-                # Add last error message
-                if not res:
-                    errormsgs.append(lasterrmsg)
-                    lasterrmsg = ""
-
-                # Log what happend!
-                self.log.debug("  %s: [OPERATOR]  %s(%s, %s) called and returned: %s" % (
-                    lptr, fname, v1, v2, res))
-
-        # Attach last error message
-        res = stack.pop()
-        if not res and lasterrmsg != "":
-            errormsgs.append(lasterrmsg)
-
-        self.log.debug(" <- VALIDATOR ENDED (%s)" % (key))
-        return res, errormsgs
-
-    def __processFilter(self, fltr, key, prop):
-        """
-        This method processes a given process-list (fltr) for a given property (prop).
-        For example: When a property has to be stored in the backend, it will
-         run through the out-filter-process-list and thus will be transformed into a storable
-         key, value pair.
-        """
-
-        # Search for replaceable patterns in the process-list.
-        fltr = self.__fillInPlaceholders(fltr)
-
-        # This is our process-line pointer it points to the process-list line
-        #  we're executing at the moment
-        lptr = 0
-
-        # Our filter result stack
-        stack = list()
-
-        # Log values
-        self.log.debug(" -> FILTER STARTED (%s)" % (key))
-        #for pkey in prop:
-        #    self.log.debug("  %s: %s: %s" % (lptr, pkey, prop[pkey]['value']))
-
-        # Process the list till we reach the end..
-        while (lptr + 1) in fltr:
-
-            # Get the current line and increase the process list pointer.
-            lptr = lptr + 1
-            curline = fltr[lptr]
-
-            # A filter is used to manipulate the 'value' or the 'key' or maybe both.
-            if 'filter' in curline:
-
-                # Build up argument list
-                args = [self, key, prop]
-                fname = type(curline['filter']).__name__
-                for entry in curline['params']:
-                    args.append(entry)
-
-                # Process filter and keep results
-                try:
-                    key, prop = (curline['filter']).process(*args)
-                except Exception as e:
-                    raise FactoryException("Filter '%s' execution failed for '%s'! Error was: %s" % (fname, key, e))
-
-                # Ensure that the processed data is still valid.
-                # Filter may mess things up and then the next cannot process correctly.
-                if (key not in prop):
-                    raise FactoryException("Filter '%s' returned invalid key property key '%s'!" % (fname, key))
-
-                # Check if the filter returned all expected property values.
-                for pk in prop:
-                    if not all(k in prop[pk] for k in ('backend', 'value', 'type')):
-                        missing = ", ".join(set(['backend', 'value', 'type']) - set(prop[pk].keys()))
-                        raise FactoryException("Filter '%s' does not return all expected property values! '%s' missing." % (fname, missing))
-
-                    # Check if the returned value-type is list or None.
-                    if type(prop[pk]['value']) not in [list, type(None)]:
-                        raise FactoryException("Filter '%s' does not return a 'list' as value for key %s (%s)!" % (
-                            fname, pk, type(prop[pk]['value'])))
-
-                self.log.debug("  %s: [Filter]  %s(%s) called " % (lptr, fname, ", ".join(map(lambda x : "\"" + x + "\"",  curline['params']))))
-
-            # A condition matches for something and returns a boolean value.
-            # We'll put this value on the stack for later use.
-            elif 'condition' in curline:
-
-                # Build up argument list
-                args = [key] + curline['params']
-
-                # Process condition and keep results
-                stack.append((curline['condition']).process(*args))
-
-                fname = type(curline['condition']).__name__
-                self.log.debug("  %s: [Condition] %s(%s) called " % (lptr, fname, ", ".join(curline['params'])))
-
-            # Handle jump, for example if a condition has failed, jump over its filter-chain.
-            elif 'jump' in curline:
-
-                # Jump to <line> -1 because we will increase the line ptr later.
-                olptr = lptr
-                if curline['jump'] == 'conditional':
-                    if stack.pop():
-                        lptr = curline['onTrue'] - 1
-                    else:
-                        lptr = curline['onFalse'] - 1
-                else:
-                    lptr = curline['to'] - 1
-
-                self.log.debug("  %s: [Goto] %s ()" % (olptr, lptr))
-
-            # A comparator compares two values from the stack and then returns a single
-            #  boolean value.
-            elif 'operator' in curline:
-                a = stack.pop()
-                b = stack.pop()
-                stack.append((curline['operator']).process(a, b))
-
-                fname = type(curline['operator']).__name__
-                self.log.debug("  %s: [Condition] %s(%s, %s) called " % (lptr, fname, a, b))
-
-            # Log current values
-            #self.log.debug("  result")
-            #for pkey in prop:
-            #    self.log.debug("   %s: %s" % (pkey, prop[pkey]['value']))
-
-        self.log.debug(" <- FILTER ENDED")
-        return prop
-
-    def __fillInPlaceholders(self, fltr):
-        """
-        This method fill in placeholder into in- and out-filters.
-        """
-
-        # Collect all property values
-        propList = {}
-        props = getattr(self, '__properties')
-        for key in props:
-            if props[key]['multivalue']:
-                propList[key] = props[key]['value']
-            else:
-                if props[key]['value'] and len(props[key]['value']):
-                    propList[key] = props[key]['value'][0]
-                else:
-                    propList[key] = None
-
-        # An inline function which replaces format string tokens
-        def _placeHolder(x):
-            for name in propList:
-                try:
-                    x = x % propList
-                except:
-                    pass
-            return (x)
-
-        # Walk trough each line of the process list an replace placeholders.
-        for line in fltr:
-            if 'params' in fltr[line]:
-                fltr[line]['params'] = map(_placeHolder,
-                        fltr[line]['params'])
-        return fltr
-
     def remove(self, recursive=False):
         """
         Removes this object - and eventually it's containements.
@@ -1439,7 +1788,7 @@ class GOsaObject(object):
         Internal cleanup method ...
         """
         #TODO
-        print "--> cleanup"
+        pass
 
 
 class IObjectChanged(Interface):
@@ -5,23 +5,27 @@ import string
 import random
 import hashlib
 import ldap
+import ldap.filter
+import ldap.controls
 import time
-import datetime
 import types
+import fnmatch
 import logging
-from threading import Timer
+from threading import Timer, Thread, Event, Lock, Semaphore
 from zope.interface import implements
 from gosa.common.components.jsonrpc_proxy import JSONRPCException
 from qpid.messaging import uuid4
 
 from gosa.common.handler import IInterfaceHandler
 from gosa.common.event import EventMaker
+from gosa.common.json import dumps
 from gosa.common import Environment
 from gosa.common.utils import stripNs, N_
 from gosa.common.components.registry import PluginRegistry
 from gosa.common.components.amqp import EventConsumer
 from gosa.common.components import AMQPServiceProxy, Plugin
 from gosa.common.components.command import Command
+from gosa.common.components.scheduler.threadpool import ThreadPool
 from gosa.agent.ldap_utils import LDAPHandler
 from base64 import encodestring as encode
 from Crypto.Cipher import AES
@@ -43,19 +47,392 @@ STATUS_NEEDS_REMOVE_CONFIG = "R"
 STATUS_NEEDS_CONFIG = "c"
 STATUS_NEEDS_INSTALL = "N"
 
+VALID_STATUS = [STATUS_SYSTEM_ON, STATUS_LOCKED, STATUS_UPDATABLE,
+    STATUS_UPDATING, STATUS_INVENTORY, STATUS_CONFIGURING,
+    STATUS_INSTALLING, STATUS_VM_INITIALIZING, STATUS_WARNING,
+    STATUS_ERROR, STATUS_OCCUPIED, STATUS_BOOTING,
+    STATUS_NEEDS_INSTALL, STATUS_NEEDS_CONFIG,
+    STATUS_NEEDS_INITIAL_CONFIG, STATUS_NEEDS_REMOVE_CONFIG]
+
+
+class DeviceStatus(object):
+    """
+    In-memory table of the device status flags. It is filled by a single
+    paged search and changes are written back to LDAP every *interval*
+    seconds - several changes of the same device within this time result
+    in a single modification.
+
+    Devices which are not in the table yet are looked up on demand.
+    Changes done to ``deviceStatus`` by other means than this table are
+    not noticed until the next :meth:`load`.
+
+    =============== ============
+    Parameter       Description
+    =============== ============
+    interval        Seconds between writing the collected changes
+    page_size       Page size of the initial search
+    =============== ============
+    """
+    __status_re = re.compile(r"([+-].)")
+
+    def __init__(self, interval=5, page_size=500):
+        self.interval = interval
+        self.page_size = page_size
+        self.log = logging.getLogger(__name__)
+        self.lh = LDAPHandler.get_instance()
+
+        # device uuid -> [dn, flags, flags in LDAP or None]
+        self.__devices = {}
+        self.__dirty = set()
+        self.__lock = Lock()
+        self.__stopped = Event()
+        self.__writer = None
+
+    def start(self):
+        """
+        Start writing the collected changes in the background.
+        """
+        self.__writer = Thread(target=self.__write_loop, name="DeviceStatus")
+        self.__writer.setDaemon(True)
+        self.__writer.start()
+
+    def stop(self):
+        """
+        Stop the background writer and write the pending changes.
+        """
+        self.__stopped.set()
+        self.flush()
+
+    def load(self):
+        """
+        Load the status of all devices using a paged search.
+        """
+        devices = {}
+        page = ldap.controls.SimplePagedResultsControl(True, size=self.page_size, cookie='')
+
+        with self.lh.get_handle() as conn:
+            while True:
+                msgid = conn.search_ext(self.lh.get_base(), ldap.SCOPE_SUBTREE,
+                    "(&(objectClass=device)(deviceUUID=*))", ['deviceUUID', 'deviceStatus'],
+                    serverctrls=[page])
+                rtype, rdata, rmsgid, rctrls = conn.result3(msgid)
+
+                for dn, entry in rdata:
+                    if dn is not None:
+                        status = entry['deviceStatus'][0].strip("[]") if 'deviceStatus' in entry else None
+                        devices[entry['deviceUUID'][0]] = [dn, status or "", status]
+
+                cookie = None
+                for ctrl in rctrls:
+                    if ctrl.controlType == ldap.controls.SimplePagedResultsControl.controlType:
+                        cookie = ctrl.cookie
+
+                if not cookie:
+                    break
+
+                page.cookie = cookie
+
+        with self.__lock:
+            # Keep changes which are not written yet
+            for uuid in self.__dirty:
+                if uuid in devices and uuid in self.__devices:
+                    devices[uuid][1] = self.__devices[uuid][1]
+
+            self.__devices = devices
+
+        self.log.info("loaded status of %d devices" % len(devices))
+
+    def add(self, device_uuid, dn):
+        """
+        Add a new device without status to the table.
+        """
+        with self.__lock:
+            self.__devices[device_uuid] = [dn, "", None]
+
+    def get(self, device_uuid):
+        """
+        ``Return:`` the status flags of the device
+        """
+        return self.__get(device_uuid)[1]
+
+    def update(self, device_uuid, status):
+        """
+        Apply status changes like ``+O-B`` to the device.
+        """
+        changes = self.__status_re.findall(status)
+        for stat in changes:
+            if not stat[1] in VALID_STATUS:
+                raise ValueError("invalid status %s" % stat[1])
+
+        device = self.__get(device_uuid)
+
+        with self.__lock:
+            devstat = list(device[1])
+            for stat in changes:
+                if stat.startswith("+"):
+                    if not stat[1] in devstat:
+                        devstat.append(stat[1])
+                else:
+                    if stat[1] in devstat:
+                        devstat.remove(stat[1])
+
+            device[1] = "".join(devstat)
+            self.__dirty.add(device_uuid)
+
+    def flush(self):
+        """
+        Write the collected changes to LDAP.
+        """
+        with self.__lock:
+            if not self.__dirty:
+                return
+
+            changes = []
+            for uuid in self.__dirty:
+                device = self.__devices.get(uuid)
+
+                # Skip devices whose changes cancelled each other out
+                if device and device[1] != (device[2] or ""):
+                    changes.append((uuid, device[0], device[1], device[2]))
+
+            self.__dirty = set()
+
+        if not changes:
+            return
+
+        try:
+            conn = self.lh.get_connection()
+        except Exception:
+            # Keep the changes for the next run
+            with self.__lock:
+                self.__dirty.update(change[0] for change in changes)
+            raise
+
+        try:
+            for uuid, dn, status, current in changes:
+                devstat = "[" + status.encode('utf8') + "]"
+                try:
+                    if current is None:
+                        conn.modify_s(dn, [(ldap.MOD_ADD, "deviceStatus", [devstat])])
+                    else:
+                        conn.modify_s(dn, [(ldap.MOD_REPLACE, "deviceStatus", [devstat])])
+
+                except ldap.NO_SUCH_OBJECT:
+                    self.log.warning("device '%s' (%s) vanished" % (uuid, dn))
+                    with self.__lock:
+                        self.__devices.pop(uuid, None)
+                    continue
+
+                except ldap.LDAPError as e:
+                    self.log.error("failed to write status of device '%s': %s" % (uuid, str(e)))
+                    with self.__lock:
+                        self.__dirty.add(uuid)
+                    continue
+
+                with self.__lock:
+                    device = self.__devices.get(uuid)
+                    if device:
+                        device[2] = status
+        finally:
+            self.lh.free_connection(conn)
+
+        self.log.debug("wrote status of %d devices" % len(changes))
+
+    def __get(self, device_uuid):
+        device = self.__devices.get(device_uuid)
+        if device:
+            return device
+
+        with self.lh.get_handle() as conn:
+            res = conn.search_s(self.lh.get_base(), ldap.SCOPE_SUBTREE,
+                ldap.filter.filter_format("(&(objectClass=device)(deviceUUID=%s))", [str(device_uuid)]),
+                ['deviceStatus'])
+
+        if len(res) != 1:
+            raise ValueError("no device '%s' available" % device_uuid)
+
+        dn, entry = res[0]
+        status = entry['deviceStatus'][0].strip("[]") if 'deviceStatus' in entry else None
+
+        with self.__lock:
+            return self.__devices.setdefault(device_uuid, [dn, status or "", status])
+
+    def __write_loop(self):
+        while not self.__stopped.is_set():
+            self.__stopped.wait(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                self.log.exception("failed to write device status")
+
+
+class ClientRegistry(object):
+    """
+    Registry of the announced clients and the users logged in on them.
+
+    A reverse index allows to find the clients of a user without looking
+    at every client. Clients providing the same methods share one
+    capability description.
+    """
+
+    def __init__(self):
+        self.__lock = Lock()
+        self.__clients = {}
+        self.__sessions = {}
+        self.__user_index = {}
+
+        # capability key -> [capabilities, reference count]
+        self.__caps = {}
+
+    def add(self, client, name, caps, network, received=None):
+        """
+        Add or replace a client. Existing user sessions are kept.
+        """
+        key = tuple(sorted((method, info['path'], info['sig'], info['doc'])
+            for method, info in caps.iteritems()))
+
+        with self.__lock:
+            if client in self.__clients:
+                self.__release(self.__clients[client]['caps_key'])
+
+            entry = self.__caps.get(key)
+            if entry:
+                entry[1] += 1
+            else:
+                entry = self.__caps[key] = [caps, 1]
+
+            self.__clients[client] = {
+                'name': name,
+                'received': received or time.time(),
+                'caps': entry[0],
+                'caps_key': key,
+                'network': network}
+
+    def remove(self, client):
+        """
+        Remove a client together with its user sessions.
+
+        ``Return:`` True if the client has been known
+        """
+        with self.__lock:
+            self.__set_users(client, [])
+            info = self.__clients.pop(client, None)
+            if not info:
+                return False
+
+            self.__release(info['caps_key'])
+            return True
+
+    def touch(self, client, received=None):
+        """
+        Update the time we've heard of the client the last time.
+        """
+        with self.__lock:
+            if client in self.__clients:
+                self.__clients[client]['received'] = received or time.time()
+
+    def get(self, client):
+        """
+        ``Return:`` dict with *name*, *received*, *caps* and *network* of
+        the client or None
+        """
+        return self.__clients.get(client)
+
+    def list(self, offset=0, limit=None, name=None):
+        """
+        ``Return:`` list of (client, info) tuples ordered by name,
+        optionally filtered by a shell style name pattern
+        """
+        with self.__lock:
+            res = [(client, info) for client, info in self.__clients.iteritems()
+                if name is None or fnmatch.fnmatch(info['name'], name)]
+
+        res.sort(key=lambda c: (c[1]['name'], c[0]))
+        return res[offset:offset + limit if limit is not None else None]
+
+    def stale(self, max_age):
+        """
+        ``Return:`` list of clients we did not hear of for *max_age* seconds
+        """
+        limit = time.time() - max_age
+        with self.__lock:
+            return [client for client, info in self.__clients.iteritems() if info['received'] < limit]
+
+    def set_users(self, client, users):
+        """
+        Set the users logged in on a client.
+        """
+        with self.__lock:
+            self.__set_users(client, users)
+
+    def users_of(self, client):
+        """
+        ``Return:`` list of users logged in on the client
+        """
+        return list(self.__sessions.get(client, []))
+
+    def clients_of(self, user):
+        """
+        ``Return:`` list of clients the user is logged in on
+        """
+        return list(self.__user_index.get(user, []))
+
+    def sessions(self):
+        """
+        ``Return:`` dict of users, indexed by client
+        """
+        with self.__lock:
+            return dict((client, list(users)) for client, users in self.__sessions.iteritems())
+
+    def __set_users(self, client, users):
+        for user in self.__sessions.pop(client, []):
+            clients = self.__user_index[user]
+            clients.discard(client)
+            if not clients:
+                del self.__user_index[user]
+
+        if users:
+            self.__sessions[client] = users
+            for user in users:
+                self.__user_index.setdefault(user, set()).add(client)
+
+    def __release(self, key):
+        entry = self.__caps[key]
+        entry[1] -= 1
+        if not entry[1]:
+            del self.__caps[key]
+
+    def __contains__(self, client):
+        return client in self.__clients
+
+    def __len__(self):
+        return len(self.__clients)
+
 
 class ClientService(Plugin):
     """
     Plugin to register clients and expose their functionality
     to the users.
+
+    It is configured thru the ``[goto]`` section of your GOsa
+    configuration:
+
+    ===================== ============
+    Key                   Description
+    ===================== ============
+    machine-rdn           RDN of the container joined clients are placed in
+    status-flush-interval Seconds between writing collected device status changes
+    dispatch-worker       Number of client calls sent concurrently
+    dispatch-timeout      Seconds after which a client call fails
+    client-timeout        Seconds after which silent clients are checked and removed if they don't answer
+    client-sweep          Seconds between two checks for silent clients
+    ===================== ============
     """
     implements(IInterfaceHandler)
     _priority_ = 90
     _target_ = 'goto'
-    __client = {}
     __proxy = {}
-    __user_session = {}
-
+    __proxy_lock = Lock()
 
     def __init__(self):
         """
@@ -67,8 +444,17 @@ class ClientService(Plugin):
         self.log.info("initializing client service")
         self.env = env
         self.__cr = None
+        self.__clients = ClientRegistry()
+        self.__status = DeviceStatus(int(env.config.get("goto.status-flush-interval", default=5)),
+            int(env.config.get("ldap.page_size", default=500)))
+        self.__timeout = float(env.config.get("goto.dispatch-timeout", default=30))
+        self.__pool = ThreadPool(max_threads=int(env.config.get("goto.dispatch-worker", default=50)))
 
     def serve(self):
+        # Load the device status before the first events arrive
+        self.__status.load()
+        self.__status.start()
+
         # Add event processor
         amqp = PluginRegistry.getInstance('AMQPHandler')
         EventConsumer(self.env,
@@ -90,10 +476,15 @@ class ClientService(Plugin):
         timer.start()
         self.env.threads.append(timer)
 
+        # Let the scheduler remove outdated clients
+        sched = PluginRegistry.getInstance('SchedulerService').sched
+        sched.add_interval_job(self.sweep, seconds=int(self.env.config.get(
+            'goto.client-sweep', default=300)), tag='_internal')
+
     def __refresh(self):
         # Initially check if we need to ask for client caps or if there's someone
         # who knows...
-        if not self.__client:
+        if not len(self.__clients):
             nodes = self.__cr.getNodes()
             if not nodes:
                 return
@@ -112,22 +503,50 @@ class ClientService(Plugin):
                 #     ... load client capabilities and store them localy
                 raise Exception("getting client information from other nodes is not implmeneted!")
 
-        #TODO: register scheduler task to remove outdated clients
+    def sweep(self):
+        """
+        Check clients we did not hear of for *goto.client-timeout*
+        seconds and remove the ones which don't answer.
+        """
+        stale = self.__clients.stale(int(self.env.config.get('goto.client-timeout', default=3600)))
+        if not stale:
+            return
+
+        calls = [(client, "getMethods", (), {}) for client in stale]
+        for client, res in zip(stale, self.__dispatch_many(calls)):
+            if 'error' in res:
+                self.log.info("removing client '%s' - no answer" % client)
+                self.__remove_client(client)
+
+                # Like a ClientLeave, the system is not on anymore
+                try:
+                    self.systemSetStatus(client, "-O")
+                except ValueError as e:
+                    self.log.warning("failed to reset status of client '%s': %s" % (client, str(e)))
+            else:
+                self.__clients.touch(client)
 
     def stop(self):
-        pass
+        self.__status.stop()
+        self.__pool.shutdown(False)
 
     @Command(__help__=N_("List available clients."))
-    def getClients(self):
+    def getClients(self, offset=0, limit=None, name=None):
         """
-        List available domain clients.
+        List available domain clients, ordered by name.
+
+        ========= ================================
+        Parameter Description
+        ========= ================================
+        offset    Number of clients to skip
+        limit     Maximum number of clients to return
+        name      Shell style pattern the client name must match
+        ========= ================================
 
         ``Return:`` dict with name and timestamp informatio, indexed by UUID
         """
-        res = {}
-        for uuid, info in self.__client.iteritems():
-            res[uuid] = {'name':info['name'], 'received':info['received']}
-        return res
+        return dict((uuid, {'name': info['name'], 'received': info['received']})
+            for uuid, info in self.__clients.list(offset, limit, name))
 
     @Command(__help__=N_("Call method exposed by client."))
     def clientDispatch(self, client, method, *arg, **larg):
@@ -146,25 +565,74 @@ class ClientService(Plugin):
         """
 
         # Bail out if the client is not available
-        if not client in self.__client:
+        if not client in self.__clients:
             raise JSONRPCException("client '%s' not available" % client)
 
         # Generate tage queue name
         queue = '%s.client.%s' % (self.env.domain, client)
         self.log.debug("got client dispatch: '%s(%s)', sending to %s" % (method, arg, queue))
 
-        # client queue -> amqp rpc proxy
-        if not client in self.__proxy:
-            amqp = PluginRegistry.getInstance("AMQPHandler")
-            self.__proxy[client] = AMQPServiceProxy(amqp.url['source'], queue)
+        # client queue -> amqp rpc proxy, every proxy opens its own connection
+        # so don't let concurrent calls create more than one
+        proxy = self.__proxy.get(client)
+        if not proxy:
+            with self.__proxy_lock:
+                proxy = self.__proxy.get(client)
+                if not proxy:
+                    amqp = PluginRegistry.getInstance("AMQPHandler")
+                    proxy = self.__proxy[client] = AMQPServiceProxy(amqp.url['source'], queue,
+                        timeout=self.__timeout)
 
         # Call her to the moon...
-        methodCall = getattr(self.__proxy[client], method)
+        methodCall = getattr(proxy, method)
 
         # Do the call
         res = methodCall(*arg, **larg)
         return res
 
+    @Command(__help__=N_("Call method exposed by several clients."))
+    def clientDispatchMany(self, clients, method, *arg, **larg):
+        """
+        Dispatch a method on several clients concurrently. At most
+        *goto.dispatch-worker* calls are sent at once, every call fails
+        after *goto.dispatch-timeout* seconds.
+
+        ========= ================================
+        Parameter Description
+        ========= ================================
+        clients   List of device UUIDs
+        method    Method name to call
+        *         Method arguments
+        ========= ================================
+
+        ``Return:`` dict with either the *result* or the *error* of the
+        call, indexed by device UUID
+        """
+        calls = [(client, method, arg, larg) for client in set(clients)]
+        return dict(zip([c[0] for c in calls], self.__dispatch_many(calls)))
+
+    @Command(__help__=N_("Send call to clients without waiting for the results."))
+    def clientBroadcast(self, clients, method, *arg):
+        """
+        Send a method call to the clients using a **ClientDispatch**
+        event. Clients execute it if it is in their list of allowed
+        broadcast methods, but don't answer.
+
+        ========= ================================
+        Parameter Description
+        ========= ================================
+        clients   List of device UUIDs, empty for all clients
+        method    Method name to call
+        *         Method arguments
+        ========= ================================
+        """
+        e = EventMaker()
+        amqp = PluginRegistry.getInstance('AMQPHandler')
+        amqp.sendEvent(e.Event(e.ClientDispatch(
+            e.Method(method),
+            e.Arguments(dumps(list(arg))),
+            *[e.Target(client) for client in clients or []])))
+
     @Command(__help__=N_("Get the client Interface/IP/Netmask/Broadcast/MAC list."))
     def getClientNetInfo(self, client):
         """
@@ -179,11 +647,11 @@ class ClientService(Plugin):
 
         ``Return:`` dict with network information
         """
-        if not client in self.__client:
+        info = self.__clients.get(client)
+        if not info:
             return []
 
-        res = self.__client[client]['network']
-        return res
+        return info['network']
 
     @Command(__help__=N_("List available client methods for specified client."))
     def getClientMethods(self, client):
@@ -192,10 +660,11 @@ class ClientService(Plugin):
 
         ``Return:`` dict of client methods
         """
-        if not client in self.__client:
+        info = self.__clients.get(client)
+        if not info:
             return []
 
-        return self.__client[client]['caps']
+        return info['caps']
 
     @Command(__help__=N_("List user sessions per client"))
     def getUserSessions(self, client=None):
@@ -203,16 +672,16 @@ class ClientService(Plugin):
         TODO
         """
         if client:
-            return self.__user_session[client] if client in self.__user_session else []
+            return self.__clients.users_of(client)
 
-        return self.__user_session
+        return self.__clients.sessions()
 
     @Command(__help__=N_("List clients a user is logged in"))
     def getUserClients(self, user):
         """
         TODO
         """
-        return [client for client, users in self.__user_session.items() if user in users]
+        return self.__clients.clients_of(user)
 
     @Command(__help__=N_("Send synchronous notification message to user"))
     def notifyUser(self, users, title, message, timeout=10, level='normal', icon='dialog-information'):
@@ -224,88 +693,77 @@ class ClientService(Plugin):
             if type(users) != types.ListType:
                 users = [users]
 
+            calls = []
             for user in users:
                 for client in self.getUserClients(user):
-                    try:
-                        self.clientDispatch(client, "notify", user, title, message,
-                                timeout, level, icon)
-                    #pylint: disable=W0141
-                    except Exception:
-                        pass
+                    calls.append((client, "notify", (user, title, message,
+                        timeout, level, icon), {}))
+
+            for call, res in zip(calls, self.__dispatch_many(calls)):
+                if 'error' in res:
+                    self.log.debug("failed to notify '%s' on client '%s': %s" % (call[2][0], call[0], res['error']))
 
         else:
             # Notify all users
-            for client in self.__client.keys():
-                try:
-                    self.clientDispatch(client, "notify_all", title, message,
-                            timeout, level, icon)
-                #pylint: disable=W0141
-                except Exception:
-                    pass
+            self.clientBroadcast(None, "notify_all", title, message,
+                    timeout, level, icon)
 
-    @Command(__help__=N_("Set system status"))
-    def systemGetStatus(self, device_uuid):
+    def __dispatch_many(self, calls):
         """
-        TODO
+        Run the client calls on the worker pool.
+
+        ``Return:`` list of result dicts in the order of *calls*
         """
-        lh = LDAPHandler.get_instance()
-        fltr = "deviceUUID=%s" % device_uuid
+        results = [None] * len(calls)
+        done = Semaphore(0)
 
-        with lh.get_handle() as conn:
-            res = conn.search_s(lh.get_base(), ldap.SCOPE_SUBTREE,
-                "(&(objectClass=device)(%s))" % fltr, ['deviceStatus'])
+        def run(idx, client, method, arg, larg):
+            try:
+                results[idx] = {'result': self.clientDispatch(client, method, *arg, **larg)}
+            #pylint: disable=W0703
+            except Exception as e:
+                results[idx] = {'error': str(e)}
+            finally:
+                done.release()
 
-            if len(res) != 1:
-                raise ValueError("no device '%s' available" % device_uuid)
+        for idx, call in enumerate(calls):
+            self.__pool.submit(run, idx, *call)
+        for call in calls:
+            done.acquire()
+
+        return results
+
+    @Command(__help__=N_("Get system status"))
+    def systemGetStatus(self, device_uuid):
+        """
+        Return the status flags of a device, including changes which
+        are not written to LDAP yet.
 
-            return res[0][1]["deviceStatus"][0]
+        =========== ================================
+        Parameter   Description
+        =========== ================================
+        device_uuid Device UUID of the client
+        =========== ================================
 
-        return ""
+        ``Return:`` status flags like ``[OB]`` or an empty string
+        """
+        status = self.__status.get(device_uuid)
+        return "[" + status + "]" if status else ""
 
     @Command(__help__=N_("Set system status"))
     def systemSetStatus(self, device_uuid, status):
         """
-        TODO
+        Set or remove status flags of a device. The change is written to
+        LDAP in the background.
+
+        =========== ================================
+        Parameter   Description
+        =========== ================================
+        device_uuid Device UUID of the client
+        status      Flags to set or remove, i.e. ``+O-B``
+        =========== ================================
         """
-        # Check params
-        valid = [STATUS_SYSTEM_ON, STATUS_LOCKED, STATUS_UPDATABLE,
-            STATUS_UPDATING, STATUS_INVENTORY, STATUS_CONFIGURING,
-            STATUS_INSTALLING, STATUS_VM_INITIALIZING, STATUS_WARNING,
-            STATUS_ERROR, STATUS_OCCUPIED, STATUS_BOOTING,
-            STATUS_NEEDS_INSTALL, STATUS_NEEDS_CONFIG,
-            STATUS_NEEDS_INITIAL_CONFIG, STATUS_NEEDS_REMOVE_CONFIG]
-
-        # Write to LDAP
-        lh = LDAPHandler.get_instance()
-        fltr = "deviceUUID=%s" % device_uuid
-
-        with lh.get_handle() as conn:
-            res = conn.search_s(lh.get_base(), ldap.SCOPE_SUBTREE,
-                "(&(objectClass=device)(%s))" % fltr, ['deviceStatus'])
-
-            if len(res) != 1:
-                raise ValueError("no device '%s' available" % device_uuid)
-
-            devstat = res[0][1]['deviceStatus'][0] if 'deviceStatus' in res[0][1] else ""
-            is_new = not bool(devstat)
-            devstat = list(devstat.strip("[]"))
-
-            r = re.compile(r"([+-].)")
-            for stat in r.findall(status):
-                if not stat[1] in valid:
-                    raise ValueError("invalid status %s" % stat[1])
-                if stat.startswith("+"):
-                    if not stat[1] in devstat:
-                        devstat.append(stat[1])
-                else:
-                    if stat[1] in devstat:
-                        devstat.remove(stat[1])
-
-            devstat = "[" + "".join(devstat).encode('utf8') + "]"
-            if is_new:
-                conn.modify(res[0][0], [(ldap.MOD_ADD, "deviceStatus", [devstat])])
-            else:
-                conn.modify(res[0][0], [(ldap.MOD_REPLACE, "deviceStatus", [devstat])])
+        self.__status.update(device_uuid, status)
 
     @Command(needsUser=True,__help__=N_("Join a client to the GOsa system."))
     def joinClient(self, user, device_uuid, mac, info=None):
@@ -406,6 +864,7 @@ class ClientService(Plugin):
                 default="ou=systems"), base])
             conn.add_s(dn, record)
 
+        self.__status.add(cn, dn)
         self.log.info("UUID '%s' joined as %s" % (device_uuid, dn))
         return [key, cn]
 
@@ -433,15 +892,17 @@ class ClientService(Plugin):
 
     def _handleUserSession(self, data):
         data = data.UserSession
+        client = str(data.Id)
         if hasattr(data.User, 'Name'):
-            self.__user_session[str(data.Id)] = map(str, data.User.Name)
-            self.systemSetStatus(str(data.Id), "+B")
+            users = map(str, data.User.Name)
+            self.systemSetStatus(client, "+B")
         else:
-            self.__user_session[str(data.Id)] = []
-            self.systemSetStatus(str(data.Id), "-B")
+            users = []
+            self.systemSetStatus(client, "-B")
 
-        self.log.debug("updating client '%s' user session: %s" % (data.Id,
-                ','.join(self.__user_session[str(data.Id)])))
+        self.__clients.set_users(client, users)
+        self.__clients.touch(client)
+        self.log.debug("updating client '%s' user session: %s" % (client, ','.join(users)))
 
     def _handleClientAnnounce(self, data):
         data = data.ClientAnnounce
@@ -450,9 +911,10 @@ class ClientService(Plugin):
         self.systemSetStatus(client, "+O")
 
         # Remove remaining proxy values for this client
-        if client in self.__proxy:
-            self.__proxy[client].close()
-            del self.__proxy[client]
+        with self.__proxy_lock:
+            proxy = self.__proxy.pop(client, None)
+        if proxy:
+            proxy.close()
 
         # Assemble caps
         caps = {}
@@ -472,16 +934,8 @@ class ClientService(Plugin):
                 'Netmask': interface.Netmask.text,
                 'Broadcast': interface.Broadcast.text}
 
-        # Add recieve time to be able to sort out dead nodes
-        t = datetime.datetime.utcnow()
-        info = {
-            'name': data.Name.text,
-            'received': time.mktime(t.timetuple()),
-            'caps': caps,
-            'network': network
-        }
-
-        self.__client[data.Id.text] = info
+        # The registry adds the receive time to be able to sort out dead nodes
+        self.__clients.add(data.Id.text, data.Name.text, caps, network)
 
         # Handle pending "P"repare actions for that client
         if "P" in self.systemGetStatus(client):
@@ -496,13 +950,12 @@ class ClientService(Plugin):
         client = data.Id.text
         self.log.info("client '%s' is leaving" % client)
         self.systemSetStatus(client, "-O")
+        self.__remove_client(client)
 
-        if client in self.__client:
-            del self.__client[client]
-
-        if client in self.__proxy:
-            self.__proxy[client].close()
-            del self.__proxy[client]
+    def __remove_client(self, client):
+        self.__clients.remove(client)
 
-        if client in self.__user_session:
-            del self.__user_session[client]
+        with self.__proxy_lock:
+            proxy = self.__proxy.pop(client, None)
+        if proxy:
+            proxy.close()
@@ -0,0 +1,62 @@
+import time
+import unittest
+from gosa.agent.plugins.goto.client_service import ClientRegistry
+
+
+def caps(*methods):
+    return dict((m, {'path': 'x.%s' % m, 'sig': '()', 'doc': m}) for m in methods)
+
+
+class TestClientRegistry(unittest.TestCase):
+
+    def test_sessions(self):
+        reg = ClientRegistry()
+        reg.add("c1", "host1", caps("notify"), {})
+        reg.add("c2", "host2", caps("notify"), {})
+
+        reg.set_users("c1", ["alice", "bob"])
+        reg.set_users("c2", ["alice"])
+        self.assertEqual(sorted(reg.clients_of("alice")), ["c1", "c2"])
+        self.assertEqual(reg.clients_of("bob"), ["c1"])
+        self.assertEqual(reg.users_of("c1"), ["alice", "bob"])
+
+        reg.set_users("c1", [])
+        self.assertEqual(reg.clients_of("alice"), ["c2"])
+        self.assertEqual(reg.clients_of("bob"), [])
+
+        reg.remove("c2")
+        self.assertEqual(reg.clients_of("alice"), [])
+        self.assertEqual(reg.sessions(), {})
+        self.assertFalse("c2" in reg)
+
+    def test_shared_caps(self):
+        reg = ClientRegistry()
+        reg.add("c1", "host1", caps("notify", "reboot"), {})
+        reg.add("c2", "host2", caps("reboot", "notify"), {})
+        reg.add("c3", "host3", caps("notify"), {})
+
+        self.assertTrue(reg.get("c1")['caps'] is reg.get("c2")['caps'])
+        self.assertFalse(reg.get("c1")['caps'] is reg.get("c3")['caps'])
+
+    def test_list(self):
+        reg = ClientRegistry()
+        for i in range(10):
+            reg.add("c%d" % i, "host%02d" % (9 - i), {}, {})
+
+        res = reg.list(2, 3)
+        self.assertEqual([info['name'] for client, info in res], ["host02", "host03", "host04"])
+        self.assertEqual([c for c, i in reg.list(name="host0[12]")], ["c8", "c7"])
+        self.assertEqual(len(reg.list()), 10)
+
+    def test_stale(self):
+        reg = ClientRegistry()
+        reg.add("c1", "host1", {}, {}, time.time() - 100)
+        reg.add("c2", "host2", {}, {})
+        self.assertEqual(reg.stale(50), ["c1"])
+
+        reg.touch("c1")
+        self.assertEqual(reg.stale(50), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+The *NodeRouter* is used by the :class:`gosa.agent.command.CommandRegistry`
+to find the node a command should be forwarded to, if it can't be
+processed locally.
+
+It keeps an index of the nodes providing each method and combines the
+information reported by the ``NodeStatus`` events with the latency and
+failure rate observed for the calls sent to a node. Of all live providers,
+two are picked by random and the one with the lower cost wins - the
+*power of two choices* avoids that all agents send their calls to the same
+node while it's still reported as the least loaded one.
+
+Nodes failing several times in a row are skipped for a while (the circuit
+is *open*). After that time, a single call is let thru to check if the node
+is healthy again.
+
+It is configured thru the ``[core]`` section of your GOsa configuration:
+
+======================= ============
+Key                     Description
+======================= ============
+node-timeout            Seconds after which a node without status update is considered dead
+route-failure-threshold Failures in a row that open the circuit of a node
+route-reset-timeout     Seconds the circuit of a failing node is kept open
+======================= ============
+
+------
+"""
+import time
+import random
+from threading import Lock
+
+
+class NodeHealth(object):
+    """
+    Observed health of a node.
+    """
+    __slots__ = ('calls', 'failures', 'latency', 'failure_rate',
+        'consecutive', 'open_until', 'trial')
+
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.latency = None
+        self.failure_rate = 0.0
+        self.consecutive = 0
+        self.open_until = 0
+        self.trial = False
+
+
+class NodeRouter(object):
+    """
+    Routing information and node selection.
+
+    ================== ============
+    Parameter          Description
+    ================== ============
+    node_timeout       Seconds after which a node without status update is considered dead
+    failure_threshold  Failures in a row that open the circuit of a node
+    reset_timeout      Seconds the circuit of a failing node is kept open
+    alpha              Weight of new samples for the moving averages
+    ================== ============
+    """
+
+    #: Latency assumed for nodes we've no information about
+    default_latency = 0.1
+
+    def __init__(self, node_timeout=60, failure_threshold=5, reset_timeout=30, alpha=0.2):
+        self.node_timeout = node_timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.alpha = alpha
+
+        self.__lock = Lock()
+        self.__index = {}
+        self.__status = {}
+        self.__health = {}
+
+    def add_provider(self, method, node):
+        """
+        Register *node* as a provider of *method*.
+        """
+        with self.__lock:
+            self.__index.setdefault(method, set()).add(node)
+
+    def update_status(self, node, load, latency, workers):
+        """
+        Update the status of a node, as reported by its ``NodeStatus``
+        event.
+        """
+        with self.__lock:
+            self.__status[node] = (load, latency, workers, time.time())
+
+    def remove_node(self, node):
+        """
+        Forget everything about *node*.
+        """
+        with self.__lock:
+            for providers in self.__index.values():
+                providers.discard(node)
+
+            self.__status.pop(node, None)
+            self.__health.pop(node, None)
+
+    def providers(self, method):
+        """
+        ``Return:`` list of live nodes providing *method*
+        """
+        now = time.time()
+        with self.__lock:
+            return [node for node in self.__index.get(method, ())
+                if self.__alive(node, now)]
+
+    def select(self, method, exclude=None):
+        """
+        Choose a node to send a call of *method* to.
+
+        ================== ============
+        Parameter          Description
+        ================== ============
+        method             Method name
+        exclude            Optional list of nodes not to be used
+        ================== ============
+
+        ``Return:`` node name or None if there's no usable provider
+        """
+        now = time.time()
+        with self.__lock:
+            candidates = [node for node in self.__index.get(method, ())
+                if self.__alive(node, now) and self.__closed(node, now)
+                and (not exclude or not node in exclude)]
+
+            if not candidates:
+                return None
+
+            if len(candidates) == 1:
+                node = candidates[0]
+            else:
+                a, b = random.sample(candidates, 2)
+                node = a if self.__cost(a) <= self.__cost(b) else b
+
+            # Let only one call pass to a node whose circuit was open
+            health = self.__health.get(node)
+            if health and health.open_until:
+                health.trial = True
+                health.open_until = now + self.reset_timeout
+
+            return node
+
+    def record(self, node, duration, failed=False):
+        """
+        Record the outcome of a call sent to *node*.
+
+        ================== ============
+        Parameter          Description
+        ================== ============
+        node               Node name
+        duration           Seconds the call took
+        failed             True if the node did not answer properly
+        ================== ============
+        """
+        with self.__lock:
+            health = self.__health.get(node)
+            if not health:
+                health = self.__health[node] = NodeHealth()
+
+            health.calls += 1
+            health.failure_rate += self.alpha * ((1.0 if failed else 0.0) - health.failure_rate)
+
+            if failed:
+                health.failures += 1
+                health.consecutive += 1
+
+                if health.trial or health.consecutive >= self.failure_threshold:
+                    health.open_until = time.time() + self.reset_timeout
+
+            else:
+                if health.latency is None:
+                    health.latency = duration
+                else:
+                    health.latency += self.alpha * (duration - health.latency)
+
+                health.consecutive = 0
+                health.open_until = 0
+
+            health.trial = False
+
+    def get_statistics(self):
+        """
+        ``Return:`` dict of node routing information, indexed by node
+        """
+        now = time.time()
+        res = {}
+        with self.__lock:
+            for node in set(self.__status.keys() + self.__health.keys()):
+                health = self.__health.get(node) or NodeHealth()
+                res[node] = {
+                    'alive': self.__alive(node, now),
+                    'circuit': 'open' if not self.__closed(node, now) else
+                        ('half-open' if health.open_until else 'closed'),
+                    'cost': self.__cost(node),
+                    'latency': health.latency,
+                    'failure_rate': health.failure_rate,
+                    'calls': health.calls,
+                    'failures': health.failures}
+
+        return res
+
+    def __alive(self, node, now):
+        status = self.__status.get(node)
+        return status is not None and now - status[3] < self.node_timeout
+
+    def __closed(self, node, now):
+        health = self.__health.get(node)
+        if not health or not health.open_until:
+            return True
+
+        # Half open: give it a try unless there's already one running
+        return health.open_until <= now and not health.trial
+
+    def __cost(self, node):
+        """
+        Estimated cost of a call: the expected latency scaled by the load
+        per worker and the chance to fail.
+        """
+        load, latency, workers = self.__status.get(node, (0.0, 0.0, 1, 0))[:3]
+        health = self.__health.get(node)
+
+        success = 1.0
+        if health:
+            success = max(1.0 - health.failure_rate, 0.05)
+            if health.latency is not None:
+                latency = health.latency
+
+        if not latency:
+            latency = self.default_latency
+
+        return latency * (1.0 + load / max(workers, 1)) / success
@@ -37,6 +37,19 @@ from gosa.common.components.amqp import EventConsumer
 class SchedulerService(Plugin):
     """
     The scheduler service provider.
+
+    It is configured thru the ``[scheduler]`` section of your GOsa
+    configuration:
+
+    =============== ============
+    Key             Description
+    =============== ============
+    database        Database URL of the shared job store
+    gracetime       Seconds a job of another node may be overdue before it gets migrated
+    flush-interval  Seconds between writing the collected job updates, 0 writes them immediately
+    foreign-jobs    *all* to load all jobs, *due* to load only other nodes' jobs due within *foreign-window*
+    foreign-window  Seconds, see *foreign-jobs*
+    =============== ============
     """
 
     implements(IInterfaceHandler)
@@ -52,9 +65,13 @@ class SchedulerService(Plugin):
         self.env = env
 
         self.sched = Scheduler(origin=self.env.id)
-        self.sched.add_jobstore(SQLAlchemyJobStore(
+        self.__store = SQLAlchemyJobStore(
             engine=env.getDatabaseEngine('scheduler'),
-            tablename='scheduler_jobs'), 'db')
+            tablename='scheduler_jobs',
+            flush_interval=int(env.config.get('scheduler.flush-interval', default=5)),
+            origin=self.env.id if env.config.get('scheduler.foreign-jobs', default='all') == 'due' else None,
+            foreign_window=int(env.config.get('scheduler.foreign-window', default=120)))
+        self.sched.add_jobstore(self.__store, 'db')
 
     def serve(self):
         """
@@ -84,15 +101,20 @@ class SchedulerService(Plugin):
     def stop(self):
         """ Stop scheduler service. """
         self.sched.shutdown()
+        self.__store.close()
 
     def migrate(self):
         self.log.debug("scheduler: looking for stale jobs")
+
+        # Pick up job changes of other nodes - only changed rows are read
+        self.sched.refresh()
+
         grace = datetime.now() + timedelta(seconds=int(self.env.config.get('scheduler.gracetime', default='30')))
         count = 0
 
         # Find jobs that are expired for a defined grace time.
-        for job in self.sched.get_jobs():
-            if job.origin != self.env.id and job.next_run_time and job.next_run_time < grace:
+        for job in self.sched.get_due_jobs(grace):
+            if job.origin != self.env.id:
                 self.sched.migrate_job(job)
                 count += 1
 
@@ -127,7 +149,15 @@ class SchedulerService(Plugin):
         """
         res = {}
 
-        for job in self.sched.get_jobs():
+        # Use the scheduler indexes to narrow down the jobs if possible
+        if fltr and 'tag' in fltr:
+            jobs = self.sched.get_jobs_by_tag(fltr['tag'])
+        elif fltr and 'owner' in fltr:
+            jobs = self.sched.get_jobs_by_owner(fltr['owner'])
+        else:
+            jobs = self.sched.get_jobs()
+
+        for job in jobs:
             job_dict = dict([(key, getattr(job, key)) for key in [
                 'misfire_grace_time',
                 'coalesce',
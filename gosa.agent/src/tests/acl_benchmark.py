@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark for the ACL resolver. It creates 10.000 ACL entries spread over
+a number of bases and runs 100.000 checks against them - once with an
+empty decision cache for every check and once with the cache enabled.
+
+Run it using::
+
+    $ python acl_benchmark.py
+"""
+import os
+import time
+import random
+from gosa.agent.acl import ACL, ACLSet, ACLResolver
+from gosa.common import Environment
+
+Environment.reset()
+Environment.config = os.path.join(os.path.dirname(os.path.realpath(__file__)), "test.conf")
+Environment.noargs = True
+
+ACL_COUNT = 10000
+CHECK_COUNT = 100000
+BASE_COUNT = 100
+USER_COUNT = 500
+
+
+def setup(resolver):
+    base = resolver.base
+    bases = ["ou=unit%d,%s" % (i, base) for i in range(BASE_COUNT)]
+
+    # Spread the ACL entries over the bases
+    for i, b in enumerate(bases):
+        aclset = ACLSet(b)
+        for n in range(ACL_COUNT / BASE_COUNT):
+            acl = ACL(scope=random.choice([ACL.ONE, ACL.SUB]))
+            acl.set_members([u"user%d" % random.randint(0, USER_COUNT), u"^admin[0-9]+$"])
+            acl.add_action("org.gosa.#.unit%d.attr%d" % (i, n), "rws")
+            acl.add_action("org.gosa.*.test%d" % n, "r")
+            acl.set_priority(n)
+            aclset.add(acl)
+        resolver.add_acl_set(aclset)
+
+    # Prepare the check requests - some of them are repeated to reflect
+    # what is happening when objects are opened by the same users.
+    requests = []
+    for i in range(CHECK_COUNT / 10):
+        unit = random.randint(0, BASE_COUNT - 1)
+        requests.append((u"user%d" % random.randint(0, USER_COUNT),
+            "org.gosa.factory.unit%d.attr%d" % (unit, random.randint(0, 100)),
+            random.choice(["r", "w", "rw"]),
+            "cn=entry%d,%s" % (random.randint(0, 50), bases[unit])))
+
+    return requests * 10
+
+
+def run(resolver, requests, cached):
+    resolver.cache_size = ACLResolver.cache_size if cached else 0
+    resolver.invalidate_cache()
+
+    start = time.time()
+    for user, topic, acls, base in requests:
+        resolver.check(user, topic, acls, base=base)
+
+    return time.time() - start
+
+
+if __name__ == '__main__':
+    env = Environment.getInstance()
+    resolver = ACLResolver()
+    resolver.clear()
+
+    start = time.time()
+    requests = setup(resolver)
+    print "Created %d ACL entries in %.2fs" % (ACL_COUNT, time.time() - start)
+
+    uncached = run(resolver, requests, False)
+    print "%d checks without decision cache: %.2fs (%.1f checks/s)" % (CHECK_COUNT, uncached, CHECK_COUNT / uncached)
+
+    cached = run(resolver, requests, True)
+    print "%d checks with decision cache:    %.2fs (%.1f checks/s)" % (CHECK_COUNT, cached, CHECK_COUNT / cached)
@@ -490,6 +490,44 @@ class TestACLResolver(unittest.TestCase):
         self.assertFalse(self.resolver.check('tester1', 'com.gosa.factory', 'r', base=base),
                 "ACL scope ONE is not resolved correclty! The user should not be able to read, but he can!")
 
+    def test_cache_invalidation(self):
+        """
+        This test checks that cached ACL decisions are dropped when the rule set changes.
+        """
+
+        # Create acls with scope SUB
+        base = self.ldap_base
+        aclset = ACLSet(base)
+        acl = ACL(scope=ACL.SUB)
+        acl.set_members([u'tester1'])
+        acl.add_action('com.gosa.factory', 'r')
+        aclset.add(acl)
+        self.resolver.add_acl_set(aclset)
+
+        # Fill the cache with a positive and a negative decision
+        self.assertTrue(self.resolver.check('tester1', 'com.gosa.factory', 'r', base=base))
+        self.assertFalse(self.resolver.check('tester1', 'com.gosa.factory', 'w', base=base))
+        self.assertTrue(self.resolver.check('tester1', 'com.gosa.factory', 'r', base=base))
+        self.assertEqual(self.resolver.get_cache_info()['size'], 2,
+                "ACL decisions are not cached!")
+
+        # Modify the actions, the cached decision must not be used anymore
+        acl.clear_actions()
+        acl.add_action('com.gosa.factory', 'rw')
+        self.assertTrue(self.resolver.check('tester1', 'com.gosa.factory', 'w', base=base),
+                "ACL cache is not invalidated! The user should be able to write, but he cannot!")
+
+        # Modify the members
+        acl.set_members([u'tester2'])
+        self.assertFalse(self.resolver.check('tester1', 'com.gosa.factory', 'r', base=base),
+                "ACL cache is not invalidated! The user should not be able to read, but he can!")
+
+        # Remove the set
+        self.assertTrue(self.resolver.check('tester2', 'com.gosa.factory', 'r', base=base))
+        self.resolver.remove_aclset_by_base(base)
+        self.assertFalse(self.resolver.check('tester2', 'com.gosa.factory', 'r', base=base),
+                "ACL cache is not invalidated! The user should not be able to read, but he can!")
+
 
 if __name__ == '__main__':
     unittest.main()
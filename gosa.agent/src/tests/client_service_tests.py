@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+import re
+import time
+import logging
+import ldap
+import ldap.controls
+import unittest
+from contextlib import contextmanager
+from gosa.agent.ldap_utils import LDAPPoolTimeout
+from gosa.agent.plugins.goto import client_service
+from gosa.common.components.scheduler.threadpool import ThreadPool
+from gosa.agent.plugins.goto.client_service import DeviceStatus, ClientService, ClientRegistry
+
+
+class Directory(object):
+    """
+    LDAPHandler and connection of a directory holding devices.
+    """
+
+    def __init__(self):
+        self.devices = {}
+        self.modified = []
+        self.error = None
+        self.available = True
+        self.connections = 0
+
+    def add(self, uuid, status=None):
+        dn = "cn=%s,ou=systems,dc=example,dc=net" % uuid
+        self.devices[dn] = {'deviceUUID': [uuid]}
+        if status is not None:
+            self.devices[dn]['deviceStatus'] = [status]
+
+        return dn
+
+    def get_instance(self):
+        return self
+
+    def get_base(self):
+        return "dc=example,dc=net"
+
+    def get_connection(self):
+        if not self.available:
+            raise LDAPPoolTimeout("no free LDAP connection available")
+
+        self.connections += 1
+        return self
+
+    def free_connection(self, conn):
+        self.connections -= 1
+
+    @contextmanager
+    def get_handle(self):
+        conn = self.get_connection()
+        try:
+            yield conn
+        finally:
+            self.free_connection(conn)
+
+    def search_ext(self, base, scope, fltr, attrs, serverctrls):
+        self.page = serverctrls[0]
+        return 1
+
+    def result3(self, msgid):
+        dns = sorted(self.devices)
+        start = int(self.page.cookie or 0)
+        end = start + self.page.size
+        ctrl = ldap.controls.SimplePagedResultsControl(True, size=self.page.size,
+            cookie=str(end) if end < len(dns) else '')
+
+        return ldap.RES_SEARCH_RESULT, [(dn, dict(self.devices[dn])) for dn in dns[start:end]], msgid, [ctrl]
+
+    def search_s(self, base, scope, fltr, attrs):
+        uuid = re.search(r"\(deviceUUID=([^)]*)\)", fltr).group(1)
+        return [(dn, dict(entry)) for dn, entry in self.devices.iteritems() if entry['deviceUUID'] == [uuid]]
+
+    def modify_s(self, dn, mod_attrs):
+        if self.error:
+            raise self.error
+
+        if not dn in self.devices:
+            raise ldap.NO_SUCH_OBJECT({'desc': "No such object"})
+
+        for op, attr, values in mod_attrs:
+            if op == ldap.MOD_ADD and attr in self.devices[dn]:
+                raise ldap.TYPE_OR_VALUE_EXISTS({'desc': "Type or value exists"})
+
+            self.devices[dn][attr] = values
+
+        self.modified.append((dn, mod_attrs))
+
+
+class TestDeviceStatus(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = Directory()
+        self.a = self.directory.add("a", "[O]")
+        self.b = self.directory.add("b")
+        self.c = self.directory.add("c", "[]")
+
+        self.handler = client_service.LDAPHandler
+        client_service.LDAPHandler = self.directory
+
+        # Write manually, load in several pages
+        self.status = DeviceStatus(interval=3600, page_size=2)
+        self.status.load()
+
+    def tearDown(self):
+        client_service.LDAPHandler = self.handler
+        self.assertEqual(self.directory.connections, 0)
+
+    def stored(self, dn):
+        return self.directory.devices[dn].get('deviceStatus')
+
+    def test_load(self):
+        self.assertEqual([self.status.get(uuid) for uuid in "abc"], ["O", "", ""])
+
+        # Unknown devices are looked up
+        self.directory.add("d", "[B]")
+        self.assertEqual(self.status.get("d"), "B")
+        self.assertRaises(ValueError, self.status.get, "e")
+
+        self.status.add("e", self.directory.add("e"))
+        self.assertEqual(self.status.get("e"), "")
+        self.assertRaises(ValueError, self.status.update, "a", "+X")
+
+    def test_coalesce(self):
+        # Changes which cancel each other out are not written
+        self.status.update("a", "-O")
+        self.status.update("a", "+O")
+        self.status.update("b", "+B-B")
+        self.status.flush()
+        self.assertEqual(self.directory.modified, [])
+
+        # Several changes result in a single modification
+        self.status.update("a", "+B")
+        self.status.update("a", "-O+W")
+        self.assertEqual(self.status.get("a"), "BW")
+        self.status.flush()
+        self.assertEqual(self.directory.modified, [(self.a, [(ldap.MOD_REPLACE, "deviceStatus", ["[BW]"])])])
+
+    def test_modify(self):
+        # The attribute is added to devices without status
+        self.status.update("b", "+O")
+        self.status.update("c", "+O")
+        self.status.flush()
+        self.assertEqual(sorted(self.directory.modified), [
+            (self.b, [(ldap.MOD_ADD, "deviceStatus", ["[O]"])]),
+            (self.c, [(ldap.MOD_REPLACE, "deviceStatus", ["[O]"])])])
+
+        # ... and replaced once it has been written
+        self.status.update("b", "-O")
+        self.status.flush()
+        self.assertEqual(self.directory.modified[-1], (self.b, [(ldap.MOD_REPLACE, "deviceStatus", ["[]"])]))
+        self.assertEqual(self.stored(self.b), ["[]"])
+
+    def test_retry(self):
+        self.status.update("a", "+B")
+        self.status.update("b", "+B")
+
+        # Failed modifications are written with the next flush
+        self.directory.error = ldap.SERVER_DOWN({'desc': "Can't contact LDAP server"})
+        self.status.flush()
+        self.assertEqual(self.stored(self.a), ["[O]"])
+
+        # Changes are kept if there's no connection available
+        self.directory.error = None
+        self.directory.available = False
+        self.assertRaises(LDAPPoolTimeout, self.status.flush)
+
+        self.directory.available = True
+        self.status.flush()
+        self.assertEqual(self.stored(self.a), ["[OB]"])
+        self.assertEqual(self.stored(self.b), ["[B]"])
+
+        self.status.flush()
+        self.assertEqual(len(self.directory.modified), 2)
+
+    def test_vanished(self):
+        self.status.update("a", "+B")
+        self.status.update("b", "+B")
+        del self.directory.devices[self.a]
+        self.status.flush()
+
+        # The device is dropped, the others are written
+        self.assertEqual(self.stored(self.b), ["[B]"])
+        self.assertRaises(ValueError, self.status.get, "a")
+
+        self.status.flush()
+        self.assertEqual(len(self.directory.modified), 1)
+
+    def test_reload(self):
+        self.status.update("a", "+B")
+        self.directory.devices[self.a]['deviceStatus'] = ["[OL]"]
+        self.directory.devices[self.b]['deviceStatus'] = ["[W]"]
+        self.status.load()
+
+        # Changes which are not written yet are kept
+        self.assertEqual(self.status.get("a"), "OB")
+        self.assertEqual(self.status.get("b"), "W")
+
+        self.status.flush()
+        self.assertEqual(self.directory.modified, [(self.a, [(ldap.MOD_REPLACE, "deviceStatus", ["[OB]"])])])
+
+    def test_stop(self):
+        self.status.start()
+        self.status.update("b", "+O")
+        self.status.stop()
+        self.assertEqual(self.stored(self.b), ["[O]"])
+
+
+class Env(object):
+    domain = "org.gosa"
+
+
+class Registry(object):
+    url = {'source': "amqp://localhost"}
+
+    @staticmethod
+    def getInstance(name):
+        return Registry
+
+
+class Proxy(object):
+    """
+    AMQPServiceProxy replacement, the calls are answered by *answers*.
+    """
+    created = []
+    answers = {}
+
+    def __init__(self, url, queue, timeout=None):
+        # Opening the connection takes a while
+        time.sleep(0.05)
+        self.client = queue.rsplit(".", 1)[1]
+        self.timeout = timeout
+        Proxy.created.append(self.client)
+
+    def __getattr__(self, name):
+        return lambda *arg: Proxy.answers[self.client](name, *arg)
+
+    def close(self):
+        pass
+
+
+def answer(delay, error=None):
+    def call(method, *arg):
+        time.sleep(delay)
+        if error:
+            raise error
+
+        return [method] + list(arg)
+
+    return call
+
+
+class TestClientDispatch(unittest.TestCase):
+
+    def setUp(self):
+        self.service = ClientService.__new__(ClientService)
+        self.service.env = Env()
+        self.service.log = logging.getLogger(__name__)
+        self.service._ClientService__timeout = 0.5
+        self.service._ClientService__pool = ThreadPool(max_threads=4)
+        self.service._ClientService__clients = ClientRegistry()
+        for client in ["c1", "c2", "c3", "c4"]:
+            self.service._ClientService__clients.add(client, client, {}, {})
+
+        self.patched = client_service.PluginRegistry, client_service.AMQPServiceProxy
+        client_service.PluginRegistry, client_service.AMQPServiceProxy = Registry, Proxy
+        Proxy.created = []
+
+    def tearDown(self):
+        client_service.PluginRegistry, client_service.AMQPServiceProxy = self.patched
+        ClientService._ClientService__proxy.clear()
+        self.service._ClientService__pool.shutdown()
+
+    def test_dispatch_many(self):
+        Proxy.answers = {
+            "c1": answer(0.2),
+            "c2": answer(0, Exception("failed")),
+            "c3": answer(0),
+            "c4": answer(0.5, Exception("timeout"))}
+
+        start = time.time()
+        res = self.service.clientDispatchMany(["c1", "c2", "c3", "c4", "c5", "c1"], "getMethods", 1)
+
+        # Every client gets a single call and failures don't affect the others
+        self.assertEqual(sorted(res), ["c1", "c2", "c3", "c4", "c5"])
+        self.assertEqual(res["c1"], {'result': ["getMethods", 1]})
+        self.assertEqual(res["c3"], {'result': ["getMethods", 1]})
+        self.assertEqual(res["c2"], {'error': "failed"})
+        self.assertEqual(res["c4"], {'error': "timeout"})
+        self.assertTrue("not available" in res["c5"]['error'])
+
+        # The calls run concurrently with the configured timeout
+        self.assertTrue(time.time() - start < 1)
+        self.assertEqual(sorted(Proxy.created), ["c1", "c2", "c3", "c4"])
+        self.assertEqual(set(p.timeout for p in ClientService._ClientService__proxy.values()), set([0.5]))
+
+    def test_order(self):
+        Proxy.answers = dict((client, answer(delay)) for client, delay in
+            [("c1", 0.3), ("c2", 0.2), ("c3", 0.1), ("c4", 0)])
+        calls = [(client, "ping", (idx,), {}) for idx, client in enumerate(["c1", "c2", "c3", "c4", "c1"])]
+
+        # Results are in the order of the calls, not of their completion
+        res = self.service._ClientService__dispatch_many(calls)
+        self.assertEqual([r['result'][1] for r in res], [0, 1, 2, 3, 4])
+
+    def test_proxy(self):
+        Proxy.answers = {"c1": answer(0)}
+        calls = [("c1", "ping", (idx,), {}) for idx in range(4)]
+
+        # Concurrent calls to a new client share one proxy
+        self.service._ClientService__dispatch_many(calls)
+        self.assertEqual(Proxy.created, ["c1"])
+
+
+if __name__ == '__main__':
+    unittest.main()
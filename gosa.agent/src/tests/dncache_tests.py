@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+import unittest
+import time
+import logging
+import ldap
+from contextlib import contextmanager
+from gosa.agent.objects.backend import EntryNotFound
+from gosa.agent.objects.backend.back_ldap import DNCache, LDAP
+
+
+class Connection(object):
+    """
+    Handler and connection of a directory which only knows DNs by uuid.
+    """
+
+    def __init__(self, dns):
+        self.dns = dns
+        self.modified = []
+
+    def get_base(self):
+        return "dc=example,dc=net"
+
+    @contextmanager
+    def get_handle(self):
+        yield self
+
+    def search_s(self, base, scope, fltr, attrs):
+        uuid = fltr.split("=", 1)[1]
+        return [(self.dns[uuid], {'entryUUID': [uuid]})] if uuid in self.dns else []
+
+    def modify_s(self, dn, mod_attrs):
+        if not dn in self.dns.values():
+            raise ldap.NO_SUCH_OBJECT({'desc': "No such object"})
+
+        self.modified.append(dn)
+
+
+class TestDNCache(unittest.TestCase):
+
+    def test_lookup(self):
+        cache = DNCache(size=10, ttl=60)
+        cache.add("uuid1", "cn=Tester,ou=people,dc=example,dc=net")
+
+        self.assertEqual(cache.get_dn("uuid1"), "cn=Tester,ou=people,dc=example,dc=net")
+        self.assertEqual(cache.get_uuid(u"CN=tester,ou=people,dc=example,dc=net"), "uuid1")
+        self.assertEqual(cache.get_dn("uuid2"), None)
+        self.assertEqual(cache.get_uuid("cn=unknown,dc=example,dc=net"), None)
+
+        stats = cache.get_statistics()
+        self.assertEqual((stats['size'], stats['hits'], stats['misses']), (1, 2, 2))
+
+    def test_invalidate(self):
+        cache = DNCache(size=10, ttl=60)
+        cache.add("uuid1", "ou=people,dc=example,dc=net")
+        cache.add("uuid2", "cn=Tester,ou=people,dc=example,dc=net")
+        cache.add("uuid3", "cn=Other,ou=groups,dc=example,dc=net")
+
+        # Moving an entry invalidates its children, too
+        cache.invalidate("uuid1", "ou=people,dc=example,dc=net")
+        self.assertEqual(cache.get_dn("uuid1"), None)
+        self.assertEqual(cache.get_dn("uuid2"), None)
+        self.assertEqual(cache.get_dn("uuid3"), "cn=Other,ou=groups,dc=example,dc=net")
+
+        # A new entry at a known DN replaces the old one
+        cache.add("uuid4", "cn=Other,ou=groups,dc=example,dc=net")
+        self.assertEqual(cache.get_dn("uuid3"), None)
+        self.assertEqual(cache.get_uuid("cn=Other,ou=groups,dc=example,dc=net"), "uuid4")
+
+    def test_limits(self):
+        cache = DNCache(size=2, ttl=0.05)
+        cache.add("uuid1", "cn=a,dc=example,dc=net")
+        cache.add("uuid2", "cn=b,dc=example,dc=net")
+        cache.get_dn("uuid1")
+        cache.add("uuid3", "cn=c,dc=example,dc=net")
+
+        self.assertEqual(cache.get_dn("uuid2"), None)
+        self.assertEqual(cache.get_uuid("cn=b,dc=example,dc=net"), None)
+        self.assertEqual(cache.get_dn("uuid1"), "cn=a,dc=example,dc=net")
+
+        time.sleep(0.1)
+        self.assertEqual(cache.get_dn("uuid1"), None)
+        self.assertEqual(cache.get_uuid("cn=c,dc=example,dc=net"), None)
+
+
+class TestLDAPBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = LDAP.__new__(LDAP)
+        self.backend.log = logging.getLogger(__name__)
+        self.backend.lh = Connection({"uuid1": "cn=new,dc=example,dc=net"})
+        self.backend.uuid_entry = "entryUUID"
+        self.backend.cache = DNCache(size=10, ttl=60)
+        self.backend.cache_events = False
+
+    def test_outdated(self):
+        # The entry has been renamed by someone else
+        self.backend.cache.add("uuid1", "cn=old,dc=example,dc=net")
+        self.backend.retract("uuid1", {"mail": None}, {})
+        self.assertEqual(self.backend.lh.modified, ["cn=new,dc=example,dc=net"])
+        self.assertEqual(self.backend.cache.get_dn("uuid1"), "cn=new,dc=example,dc=net")
+
+        # Entries which are gone are only looked up once
+        self.backend.lh.dns = {}
+        self.assertRaises(EntryNotFound, self.backend.retract, "uuid1", {"mail": None}, {})
+        self.assertEqual(self.backend.cache.get_dn("uuid1"), None)
+        self.assertRaises(EntryNotFound, self.backend.retract, "uuid1", {"mail": None}, {})
+        self.assertEqual(len(self.backend.lh.modified), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
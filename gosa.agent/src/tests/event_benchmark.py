@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark for sending and receiving events. It pushes high rate events
+thru ``AMQPHandler.sendEvent`` - without a broker - and the event processor
+of ``EventConsumer`` and shows the number of events per second. For
+comparison, the rate of the former path - validating every event against
+the schema of all events after pretty printing it - is shown, too.
+
+Run it using::
+
+    $ python event_benchmark.py
+"""
+import os
+import time
+import logging
+from lxml import etree, objectify
+from gosa.common.event import EventMaker
+from gosa.common.components.registry import PluginRegistry
+from gosa.common.components.amqp import AMQPHandler, EventConsumer
+
+BASE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "gosa", "agent")
+EVENT_DIRS = [os.path.join(BASE, "data", "events"),
+              os.path.join(BASE, "plugins", "goto", "data", "events")]
+COUNT = 5000
+
+
+class NullProvider(object):
+    """ Don't send the events, we're only interested in the processing. """
+
+    def send(self, data, xml=None):
+        pass
+
+    def stop(self):
+        pass
+
+
+class Message(object):
+
+    def __init__(self, content):
+        self.content = content
+
+
+def register():
+    for path in EVENT_DIRS:
+        for f in os.listdir(path):
+            if f.endswith(".xsd"):
+                PluginRegistry.evreg[f[:-4]] = os.path.join(path, f)
+
+
+def make_events():
+    e = EventMaker()
+    status = e.Event(e.NodeStatus(e.Id("node1"), e.Load("0.5"),
+        e.Latency("0.01"), e.Workers("4")))
+    session = e.Event(e.UserSession(e.Id("client1"),
+        e.User(e.Name("user1"), e.Name("user2"))))
+    announce = e.Event(e.ClientAnnounce(e.Id("client1"), e.Name("host1"),
+        e.NetworkInformation(e.NetworkDevice(e.Name("eth0"),
+            e.IPAddress("192.168.0.1"), e.IPv6Address(""),
+            e.MAC("00:11:22:33:44:55"), e.Netmask("255.255.255.0"),
+            e.Broadcast("192.168.0.255"))),
+        e.ClientCapabilities(*[e.ClientMethod(e.Name("method%d" % i),
+            e.Path("path.method%d" % i), e.Signature("a,b"),
+            e.Documentation("Some documentation")) for i in range(10)])))
+
+    return [("NodeStatus", status), ("UserSession", session), ("ClientAnnounce", announce)]
+
+
+def handler(validate_all):
+    amqp = AMQPHandler.__new__(AMQPHandler)
+    amqp.env = None
+    amqp.log = logging.getLogger(__name__)
+    amqp._eventProvider = NullProvider()
+    amqp._validate_all = validate_all
+    return amqp
+
+
+def rate(func, data):
+    # Let the schemas get compiled
+    func(data)
+
+    t = time.time()
+    for i in xrange(COUNT):
+        func(data)
+    return COUNT / (time.time() - t)
+
+
+def run(data, parser):
+    # Old style: pretty print and validate against all events
+    def legacy(data):
+        event = "<?xml version='1.0' encoding='utf-8'?>\n"
+        event += etree.tostring(data, pretty_print=True)
+        objectify.fromstring(event, parser)
+
+    received = []
+    consumer = EventConsumer.__new__(EventConsumer)
+    consumer.env = None
+    consumer.log = logging.getLogger(__name__)
+    consumer._EventConsumer__callback = received.append
+    msg = Message(etree.tostring(data, xml_declaration=True, encoding='utf-8'))
+
+    return (rate(legacy, data),
+            rate(handler(True).sendEvent, data),
+            rate(handler(False).sendEvent, data),
+            rate(handler(False).sendEvent, etree.tostring(data)),
+            rate(lambda m: consumer._EventConsumer__eventProcessor(None, m), msg))
+
+
+if __name__ == '__main__':
+    register()
+    parser = objectify.makeparser(schema=etree.XMLSchema(etree.XML(PluginRegistry.getEventSchema())))
+
+    print "%16s %12s %12s %12s %12s %12s" % ("event/s", "former", "validated", "trusted", "string", "received")
+    for name, data in make_events():
+        print "%16s %12d %12d %12d %12d %12d" % ((name,) + run(data, parser))
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+import os
+import logging
+import unittest
+from lxml import etree
+from gosa.common.event import EventMaker
+from gosa.common.components.registry import PluginRegistry
+from gosa.common.components.amqp import AMQPHandler
+
+BASE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "gosa", "agent")
+EVENT_DIRS = [os.path.join(BASE, "data", "events"),
+              os.path.join(BASE, "plugins", "goto", "data", "events")]
+
+
+class Provider(object):
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, data, xml=None):
+        self.sent.append(data)
+        return len(self.sent)
+
+
+def status(node, load="0.5"):
+    e = EventMaker()
+    return e.Event(e.NodeStatus(e.Id(node), e.Load(load), e.Latency("0.01"), e.Workers("4")))
+
+
+def announce(*devices):
+    e = EventMaker()
+    return e.Event(e.ClientAnnounce(e.Id("client1"), e.Name("host1"),
+        e.NetworkInformation(*[e.NetworkDevice(e.Name(name), e.IPAddress("192.168.0.1"),
+            e.IPv6Address(""), e.MAC("00:11:22:33:44:55"), e.Netmask("255.255.255.0"),
+            e.Broadcast("192.168.0.255")) for name in devices])))
+
+
+class TestEventValidation(unittest.TestCase):
+
+    def setUp(self):
+        self.evreg = PluginRegistry.evreg
+        PluginRegistry.evreg = {}
+        for path in EVENT_DIRS:
+            for f in os.listdir(path):
+                if f.endswith(".xsd"):
+                    PluginRegistry.evreg[f[:-4]] = os.path.join(path, f)
+
+        # Don't share compiled schemas and validated types with other tests
+        self.amqp = AMQPHandler.__new__(AMQPHandler)
+        self.amqp.env = None
+        self.amqp.log = logging.getLogger(__name__)
+        self.amqp._eventProvider = Provider()
+        self.amqp._schemas = {}
+        self.amqp._validated = set()
+
+        self.validated = []
+        validate = self.amqp.validateEvent
+
+        def count(name, xml):
+            self.validated.append(name)
+            validate(name, xml)
+
+        self.amqp.validateEvent = count
+
+    def tearDown(self):
+        PluginRegistry.evreg = self.evreg
+
+    def test_dependencies(self):
+        # ClientAnnounce uses the NetworkDevice type defined by ClientPoll
+        self.assertEqual(PluginRegistry.getEventDependencies("ClientAnnounce"), set(["ClientPoll"]))
+        self.assertEqual(PluginRegistry.getEventDependencies("ClientPoll"), set())
+        self.assertEqual(PluginRegistry.getEventDependencies("NodeStatus"), set())
+        self.assertEqual(PluginRegistry.getEventDependencies("Unknown"), set())
+
+    def test_schema(self):
+        self.amqp.validateEvent("ClientAnnounce", announce("eth0", "eth1"))
+        self.assertEqual(self.amqp._schemas.keys(), ["ClientAnnounce"])
+
+        # The schema only knows the requested event and its dependencies
+        schema = self.amqp._schemas["ClientAnnounce"][0]
+        self.assertFalse(schema.validate(status("node1")))
+        self.assertFalse(schema.validate(EventMaker().Event(EventMaker().ClientPoll())))
+
+        self.assertRaises(etree.XMLSyntaxError, self.amqp.validateEvent, "ClientAnnounce", announce())
+        self.assertRaises(etree.XMLSyntaxError, self.amqp.validateEvent, "NodeStatus", status("node1", "high"))
+        self.assertRaises(etree.XMLSyntaxError, self.amqp.validateEvent, "Unknown", status("node1"))
+        self.assertEqual(sorted(self.amqp._schemas), ["ClientAnnounce", "NodeStatus"])
+
+    def test_untrusted(self):
+        # Events passed as strings are validated every time
+        self.assertEqual(self.amqp.sendEvent(etree.tostring(status("node1"))), 1)
+        self.assertEqual(self.amqp.sendEvent(etree.tostring(status("node2"))), 2)
+        self.assertEqual(self.validated, ["NodeStatus", "NodeStatus"])
+
+        for data in [etree.tostring(status("node1", "high")), etree.tostring(announce()),
+                "<Event xmlns='http://www.gonicus.de/Events'/>", "<Event>"]:
+            self.assertRaises(etree.XMLSyntaxError, self.amqp.sendEvent, data)
+
+        self.assertEqual(len(self.amqp._eventProvider.sent), 2)
+
+    def test_trusted(self):
+        # Events built locally are validated once per type
+        self.amqp.sendEvent(status("node1"))
+        self.amqp.sendEvent(status("node2", "high"))
+        self.amqp.sendEvent(announce("eth0"))
+        self.amqp.sendEvent(announce("eth1"))
+        self.assertEqual(self.validated, ["NodeStatus", "ClientAnnounce"])
+        self.assertEqual(len(self.amqp._eventProvider.sent), 4)
+
+        # ... and not at all if the schema is unknown here
+        e = EventMaker()
+        self.amqp.sendEvent(e.Event(e.PluginEvent(e.Id("x"))))
+        self.assertEqual(len(self.validated), 2)
+
+        # The first event of a type is rejected if it doesn't validate
+        self.assertRaises(etree.XMLSyntaxError, self.amqp.sendEvent, e.Event(e.ClientLeave()))
+        self.assertFalse("ClientLeave" in self.amqp._validated)
+
+    def test_validate_all(self):
+        self.amqp._validate_all = True
+        self.amqp.sendEvent(status("node1"))
+        self.assertRaises(etree.XMLSyntaxError, self.amqp.sendEvent, status("node2", "high"))
+        self.assertEqual(self.validated, ["NodeStatus", "NodeStatus"])
+
+        # Events of unknown types are rejected, too
+        e = EventMaker()
+        self.assertRaises(etree.XMLSyntaxError, self.amqp.sendEvent, e.Event(e.PluginEvent(e.Id("x"))))
+        self.assertEqual(len(self.amqp._eventProvider.sent), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
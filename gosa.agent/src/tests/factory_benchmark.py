@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark for the object factory. It creates an object type with 50
+attributes - some of them using in- and out-filters - on top of an in
+memory backend and measures opening, modifying and committing objects.
+
+Run it using::
+
+    $ python factory_benchmark.py
+"""
+import os
+import time
+import uuid
+import shutil
+import tempfile
+import datetime
+from gosa.common import Environment
+
+Environment.reset()
+Environment.config = os.path.join(os.path.dirname(os.path.realpath(__file__)), "test.conf")
+Environment.noargs = True
+
+from gosa.agent.objects.factory import GOsaObjectFactory
+from gosa.agent.objects.backend import ObjectBackend, EntryNotFound
+from gosa.agent.objects.backend.registry import ObjectBackendRegistry
+
+ATTRIBUTE_COUNT = 50
+FILTERED_COUNT = 10
+OBJECT_COUNT = 100
+CYCLES = 2000
+
+ATTRIBUTE = """
+        <Attribute>
+            <Name>attr%d</Name>
+            <Type>UnicodeString</Type>
+        </Attribute>"""
+
+FILTERED_ATTRIBUTE = """
+        <Attribute>
+            <Name>time%d</Name>
+            <Type>Timestamp</Type>
+            <BackendType>Integer</BackendType>
+            <InFilter>
+                <FilterChain>
+                    <FilterEntry>
+                        <Filter>
+                            <Name>IntegerToDatetime</Name>
+                        </Filter>
+                    </FilterEntry>
+                </FilterChain>
+            </InFilter>
+            <OutFilter>
+                <FilterChain>
+                    <FilterEntry>
+                        <Filter>
+                            <Name>DatetimeToInteger</Name>
+                        </Filter>
+                    </FilterEntry>
+                </FilterChain>
+            </OutFilter>
+        </Attribute>"""
+
+SCHEMA = """<?xml version="1.0" encoding="UTF-8"?>
+<Objects xmlns="http://www.gonicus.de/Objects">
+    <Object>
+        <Name>BenchmarkObject</Name>
+        <Description>Object used by the factory benchmark</Description>
+        <Backend>Memory</Backend>
+        <BaseObject>true</BaseObject>
+        <Attributes>%s
+        </Attributes>
+    </Object>
+</Objects>
+"""
+
+
+class Memory(ObjectBackend):
+    """
+    Backend keeping the entries in a dictionary.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.dns = {}
+
+    def add(self, dn, data):
+        entry_uuid = str(uuid.uuid1())
+        self.dns[dn] = entry_uuid
+        self.entries[entry_uuid] = data
+
+    def dn2uuid(self, dn):
+        if not dn in self.dns:
+            raise EntryNotFound("entry '%s' is not present" % dn)
+        return self.dns[dn]
+
+    def load(self, uuid, info):
+        entry = self.entries[uuid]
+        return dict((k, list(v)) for k, v in entry.iteritems() if k in info)
+
+    def update(self, uuid, data):
+        for key, value in data.iteritems():
+            self.entries[uuid][key] = value['value']
+
+
+def setup():
+    # Don't load the configured backends, only use the memory one
+    ObjectBackendRegistry.instance = ObjectBackendRegistry.__new__(ObjectBackendRegistry)
+    backend = ObjectBackendRegistry.backends['Memory'] = Memory()
+
+    path = tempfile.mkdtemp()
+    try:
+        schema = os.path.join(path, "benchmark.xml")
+        with open(schema, "w") as f:
+            f.write(SCHEMA % "".join(
+                [ATTRIBUTE % i for i in range(ATTRIBUTE_COUNT - FILTERED_COUNT)] +
+                [FILTERED_ATTRIBUTE % i for i in range(FILTERED_COUNT)]))
+
+        factory = GOsaObjectFactory()
+        factory._GOsaObjectFactory__parse_schema(schema)
+    finally:
+        shutil.rmtree(path)
+
+    now = int(time.time())
+    dns = []
+    for n in range(OBJECT_COUNT):
+        dn = "cn=object%d,dc=example,dc=net" % n
+        data = dict(("attr%d" % i, [u"value %d of object %d" % (i, n)]) for i in range(ATTRIBUTE_COUNT - FILTERED_COUNT))
+        data.update(("time%d" % i, [now - i]) for i in range(FILTERED_COUNT))
+        backend.add(dn, data)
+        dns.append(dn)
+
+    return factory, dns
+
+
+def run(factory, dns):
+    t_open = t_modify = t_commit = 0.0
+    stamp = datetime.datetime.now().replace(microsecond=0)
+
+    for n in range(CYCLES):
+        dn = dns[n % len(dns)]
+
+        start = time.time()
+        obj = factory.getObject('BenchmarkObject', dn)
+        t_open += time.time() - start
+
+        start = time.time()
+        obj.attr0 = u"changed %d" % n
+        obj.attr1 = u"changed %d" % n
+        obj.time0 = stamp
+        t_modify += time.time() - start
+
+        start = time.time()
+        obj.commit()
+        t_commit += time.time() - start
+
+    return t_open, t_modify, t_commit
+
+
+if __name__ == '__main__':
+    env = Environment.getInstance()
+    factory, dns = setup()
+
+    t_open, t_modify, t_commit = run(factory, dns)
+    print "%d objects with %d attributes" % (OBJECT_COUNT, ATTRIBUTE_COUNT)
+    print "open:   %.2fs (%.1f objects/s)" % (t_open, CYCLES / t_open)
+    print "modify: %.2fs (%.1f objects/s)" % (t_modify, CYCLES / t_modify)
+    print "commit: %.2fs (%.1f objects/s)" % (t_commit, CYCLES / t_commit)
@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import uuid
+import shutil
+import hashlib
+import marshal
+import cPickle
+import pkg_resources
+import tempfile
+import unittest
+from StringIO import StringIO
+from gosa.common import Environment
+
+Environment.reset()
+Environment.config = os.path.join(os.path.dirname(os.path.realpath(__file__)), "test.conf")
+Environment.noargs = True
+
+from gosa.agent.objects.factory import GOsaObjectFactory, Property, SCHEMA_CACHE_VERSION
+from gosa.agent.objects.backend import ObjectBackend, EntryNotFound
+from gosa.agent.objects.backend.registry import ObjectBackendRegistry
+
+SCHEMA = """<?xml version="1.0" encoding="UTF-8"?>
+<Objects xmlns="http://www.gonicus.de/Objects">
+    <Object>
+        <Name>TestObject</Name>
+        <Description>Object used by the factory tests</Description>
+        <Backend>Memory</Backend>
+        <BaseObject>true</BaseObject>
+        <Attributes>
+            <Attribute>
+                <Name>flag</Name>
+                <Type>String</Type>
+            </Attribute>
+            <Attribute>
+                <Name>mail</Name>
+                <Type>String</Type>
+                <MultiValue>true</MultiValue>
+            </Attribute>
+            <Attribute>
+                <Name>cn</Name>
+                <Type>String</Type>
+                <OutFilter>
+                    <FilterChain>
+                        <FilterEntry>
+                            <Choice>
+                                <When>
+                                    <ConditionChain>
+                                        <Condition>
+                                            <Name>Equals</Name>
+                                            <Param>%(flag)s</Param>
+                                            <Param>y</Param>
+                                        </Condition>
+                                    </ConditionChain>
+                                    <FilterChain>
+                                        <FilterEntry>
+                                            <Filter>
+                                                <Name>ConcatString</Name>
+                                                <Param> (active)</Param>
+                                                <Param>right</Param>
+                                            </Filter>
+                                        </FilterEntry>
+                                    </FilterChain>
+                                    <Else>
+                                        <FilterChain>
+                                            <FilterEntry>
+                                                <Filter>
+                                                    <Name>ConcatString</Name>
+                                                    <Param> (inactive)</Param>
+                                                    <Param>right</Param>
+                                                </Filter>
+                                            </FilterEntry>
+                                        </FilterChain>
+                                    </Else>
+                                </When>
+                            </Choice>
+                        </FilterEntry>
+                    </FilterChain>
+                </OutFilter>
+            </Attribute>
+        </Attributes>
+        <Methods>
+            <Method>
+                <Name>notify</Name>
+                <MethodParameters>
+                    <MethodParameter>
+                        <Name>message</Name>
+                        <Type>String</Type>
+                    </MethodParameter>
+                </MethodParameters>
+                <Command>notify</Command>
+                <CommandParameters>
+                    <CommandParameter>
+                        <Value>%(cn)s</Value>
+                    </CommandParameter>
+                    <CommandParameter>
+                        <Value>%(message)s</Value>
+                    </CommandParameter>
+                </CommandParameters>
+            </Method>
+        </Methods>
+    </Object>
+</Objects>
+"""
+
+
+class Memory(ObjectBackend):
+    """
+    Backend keeping the entries in a dictionary.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.dns = {}
+
+    def add(self, dn, data):
+        entry_uuid = str(uuid.uuid1())
+        self.dns[dn] = entry_uuid
+        self.entries[entry_uuid] = data
+
+    def dn2uuid(self, dn):
+        if not dn in self.dns:
+            raise EntryNotFound("entry '%s' is not present" % dn)
+        return self.dns[dn]
+
+    def load(self, uuid, info):
+        entry = self.entries[uuid]
+        return dict((k, list(v)) for k, v in entry.iteritems() if k in info)
+
+    def update(self, uuid, data):
+        for key, value in data.iteritems():
+            self.entries[uuid][key] = value['value']
+
+
+class TestObjectFactory(unittest.TestCase):
+
+    def setUp(self):
+        # Don't load the configured backends, only use the memory one
+        ObjectBackendRegistry.instance = ObjectBackendRegistry.__new__(ObjectBackendRegistry)
+        self.backend = ObjectBackendRegistry.backends['Memory'] = Memory()
+        self.backend.add("cn=a,dc=example,dc=net", {'cn': ["a"], 'flag': ["y"], 'mail': ["a@example.net"]})
+        self.backend.add("cn=b,dc=example,dc=net", {'cn': ["b"], 'flag': ["n"], 'mail': ["b@example.net"]})
+
+        path = tempfile.mkdtemp()
+        try:
+            schema = os.path.join(path, "test.xml")
+            with open(schema, "w") as f:
+                f.write(SCHEMA)
+
+            self.factory = GOsaObjectFactory()
+            self.factory._GOsaObjectFactory__parse_schema(schema)
+        finally:
+            shutil.rmtree(path)
+
+    def tearDown(self):
+        self.factory.stop()
+        ObjectBackendRegistry.backends.pop('Memory', None)
+
+    def entry(self, dn):
+        return self.backend.entries[self.backend.dns[dn]]
+
+    def test_condition_placeholders(self):
+        # Placeholders of filter conditions get the values of each object
+        for dn, cn in [("cn=a,dc=example,dc=net", "c (active)"),
+                       ("cn=b,dc=example,dc=net", "c (inactive)")]:
+            obj = self.factory.getObject('TestObject', dn)
+            obj.cn = "c"
+            obj.commit()
+            self.assertEqual(self.entry(dn)['cn'], [cn])
+
+    def test_isolation(self):
+        a1 = self.factory.getObject('TestObject', "cn=a,dc=example,dc=net")
+        a2 = self.factory.getObject('TestObject', "cn=a,dc=example,dc=net")
+        b = self.factory.getObject('TestObject', "cn=b,dc=example,dc=net")
+
+        a1.cn = "changed"
+        a1.mail = a1.mail + ["second@example.net"]
+        self.assertEqual(a2.cn, "a")
+        self.assertEqual(a2.mail, ["a@example.net"])
+        self.assertEqual(b.cn, "b")
+
+        # The class only holds the definitions
+        template = getattr(type(a1), '__properties')
+        self.assertEqual(template['cn']['value'], None)
+        self.assertEqual(template['mail']['value'], None)
+
+        # Out-filters work on copies, the object keeps its values
+        a1.commit()
+        self.assertEqual(self.entry("cn=a,dc=example,dc=net")['cn'], ["changed (active)"])
+        self.assertEqual(a1.cn, "changed")
+        self.assertEqual(a2.cn, "a")
+
+    def test_property(self):
+        obj = self.factory.getObject('TestObject', "cn=a,dc=example,dc=net")
+        template = getattr(type(obj), '__properties')
+        prop = Property(template['cn'])
+
+        # Changing schema keys only affects this property
+        prop['backend'] = "Other"
+        prop['dependsOn'].append("flag")
+        self.assertEqual(prop['backend'], "Other")
+        self.assertEqual(prop['dependsOn'], ["flag"])
+        self.assertEqual(template['cn']['backend'], "Memory")
+        self.assertEqual(template['cn']['dependsOn'], [])
+        self.assertEqual(Property(template['cn'])['backend'], "Memory")
+        self.assertEqual(Property(template['cn'])['dependsOn'], [])
+
+        # Neither do changes of opened objects
+        props = getattr(obj, '__properties')
+        props['cn']['dependsOn'].append("mail")
+        other = self.factory.getObject('TestObject', "cn=b,dc=example,dc=net")
+        self.assertEqual(template['cn']['dependsOn'], [])
+        self.assertEqual(getattr(other, '__properties')['cn']['dependsOn'], [])
+
+        copy = prop.copy()
+        copy['dependsOn'].append("mail")
+        copy.value = ["copy"]
+        self.assertFalse("mail" in prop['dependsOn'])
+        self.assertEqual(prop.value, None)
+
+    def test_methods(self):
+        a = self.factory.getObject('TestObject', "cn=a,dc=example,dc=net")
+        b = self.factory.getObject('TestObject', "cn=b,dc=example,dc=net")
+        notify_a = a.notify
+        notify_b = b.notify
+
+        out = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            notify_b("hello")
+            notify_a(message="hi")
+            lines = sys.stdout.getvalue().splitlines()
+        finally:
+            sys.stdout = out
+
+        self.assertTrue("['b']" in lines[0] and "hello" in lines[0])
+        self.assertTrue("['a']" in lines[1] and "hi" in lines[1])
+
+
+class Unpickled(object):
+
+    def __init__(self, path):
+        self.path = path
+
+    def __reduce__(self):
+        return (os.mkdir, (self.path,))
+
+
+class TestSchemaCache(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.schema = os.path.join(self.path, "test.xml")
+        self.cache = os.path.join(self.path, "schema.cache")
+        with open(self.schema, "w") as f:
+            f.write(SCHEMA)
+
+        self.factory = GOsaObjectFactory()
+        self.entry = self.call("parse_schema", self.schema)
+
+    def tearDown(self):
+        self.factory.stop()
+        shutil.rmtree(self.path)
+
+    def call(self, method, *args):
+        return getattr(self.factory, "_GOsaObjectFactory__" + method)(*args)
+
+    def rewrite(self, data, mtime=None):
+        with open(self.schema, "w") as f:
+            f.write(data)
+
+        stat = os.stat(self.schema)
+        os.utime(self.schema, (stat.st_atime, mtime or int(self.entry[1]) + 10))
+
+    def test_unchanged(self):
+        self.assertEqual(self.call("load_cached", self.schema, self.entry), self.entry)
+        self.assertEqual(self.call("load_cached", self.schema, None), None)
+
+    def test_touched(self):
+        # A new modification time is fine as long as the content matches
+        self.rewrite(SCHEMA)
+        entry = self.call("load_cached", self.schema, self.entry)
+        self.assertEqual(entry[1], os.stat(self.schema).st_mtime)
+        self.assertNotEqual(entry[1], self.entry[1])
+        self.assertEqual(entry[2:], self.entry[2:])
+
+    def test_changed(self):
+        # Same size, different content
+        self.rewrite(SCHEMA.replace("TestObject", "TestObjekt"))
+        self.assertEqual(self.call("load_cached", self.schema, self.entry), None)
+
+        # Different size, same modification time
+        self.rewrite(SCHEMA + "\n", self.entry[1])
+        self.assertEqual(self.call("load_cached", self.schema, self.entry), None)
+
+    def test_write(self):
+        entries = {self.schema: self.entry}
+        self.call("write_cache", self.cache, entries)
+        self.assertEqual(self.call("read_cache", self.cache), entries)
+        self.assertEqual(sorted(os.listdir(self.path)), ["schema.cache", "test.xml"])
+
+        # A failed rewrite leaves no temporary file behind
+        os.unlink(self.cache)
+        os.makedirs(os.path.join(self.cache, "busy"))
+        self.call("write_cache", self.cache, entries)
+        self.assertEqual(sorted(os.listdir(self.path)), ["schema.cache", "test.xml"])
+
+    def test_tag(self):
+        xsd = pkg_resources.resource_filename('gosa.agent', 'data/objects/object.xsd')
+        tag = (SCHEMA_CACHE_VERSION, hashlib.sha1(open(xsd).read()).hexdigest())
+        self.assertEqual(self.factory._GOsaObjectFactory__cache_tag, tag)
+
+        # Caches written for another format or object schema are ignored
+        for other in [(SCHEMA_CACHE_VERSION - 1, tag[1]), (SCHEMA_CACHE_VERSION, "0" * 40)]:
+            with open(self.cache, "wb") as f:
+                marshal.dump((other, {self.schema: self.entry}), f)
+            self.assertEqual(self.call("read_cache", self.cache), {})
+
+    def test_broken(self):
+        tag = self.factory._GOsaObjectFactory__cache_tag
+        marker = os.path.join(self.path, "unpickled")
+
+        for data in ["", "garbage", marshal.dumps([tag]), marshal.dumps((tag, [self.entry])),
+                marshal.dumps((tag, {self.schema: self.entry[1:]})),
+                cPickle.dumps((tag, {self.schema: Unpickled(marker)}))]:
+            with open(self.cache, "wb") as f:
+                f.write(data)
+            self.assertEqual(self.call("read_cache", self.cache), {})
+
+        self.assertEqual(self.call("read_cache", os.path.join(self.path, "missing")), {})
+        self.assertFalse(os.path.exists(marker))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+import unittest
+import time
+import logging
+from gosa.common.components import ObjectRegistry
+from gosa.agent.jsonrpc_objects import ObjectStack, JSONRPCObjectMapper
+
+
+def entry(oid="test.object"):
+    return {'oid': oid, 'object': None, 'methods': [], 'properties': []}
+
+
+class TestObjectStack(unittest.TestCase):
+
+    def test_add_remove(self):
+        stack = ObjectStack(ttl=60, size=10, user_size=10)
+        stack.add("ref1", u"tester", entry())
+        self.assertEqual(stack.get("ref1")['oid'], "test.object")
+        self.assertTrue("ref1" in stack)
+        self.assertEqual(stack.get("unknown"), None)
+
+        self.assertTrue(stack.remove("ref1"))
+        self.assertFalse(stack.remove("ref1"))
+        self.assertEqual(stack.get("ref1"), None)
+        self.assertEqual(stack.get_statistics()['users'], 0)
+
+    def test_expiry(self):
+        stack = ObjectStack(ttl=0.05, size=10, user_size=10)
+        stack.add("ref1", u"tester", entry())
+        stack.add("ref2", u"tester", entry())
+        self.assertNotEqual(stack.get("ref1"), None)
+
+        time.sleep(0.1)
+        self.assertEqual(stack.get("ref1"), None)
+        self.assertEqual(len(stack), 1)
+        self.assertEqual(stack.sweep(), 1)
+        self.assertEqual(len(stack), 0)
+        self.assertEqual(stack.get_statistics()['expired'], 2)
+
+    def test_user_limit(self):
+        stack = ObjectStack(ttl=60, size=10, user_size=2)
+        stack.add("ref1", u"user1", entry())
+        stack.add("ref2", u"user1", entry())
+        stack.add("ref3", u"user2", entry())
+
+        # Use ref1, so ref2 is the least recently used one of user1
+        stack.get("ref1")
+        stack.add("ref4", u"user1", entry())
+        self.assertEqual(stack.get("ref2"), None)
+        self.assertNotEqual(stack.get("ref1"), None)
+        self.assertNotEqual(stack.get("ref3"), None)
+        self.assertEqual(stack.get_statistics()['max_user_size'], 2)
+
+    def test_size_limit(self):
+        stack = ObjectStack(ttl=60, size=3, user_size=10)
+        for i in range(3):
+            stack.add("ref%d" % i, u"user%d" % i, entry())
+
+        stack.get("ref0")
+        stack.add("ref3", u"user3", entry())
+        self.assertEqual(len(stack), 3)
+        self.assertEqual(stack.get("ref1"), None)
+        self.assertNotEqual(stack.get("ref0"), None)
+
+        stats = stack.get_statistics()
+        self.assertEqual(stats['evicted'], 1)
+        self.assertEqual(stats['users'], 3)
+        self.assertEqual(stats['ages']['<60'], 3)
+
+
+
+class Person(object):
+
+    def __init__(self):
+        self.__sn = u"Mustermann"
+        self.__uid = "klaus"
+        self.givenName = u"Klaus"
+
+    def get_sn(self):
+        return self.__sn
+
+    def set_sn(self, value):
+        if not value:
+            raise ValueError("sn must not be empty")
+        self.__sn = value
+
+    def get_uid(self):
+        return self.__uid
+
+    def get_mail(self):
+        return "%s@example.net" % self.__uid
+
+    def rename(self, uid):
+        self.__uid = uid
+
+    sn = property(get_sn, set_sn)
+    uid = property(get_uid)
+    mail = property(get_mail)
+
+
+class Env(object):
+    id = "agent"
+
+
+class TestObjectMapper(unittest.TestCase):
+
+    def setUp(self):
+        ObjectRegistry.objects['test.person'] = {'object': Person}
+
+        self.mapper = JSONRPCObjectMapper.__new__(JSONRPCObjectMapper)
+        self.mapper.env = Env()
+        self.mapper.log = logging.getLogger(__name__)
+        self.mapper._JSONRPCObjectMapper__stack = ObjectStack()
+
+        self.ref = self.mapper.openObject(u"tester", "test.person")['__jsonclass__'][1][1]
+
+    def tearDown(self):
+        del ObjectRegistry.objects['test.person']
+
+    def test_get(self):
+        self.assertEqual(self.mapper.getObjectProperties(self.ref),
+            {'sn': u"Mustermann", 'uid': "klaus", 'mail': "klaus@example.net"})
+        self.assertEqual(self.mapper.getObjectProperties(self.ref, ["mail"]), {'mail': "klaus@example.net"})
+
+        # Only properties are exported
+        self.assertRaises(ValueError, self.mapper.getObjectProperties, self.ref, ["sn", "givenName"])
+        self.assertRaises(ValueError, self.mapper.getObjectProperties, "unknown")
+
+    def test_set(self):
+        self.assertEqual(self.mapper.setObjectProperties(self.ref, {'sn': u"Muster"}), {})
+        self.assertEqual(self.mapper.getObjectProperty(self.ref, "sn"), u"Muster")
+
+        # Failing properties are reported, the others are set anyway
+        errors = self.mapper.setObjectProperties(self.ref, {'sn': "", 'uid': "peter", 'cn': "x", 'givenName': "x"})
+        self.assertEqual(sorted(errors), ["cn", "givenName", "sn", "uid"])
+        self.assertEqual(errors['sn'], "sn must not be empty")
+
+        errors = self.mapper.setObjectProperties(self.ref, {'uid': "peter", 'sn': u"Peters"})
+        self.assertEqual(errors.keys(), ["uid"])
+        self.assertEqual(self.mapper.getObjectProperties(self.ref, ["sn", "uid"]), {'sn': u"Peters", 'uid': "klaus"})
+
+        # Values set by methods are visible
+        self.mapper.dispatchObjectMethod(self.ref, "rename", "peter")
+        self.assertEqual(self.mapper.getObjectProperties(self.ref, ["uid", "mail"]),
+            {'uid': "peter", 'mail': "peter@example.net"})
+
+
+if __name__ == '__main__':
+    unittest.main()
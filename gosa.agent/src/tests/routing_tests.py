@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import unittest
+from gosa.agent.routing import NodeRouter
+
+
+class TestNodeRouter(unittest.TestCase):
+
+    def setUp(self):
+        self.router = NodeRouter(node_timeout=60, failure_threshold=2, reset_timeout=60)
+        for node in ["node1", "node2"]:
+            self.router.add_provider("getFoo", node)
+            self.router.update_status(node, 0.0, 0.0, 1)
+
+    def test_providers(self):
+        self.router.add_provider("getBar", "node3")
+        self.assertEqual(sorted(self.router.providers("getFoo")), ["node1", "node2"])
+
+        # node3 has not sent any status yet
+        self.assertEqual(self.router.providers("getBar"), [])
+        self.assertEqual(self.router.select("getBar"), None)
+        self.assertEqual(self.router.select("getUnknown"), None)
+
+        self.router.remove_node("node1")
+        self.assertEqual(self.router.providers("getFoo"), ["node2"])
+
+    def test_select_fastest(self):
+        self.router.record("node1", 2.0)
+        self.router.record("node2", 0.01)
+
+        for i in range(10):
+            self.assertEqual(self.router.select("getFoo"), "node2")
+
+        self.assertEqual(self.router.select("getFoo", exclude=["node2"]), "node1")
+
+    def test_select_least_loaded(self):
+        self.router.update_status("node1", 4.0, 0.0, 1)
+
+        for i in range(10):
+            self.assertEqual(self.router.select("getFoo"), "node2")
+
+    def test_circuit_breaker(self):
+        self.router.record("node1", 0.01, True)
+        self.assertEqual(self.router.get_statistics()["node1"]["circuit"], "closed")
+
+        self.router.record("node1", 0.01, True)
+        self.assertEqual(self.router.get_statistics()["node1"]["circuit"], "open")
+
+        for i in range(10):
+            self.assertEqual(self.router.select("getFoo"), "node2")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import unittest
+import time
+from gosa.agent.session import MemorySessionStore
+
+
+class TestMemorySessionStore(unittest.TestCase):
+
+    def test_create_remove(self):
+        store = MemorySessionStore(ttl=60, size=10)
+        store.create("sid1", u"tester")
+        self.assertEqual(store.get("sid1"), u"tester")
+        self.assertTrue("sid1" in store)
+        self.assertEqual(store.get("unknown"), None)
+        self.assertEqual(store.get(None), None)
+
+        store.remove("sid1")
+        self.assertEqual(store.get("sid1"), None)
+
+    def test_expiry(self):
+        store = MemorySessionStore(ttl=0.05, size=10)
+        store.create("sid1", u"tester")
+        store.create("sid2", u"tester")
+        self.assertEqual(store.get("sid1"), u"tester")
+
+        time.sleep(0.1)
+        self.assertEqual(store.get("sid1"), None)
+        self.assertEqual(len(store), 1)
+        self.assertEqual(store.sweep(), 1)
+        self.assertEqual(len(store), 0)
+
+    def test_size_limit(self):
+        store = MemorySessionStore(ttl=60, size=3)
+        for i in range(3):
+            store.create("sid%d" % i, u"user%d" % i)
+
+        # Use sid0, so sid1 is the least recently used one
+        store.get("sid0")
+        store.create("sid3", u"user3")
+
+        self.assertEqual(len(store), 3)
+        self.assertEqual(store.get("sid1"), None)
+        self.assertEqual(store.get("sid0"), u"user0")
+        self.assertEqual(store.get("sid3"), u"user3")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -27,6 +27,11 @@ from other agent nodes (i.e. if it's the only one).
 
 On client shutdown, a **ClientLeave** is emitted to tell the agents that
 the client has passed away.
+
+Agents can send a call to many clients at once using a **ClientDispatch**
+event. It is executed without sending a result, if the method is listed
+in the *broadcast-methods* option of the ``[client]`` section (defaults
+to *notify, notify_all*).
 """
 import sys
 import netifaces
@@ -95,6 +100,18 @@ class AMQPClientService(object):
             """,
             callback=self.__handleClientPoll)
 
+        # Add processor for broadcasted calls
+        self.__broadcast = [m.strip() for m in self.env.config.get('client.broadcast-methods',
+            default="notify, notify_all").split(",")]
+        EventConsumer(self.env,
+            amqp.getConnection(),
+            xquery="""
+                declare namespace f='http://www.gonicus.de/Events';
+                let $e := ./f:Event
+                return $e/f:ClientDispatch
+            """,
+            callback=self.__handleClientDispatch)
+
 
         # Gather interface information
         self.__announce(True)
@@ -165,12 +182,30 @@ class AMQPClientService(object):
         sender = ssn.sender(message.reply_to)
 
         # Get rid of it...
-        sender.send(Message(response))
+        sender.send(Message(response, correlation_id=message.correlation_id))
 
     def __handleClientPoll(self, data):
         self.log.debug("received client poll")
         self.__announce()
 
+    def __handleClientDispatch(self, data):
+        data = data.ClientDispatch
+        method = data.Method.text
+
+        # Skip calls for other clients
+        if hasattr(data, 'Target') and not self.env.uuid in [t.text for t in data.Target]:
+            return
+
+        if not method in self.__broadcast:
+            self.log.warning("ignoring broadcasted call of '%s' - not allowed" % method)
+            return
+
+        self.log.debug("received broadcasted call of '%s'" % method)
+        try:
+            self.__cr.dispatch(method, *loads(data.Arguments.text))
+        except Exception as e:
+            self.log.error("broadcasted call of '%s' failed: %s" % (method, str(e)))
+
     def __announce(self, initial=False):
         amqp = PluginRegistry.getInstance('AMQPClientHandler')
         e = EventMaker()
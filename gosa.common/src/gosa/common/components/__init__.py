@@ -4,6 +4,7 @@ use for both agents and clients.
 """
 __import__('pkg_resources').declare_namespace(__name__)
 from gosa.common.components.amqp_proxy import AMQPServiceProxy
+from gosa.common.components.amqp_proxy import AMQPFuture
 from gosa.common.components.amqp_proxy import AMQPEventConsumer
 from gosa.common.components.amqp_proxy import AMQPStandaloneWorker
 from gosa.common.components.objects import ObjectRegistry
@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 import platform
 import logging
-from threading import Thread
+from copy import copy
+from collections import OrderedDict
+from threading import Thread, Lock, RLock, Event
 from qpid.messaging import Connection, ConnectionError, Message, uuid4
 from qpid.messaging.util import auto_fetch_reconnect_urls
 from qpid.util import connect, ssl
@@ -21,11 +23,23 @@ if platform.system() == "Windows":
 class AMQPHandler(object):
     """
     This class handles the AMQP connection, incoming and outgoing connections.
+
+    Events are validated against a schema which only contains their own
+    event type. The schemas are compiled on first use. Events passed as
+    strings or sent on behalf of a user are validated every time, events
+    built by local code - i.e. using :func:`gosa.common.event.EventMaker` -
+    only once per event type, unless *amqp.validate-events* is set to *all*.
+    Events built by local code are sent without validation if their schema
+    is unknown.
     """
     _conn = None
     __capabilities = {}
     __peers = {}
     _eventProvider = None
+    _schemas = {}
+    _schemas_lock = Lock()
+    _validated = set()
+    _validate_all = False
 
     def __init__(self):
         env = Environment.getInstance()
@@ -34,10 +48,8 @@ class AMQPHandler(object):
         self.env = env
         self.config = env.config
 
-        # Initialize parser
-        schema_root = etree.XML(PluginRegistry.getEventSchema())
-        schema = etree.XMLSchema(schema_root)
-        self._parser = objectify.makeparser(schema=schema)
+        self._validate_all = self.config.get("amqp.validate-events",
+            default="untrusted") == "all"
 
         # Evaluate username
         user = self.config.get("amqp.id", default=None)
@@ -56,7 +68,10 @@ class AMQPHandler(object):
 
     def __del__(self):
         self.log.debug("shutting down AMQP handler")
-        self._conn.close()
+        if self._eventProvider:
+            self._eventProvider.stop()
+        if self._conn:
+            self._conn.close()
 
     def start(self):
         """
@@ -151,34 +166,89 @@ class AMQPHandler(object):
         data            XML string or etree object representing the event.
         =============== ============
 
-        ``Return:`` Bool, success or failure
+        ``Return:`` result of the sender, None for events which are collected
+        for a batch
         """
         try:
-            event = "<?xml version='1.0' encoding='utf-8'?>\n"
             if isinstance(data, basestring):
-                event += data
+                event = "<?xml version='1.0' encoding='utf-8'?>\n" + data
+                xml = etree.fromstring(event)
+                trusted = False
             else:
-                event += etree.tostring(data, pretty_print=True)
+                event = etree.tostring(data, xml_declaration=True, encoding='utf-8')
+                xml = data
+                trusted = not user and not self._validate_all
 
-            # Validate event
-            xml = objectify.fromstring(event, self._parser)
+            # Validate event, trusted ones only if their schema is known
+            # here - clients don't know the schemas of the agent plugins
+            name = self.getEventType(xml)
+            if not trusted or (not name in self._validated and name in PluginRegistry.evreg):
+                self.validateEvent(name, xml)
+                self._validated.add(name)
 
             # If a user was supplied, check if she's authorized...
             if user:
                 acl = PluginRegistry.getInstance("ACLResolver")
-                topic = ".".join([self.env.domain, 'event', xml.__dict__.keys()[0]])
+                topic = ".".join([self.env.domain, 'event', name])
                 if not acl.check(user, topic, "x"):
                     raise EventNotAuthorized("sending the event '%s' is not permitted" % topic)
 
-            return self._eventProvider.send(event)
+            return self._eventProvider.send(event, xml)
 
         except etree.XMLSyntaxError as e:
             if not isinstance(data, basestring):
-                data = data.content
+                data = etree.tostring(data)
             if self.env:
                 self.log.error("event rejected (%s): %s" % (str(e), data))
             raise
 
+    def getEventType(self, xml):
+        """
+        Return the type of an event.
+
+        =============== ============
+        Parameter       Description
+        =============== ============
+        xml             etree object representing the event
+        =============== ============
+
+        ``Return:`` event name
+        """
+        if etree.QName(xml).localname != "Event" or not len(xml):
+            raise etree.XMLSyntaxError("no event found", None, 0, 0)
+
+        return etree.QName(xml[0]).localname
+
+    def validateEvent(self, name, xml):
+        """
+        Validate an event against the schema of its type. The schema is
+        compiled on first use.
+
+        =============== ============
+        Parameter       Description
+        =============== ============
+        name            event name
+        xml             etree object representing the event
+        =============== ============
+
+        Raises *XMLSyntaxError* if the event is not valid.
+        """
+        if not name in self._schemas:
+            if not name in PluginRegistry.evreg:
+                raise etree.XMLSyntaxError("unknown event '%s'" % name, None, 0, 0)
+
+            with self._schemas_lock:
+                if not name in self._schemas:
+                    schema = etree.XMLSchema(etree.XML(PluginRegistry.getEventSchema([name])))
+                    self._schemas[name] = (schema, Lock())
+
+        # Schemas keep the errors of the last validation, don't share them
+        schema, lock = self._schemas[name]
+        with lock:
+            if not schema.validate(xml):
+                error = schema.error_log.last_error
+                raise etree.XMLSyntaxError(error.message, None, error.line, error.column)
+
 
 class AMQPWorker(object):
     """
@@ -268,6 +338,25 @@ class EventNotAuthorized(Exception):
 
 
 class EventProvider(object):
+    """
+    Sends events to the bus.
+
+    Events of the types listed in *amqp.event-batch* are collected for
+    *amqp.event-batch-window* seconds and sent as one message, holding all
+    of them below a single ``Event`` element. If a key element is given for
+    the type, only the last event for every value of the key is sent. All
+    other events are sent immediately - after the collected ones, in order
+    to keep the order of the events. Batches only hold events of one type,
+    so that the XQuery bindings of the consumers match as before.
+
+    ================== ============
+    Key                Description
+    ================== ============
+    event-batch-window Seconds to collect events, 0 disables batching
+    event-batch        Comma separated event types to collect, optionally followed by ``:`` and the key element
+    event-batch-size   Maximum number of events sent in one message
+    ================== ============
+    """
 
     def __init__(self, env, conn):
         self.env = env
@@ -278,12 +367,158 @@ class EventProvider(object):
         self.__user = conn.username
         self.__sender = self.__sess.sender("%s/event" % env.domain)
 
-    def send(self, data):
-        self.log.debug("sending event: %s" % data)
+        # Prepare batching
+        get = env.config.get
+        self.__window = float(get("amqp.event-batch-window", default=0))
+        self.__size = int(get("amqp.event-batch-size", default=100))
+        self.__keys = {}
+        for item in get("amqp.event-batch", default="NodeStatus:Id, UserSession:Id").split(","):
+            name, sep, key = item.strip().partition(":")
+            if name:
+                self.__keys[name] = key or None
+
+        self.__lock = Lock()
+        self.__send_lock = RLock()
+        self.__pending = OrderedDict()
+        if self.__window:
+            self.__stopped = Event()
+            self.__thread = Thread(target=self.__run, name="EventProvider")
+            self.__thread.setDaemon(True)
+            self.__thread.start()
+
+    def send(self, data, xml=None):
+        """
+        Send an event.
+
+        =============== ============
+        Parameter       Description
+        =============== ============
+        data            XML string of the event
+        xml             etree object of the event, required for batching
+        =============== ============
+
+        ``Return:`` result of the sender, None for events which are collected
+        """
+        if not self.__window:
+            return self.__send(data)
+
+        name = etree.QName(xml[0]).localname if xml is not None else None
+        if name in self.__keys:
+            return self.__add(name, xml)
+
+        # Keep the order, send what has been collected so far - the
+        # flusher thread must not send a batch meanwhile
+        with self.__send_lock:
+            if self.__pending:
+                self.flush()
+
+            return self.__send(data)
+
+    def flush(self, name=None):
+        """
+        Send the collected events.
+
+        =============== ============
+        Parameter       Description
+        =============== ============
+        name            only send the events of this type
+        =============== ============
+
+        ``Return:`` result of the sender for the last message
+        """
+        res = None
+        with self.__send_lock:
+            with self.__lock:
+                if name:
+                    batches = [(name, self.__pending.pop(name, None))]
+                else:
+                    batches = self.__pending.items()
+                    self.__pending = OrderedDict()
+
+            for name, batch in batches:
+                if not batch:
+                    continue
+
+                events = batch['events'].values()
+                for i in range(0, len(events), self.__size):
+                    res = self.__send("<?xml version='1.0' encoding='utf-8'?>\n<Event xmlns=\"%s\">%s</Event>" % (
+                        batch['ns'], "".join(events[i:i + self.__size])))
+
+        return res
+
+    def stop(self):
+        """ Send the collected events and stop batching. """
+        if self.__window:
+            self.__stopped.set()
+            self.__thread.join()
+        self.flush()
+
+    def __add(self, name, xml):
+        event = xml[0]
+        key = self.__keys[name]
+        if key:
+            value = event.find("{%s}%s" % (etree.QName(event).namespace, key))
+            key = value.text if value is not None else None
+
+        with self.__lock:
+            batch = self.__pending.get(name)
+            if not batch:
+                batch = self.__pending[name] = {'ns': etree.QName(xml).namespace.encode('utf-8'),
+                                                'events': OrderedDict()}
+
+            # Last value wins
+            events = batch['events']
+            if key is None:
+                key = object()
+            else:
+                events.pop(key, None)
+            events[key] = etree.tostring(event)
+            full = len(events) >= self.__size
+
+        return self.flush(name) if full else None
+
+    def __send(self, data):
+        self.log.debug("sending event: %s", data)
         msg = Message(data)
         msg.user_id = self.__user
         return self.__sender.send(msg)
 
+    def __run(self):
+        while not self.__stopped.is_set():
+            self.__stopped.wait(self.__window)
+            try:
+                self.flush()
+            except Exception:
+                self.log.exception("failed to send collected events")
+
+
+def unpack_events(xml):
+    """
+    Split an ``<Event>`` containing a batch of events into single ones.
+
+    =============== ============
+    Parameter       Description
+    =============== ============
+    xml             objectified ``<Event>`` element
+    =============== ============
+
+    ``Return:`` list of ``<Event>`` elements with one event each
+    """
+    events = xml.getchildren()
+    if len(events) < 2:
+        return [xml]
+
+    for event in events:
+        xml.remove(event)
+
+    res = []
+    for event in events:
+        single = copy(xml)
+        single.append(event)
+        res.append(single)
+
+    return res
+
 
 class EventConsumer(object):
 
@@ -330,8 +565,11 @@ class EventConsumer(object):
         # Validate event and let it pass if it matches the schema
         try:
             xml = objectify.fromstring(data.content)
-            self.log.debug("event received: %s" % data.content)
-            self.__callback(xml)
+            self.log.debug("event received: %s", data.content)
+
+            # Unpack batches, every event is passed on its own
+            for event in unpack_events(xml):
+                self.__callback(event)
         except etree.XMLSyntaxError as e:
             if self.env:
                 self.log.debug("event rejected (%s): %s" % (str(e), data.content))
@@ -1,9 +1,12 @@
 # -*- coding: utf-8 -*-
-from qpid.messaging import Connection, Message, uuid4
+import time
+import logging
+from threading import Thread, Lock, Condition, Event
+from qpid.messaging import Connection, Message, Empty, uuid4
 from types import DictType
 from gosa.common.components.jsonrpc_proxy import JSONRPCException, ObjectFactory
 from gosa.common.json import dumps, loads
-from gosa.common.components.amqp import AMQPProcessor
+from gosa.common.components.amqp import AMQPProcessor, unpack_events
 from gosa.common.utils import parseURL
 from lxml import objectify
 
@@ -12,6 +15,320 @@ class AMQPException(Exception):
     pass
 
 
+class AMQPTimeout(AMQPException):
+    pass
+
+
+class AMQPFuture(object):
+    """
+    The AMQPFuture represents the result of a call which has been sent
+    by an :class:`gosa.common.components.amqp_proxy.AMQPServiceProxy`,
+    but may not have been answered yet.
+
+    =============== ============
+    Parameter       Description
+    =============== ============
+    transform       Optional method to convert the result before it is returned
+    canceller       Optional method to be called when the future gets cancelled
+    =============== ============
+    """
+
+    def __init__(self, transform=None, canceller=None):
+        self.__lock = Lock()
+        self.__event = Event()
+        self.__result = None
+        self.__error = None
+        self.__transform = transform
+        self.__canceller = canceller
+        self.__cancelled = False
+        self.__callbacks = []
+
+    def done(self):
+        """
+        ``Return:`` True if the call has been answered, failed or timed out
+        """
+        return self.__event.is_set()
+
+    def result(self, timeout=None):
+        """
+        Wait for the call to be answered and return its result. Errors
+        reported by the remote side are raised as
+        :class:`gosa.common.components.jsonrpc_proxy.JSONRPCException`.
+
+        =============== ============
+        Parameter       Description
+        =============== ============
+        timeout         Seconds to wait, defaults to wait until the call is done
+        =============== ============
+
+        ``Return:`` the call result
+        """
+        if not self.__event.wait(timeout):
+            raise AMQPTimeout("no response within %s seconds" % timeout)
+
+        if self.__error:
+            raise self.__error
+
+        # Convert the result in the callers thread - the transformation
+        # may need to talk to the service again.
+        with self.__lock:
+            if self.__transform:
+                self.__result = self.__transform(self.__result)
+                self.__transform = None
+
+        return self.__result
+
+    def exception(self, timeout=None):
+        """
+        Wait for the call to be answered and return the error, if any.
+
+        ``Return:`` exception or None
+        """
+        if not self.__event.wait(timeout):
+            raise AMQPTimeout("no response within %s seconds" % timeout)
+
+        return self.__error
+
+    def cancel(self):
+        """
+        Stop waiting for the result. The remote side may still execute
+        the call, but its response will be dropped.
+
+        ``Return:`` True if the future has been cancelled
+        """
+        self.__cancelled = True
+        if not self.__finish(None, AMQPException("call has been cancelled")):
+            self.__cancelled = False
+            return False
+
+        if self.__canceller:
+            self.__canceller()
+
+        return True
+
+    def cancelled(self):
+        """
+        ``Return:`` True if the future has been cancelled
+        """
+        return self.__cancelled
+
+    def add_done_callback(self, callback):
+        """
+        Call *callback* with this future as the only parameter as soon as
+        the call is done. Callbacks are run by the thread which receives
+        the response, so they should not block.
+        """
+        with self.__lock:
+            if not self.__event.is_set():
+                self.__callbacks.append(callback)
+                return
+
+        callback(self)
+
+    def set_result(self, result):
+        self.__finish(result, None)
+
+    def set_exception(self, error):
+        self.__finish(None, error)
+
+    def __finish(self, result, error):
+        with self.__lock:
+            if self.__event.is_set():
+                return False
+
+            self.__result = result
+            self.__error = error
+            self.__event.set()
+            callbacks, self.__callbacks = self.__callbacks, []
+
+        for callback in callbacks:
+            callback(self)
+
+        return True
+
+
+class AMQPReplyChannel(object):
+    """
+    The reply channel multiplexes the calls of all proxies sharing one AMQP
+    connection. Requests are tagged with unique correlation IDs and all
+    responses come in on a single *reply to* queue, where a background
+    thread matches them with the waiting
+    :class:`gosa.common.components.amqp_proxy.AMQPFuture`.
+
+    If *max_pending* calls are in flight, new calls block until there's
+    room again instead of failing.
+
+    =============== ============
+    Parameter       Description
+    =============== ============
+    conn            :class:`qpid.messaging.Connection`
+    user            User ID placed in outgoing messages
+    max_pending     Maximum number of calls waiting for a response
+    =============== ============
+    """
+
+    def __init__(self, conn, user, max_pending=100):
+        self.log = logging.getLogger(__name__)
+        self.__user = user
+        self.__max_pending = max_pending
+        self.__pending = {}
+        self.__senders = {}
+        self.__cond = Condition()
+        self.__send_lock = Lock()
+        self.__running = True
+        self.__next_expiry = 0
+
+        self.__ssn = conn.session(str(uuid4()))
+        self.reply_to = 'reply-%s' % self.__ssn.name
+        self.__receiver = self.__ssn.receiver('%s; {create:always, delete:always, node: { type: queue, durable: False, x-declare: { exclusive: False, auto-delete: True } }}' % self.reply_to)
+
+        self.__thread = Thread(target=self.__process)
+        self.__thread.setDaemon(True)
+        self.__thread.start()
+
+    def submit(self, address, method, params, timeout=None, transform=None):
+        """
+        Send a call to *address* and return a future for its result.
+
+        =============== ============
+        Parameter       Description
+        =============== ============
+        address         Target queue address
+        method          Method name
+        params          List or dictionary of parameters
+        timeout         Seconds after which the call fails, defaults to no timeout
+        transform       Optional method to convert the result
+        =============== ============
+
+        ``Return:`` :class:`gosa.common.components.amqp_proxy.AMQPFuture`
+        """
+        cid = str(uuid4())
+        future = AMQPFuture(transform, lambda: self.__discard(cid))
+        deadline = time.time() + timeout if timeout is not None else None
+
+        with self.__cond:
+
+            # Wait for a free slot
+            while self.__running and len(self.__pending) >= self.__max_pending:
+                if deadline is None:
+                    self.__cond.wait()
+                    continue
+
+                left = deadline - time.time()
+                if left <= 0:
+                    raise AMQPTimeout("no free slot for '%s' within %s seconds" % (method, timeout))
+                self.__cond.wait(left)
+
+            if not self.__running:
+                raise AMQPException("reply channel has been closed")
+
+            self.__pending[cid] = (future, deadline)
+
+        message = Message(dumps({"method": method, "params": params, "id": cid}))
+        message.user_id = self.__user
+        message.reply_to = self.reply_to
+        message.correlation_id = cid
+
+        try:
+            with self.__send_lock:
+                if not address in self.__senders:
+                    self.__senders[address] = self.__ssn.sender(address)
+                self.__senders[address].send(message, sync=False)
+
+        except Exception as e:
+            self.__resolve(cid, error=e)
+
+        return future
+
+    def pending(self):
+        """
+        ``Return:`` number of calls waiting for a response
+        """
+        return len(self.__pending)
+
+    def close(self):
+        """
+        Stop processing responses and fail all pending calls.
+        """
+        with self.__cond:
+            self.__running = False
+            pending, self.__pending = self.__pending, {}
+            self.__cond.notifyAll()
+
+        for future, deadline in pending.values():
+            future.set_exception(AMQPException("reply channel has been closed"))
+
+        self.__thread.join(2)
+
+        for sender in self.__senders.values():
+            sender.close()
+        self.__receiver.close()
+
+    def __discard(self, cid):
+        with self.__cond:
+            self.__pending.pop(cid, None)
+            self.__cond.notify()
+
+    def __resolve(self, cid, result=None, error=None):
+        with self.__cond:
+            entry = self.__pending.pop(cid, None)
+            self.__cond.notify()
+
+        if not entry:
+            self.log.debug("dropping response for unknown call '%s'" % cid)
+            return
+
+        if error:
+            entry[0].set_exception(error)
+        else:
+            entry[0].set_result(result)
+
+    def __expire(self):
+        now = time.time()
+        if now < self.__next_expiry:
+            return
+
+        self.__next_expiry = now + 1
+        with self.__cond:
+            expired = [cid for cid, (future, deadline) in self.__pending.iteritems()
+                if deadline is not None and deadline < now]
+
+        for cid in expired:
+            self.__resolve(cid, error=AMQPTimeout("call '%s' timed out" % cid))
+
+    def __process(self):
+        while self.__running:
+            try:
+                message = self.__receiver.fetch(timeout=1)
+
+            except Empty:
+                self.__expire()
+                continue
+
+            #pylint: disable=W0703
+            except Exception as e:
+                if self.__running:
+                    self.log.error("failed to fetch response: %s" % str(e))
+                    time.sleep(1)
+                continue
+
+            self.__ssn.acknowledge(message)
+
+            try:
+                resp = loads(message.content)
+            except ValueError:
+                self.log.error("dropping malformed response: %s" % message.content)
+                continue
+
+            cid = message.correlation_id or resp.get('id')
+            if resp.get('error') != None:
+                self.__resolve(cid, error=JSONRPCException(resp['error']))
+            else:
+                self.__resolve(cid, result=resp.get('result'))
+
+            self.__expire()
+
+
 class AMQPServiceProxy(object):
     """
     The AMQPServiceProxy provides a simple way to use GOsa RPC
@@ -25,6 +342,12 @@ class AMQPServiceProxy(object):
 
     This will return a dictionary describing the available methods.
 
+    Calls can be sent without waiting for their result, too. They return
+    an :class:`gosa.common.components.amqp_proxy.AMQPFuture`::
+
+        >>> futures = [proxy.getObjectProperty.future(ref, name) for name in ["cn", "sn"]]
+        >>> [f.result() for f in futures]
+
     =============== ============
     Parameter       Description
     =============== ============
@@ -32,21 +355,26 @@ class AMQPServiceProxy(object):
     serviceAddress  Address string describing the target queue to bind to, must be skipped if no special queue is needed
     serviceName     *internal*
     conn            *internal*
-    workers         Number of workers to allocate for processing
+    workers         *deprecated*, use *max_pending*
+    timeout         Seconds after which a call fails, defaults to no timeout
+    max_pending     Maximum number of calls in flight, further calls block
     =============== ============
 
-    The AMQPService proxy creates a temporary AMQP *reply to* queue, which
-    is used for command results.
+    All proxies sharing a connection use one temporary AMQP *reply to*
+    queue for the command results.
     """
-    worker = {}
+    channel = {}
+    channel_lock = Lock()
 
     def __init__(self, serviceURL, serviceAddress=None, serviceName=None,
-                 conn=None, workers=3):
+                 conn=None, workers=3, timeout=None, max_pending=100):
         self.__URL = url = parseURL(serviceURL)
         self.__serviceURL = serviceURL
         self.__serviceName = serviceName
         self.__serviceAddress = serviceAddress
         self.__workers = workers
+        self.__timeout = timeout
+        self.__max_pending = max_pending
         domain = url['path']
 
         # Prepare AMQP connection if not already there
@@ -62,26 +390,15 @@ class AMQPServiceProxy(object):
             if not self.__serviceAddress:
                 raise AMQPException("no serviceAddress or domain specified")
 
-            try:
-                AMQPServiceProxy.worker[self.__serviceAddress]
-            except KeyError:
-                AMQPServiceProxy.worker[self.__serviceAddress] = {}
-
-            # Pre instanciate core sessions
-            for i in range(0, workers):
-                ssn = conn.session(str(uuid4()))
-                AMQPServiceProxy.worker[self.__serviceAddress][i] = {
-                        'ssn': ssn,
-                        'sender': ssn.sender(self.__serviceAddress),
-                        'receiver': ssn.receiver('reply-%s; {create:always, delete:always, node: { type: queue, durable: False, x-declare: { exclusive: False, auto-delete: True } }}' % ssn.name),
-                        'locked': False}
+        # Share one reply channel per connection
+        with AMQPServiceProxy.channel_lock:
+            if not conn in AMQPServiceProxy.channel:
+                AMQPServiceProxy.channel[conn] = AMQPReplyChannel(conn,
+                    url['user'], max_pending)
 
         # Store connection
         self.__conn = conn
-        self.__ssn = None
-        self.__sender = None
-        self.__receiver = None
-        self.__worker = None
+        self.__channel = AMQPServiceProxy.channel[conn]
 
         # Retrieve methods
         try:
@@ -97,36 +414,15 @@ class AMQPServiceProxy(object):
             AMQPServiceProxy.methods[self.__serviceAddress] = None
             AMQPServiceProxy.methods[self.__serviceAddress] = self.getMethods()
 
-            # If we've no direct queue, we need to push to different queues
-            if AMQPServiceProxy.domain:
-                queues = set([
-                        x['target'] for x in AMQPServiceProxy.methods[self.__serviceAddress].itervalues()
-                        if x['target'] != 'core'
-                    ])
-
-                # Pre instanciate queue sessions
-                for queue in queues:
-                    for i in range(0, workers):
-                        ssn = conn.session(str(uuid4()))
-                        AMQPServiceProxy.worker[queue] = {}
-                        AMQPServiceProxy.worker[queue][i] = {
-                                'ssn': ssn,
-                                'sender': ssn.sender("%s.command.%s" %
-                                    (AMQPServiceProxy.domain, queue)),
-                                'receiver': ssn.receiver('reply-%s; {create:always, delete:always, node: { type: queue, durable: False, x-declare: { exclusive: False, auto-delete: True } }}' % ssn.name),
-                                'locked': False}
-
-
     def close(self):
         """
         Close the AMQP connection established by the proxy.
         """
+        with AMQPServiceProxy.channel_lock:
+            channel = AMQPServiceProxy.channel.pop(self.__conn, None)
 
-        # Close all senders/receivers
-        for value in AMQPServiceProxy.worker.values():
-            for vvalue in value.values():
-                vvalue['sender'].close()
-                vvalue['receiver'].close()
+        if channel:
+            channel.close()
 
         self.__conn.close()
 
@@ -142,83 +438,50 @@ class AMQPServiceProxy(object):
             name = "%s.%s" % (self.__serviceName, name)
 
         return AMQPServiceProxy(self.__serviceURL, self.__serviceAddress, name,
-                self.__conn, workers=self.__workers)
+                self.__conn, workers=self.__workers, timeout=self.__timeout,
+                max_pending=self.__max_pending)
 
-    def __call__(self, *args, **kwargs):
+    def future(self, *args, **kwargs):
+        """
+        Send the call without waiting for the result.
+
+        ``Return:`` :class:`gosa.common.components.amqp_proxy.AMQPFuture`
+        """
         if len(kwargs) > 0 and len(args) > 0:
             raise JSONRPCException("JSON-RPC does not support positional and keyword arguments at the same time")
 
-        # Default to 'core' queue, pylint: disable=W0612
-        queue = "core"
-
-        if AMQPServiceProxy.methods[self.__serviceAddress]:
-            if not self.__serviceName in AMQPServiceProxy.methods[self.__serviceAddress]:
-                raise NameError("name '%s' not defined" % self.__serviceName)
+        methods = AMQPServiceProxy.methods[self.__serviceAddress]
+        if methods and not self.__serviceName in methods:
+            raise NameError("name '%s' not defined" % self.__serviceName)
 
-            if AMQPServiceProxy.domain:
-                queue = AMQPServiceProxy.methods[self.__serviceAddress][self.__serviceName]['target']
-            else:
-                queue = self.__serviceAddress
-
-        # Find free session for requested queue
-        for sess, dsc in AMQPServiceProxy.worker[self.__serviceAddress].iteritems():
-            if not dsc['locked']:
-                self.__ssn = dsc['ssn']
-                self.__sender = dsc['sender']
-                self.__receiver = dsc['receiver']
-                self.__worker = sess
-                dsc['locked'] = True
-                break
-
-        # No free session?
-        if not self.__ssn:
-            raise AMQPException('no free session - increase workers')
-
-        # Send
-        if len(kwargs):
-            postdata = dumps({"method": self.__serviceName, 'params': kwargs, 'id': 'jsonrpc'})
-        else:
-            postdata = dumps({"method": self.__serviceName, 'params': args, 'id': 'jsonrpc'})
-
-        message = Message(postdata)
-        message.user_id = self.__URL['user']
-        message.reply_to = 'reply-%s' % self.__ssn.name
-        self.__sender.send(message)
+        return self.__channel.submit(self.__serviceAddress, self.__serviceName,
+            kwargs if len(kwargs) else args, self.__timeout, self.__transform)
 
-        # Get response
-        respdata = self.__receiver.fetch()
-        resp = loads(respdata.content)
-        self.__ssn.acknowledge(respdata)
-
-        if resp['error'] != None:
-            AMQPServiceProxy.worker[self.__serviceAddress][self.__worker]['locked'] = False
-            raise JSONRPCException(resp['error'])
+    def __call__(self, *args, **kwargs):
+        return self.future(*args, **kwargs).result()
 
-        else:
-            # Look for json class hint
-            if "result" in resp and \
-                isinstance(resp["result"], DictType) and \
-                "__jsonclass__" in resp["result"] and \
-                resp["result"]["__jsonclass__"][0] == "json.ObjectFactory":
+    def __transform(self, result):
+        # Look for json class hint
+        if isinstance(result, DictType) and \
+            "__jsonclass__" in result and \
+            result["__jsonclass__"][0] == "json.ObjectFactory":
 
-                resp = resp["result"]
-                jc = resp["__jsonclass__"][1]
-                del resp["__jsonclass__"]
+            jc = result["__jsonclass__"][1]
+            del result["__jsonclass__"]
 
-                # Extract property presets
-                data = {}
-                for prop in resp:
-                    data[prop] = resp[prop]
+            # Extract property presets
+            data = {}
+            for prop in result:
+                data[prop] = result[prop]
 
-                jc.insert(0, AMQPServiceProxy(self.__serviceURL,
-                    self.__serviceAddress, None, self.__conn,
-                    workers=self.__workers))
-                jc.append(data)
-                AMQPServiceProxy.worker[self.__serviceAddress][self.__worker]['locked'] = False
-                return ObjectFactory.get_instance(*jc)
+            jc.insert(0, AMQPServiceProxy(self.__serviceURL,
+                self.__serviceAddress, None, self.__conn,
+                workers=self.__workers, timeout=self.__timeout,
+                max_pending=self.__max_pending))
+            jc.append(data)
+            return ObjectFactory.get_instance(*jc)
 
-            AMQPServiceProxy.worker[self.__serviceAddress][self.__worker]['locked'] = False
-            return resp['result']
+        return result
 
 
 class AMQPEventConsumer(object):
@@ -306,9 +569,11 @@ class AMQPEventConsumer(object):
 
     #pylint: disable=W0613
     def __eventProcessor(self, ssn, data):
-        # Call callback, let exceptions pass to the caller
+        # Call callback, let exceptions pass to the caller - batches are
+        # passed on event by event
         xml = objectify.fromstring(data.content)
-        self.__callback(xml)
+        for event in unpack_events(xml):
+            self.__callback(event)
 
     def join(self):
         self.__eventWorker.join()
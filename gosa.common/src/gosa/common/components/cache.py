@@ -1,10 +1,302 @@
+"""
+The cache module provides a size bounded, thread safe LRU cache with
+per-entry time to live and the ``cache`` decorator which uses it to
+remember the results of functions and methods.
+
+Results which are ``None`` are treated as negative results and can be kept
+for a different time than positive ones. Concurrent misses for the same key
+are only loaded once - the other threads wait for the result of the first
+one. Exceptions raised by the loader are passed to all waiting threads, but
+are not cached.
+
+Every named cache is registered and can be looked up by its name, i.e. to
+collect statistics or to invalidate it::
+
+    >>> from gosa.common.components.cache import Cache
+    >>> Cache.get_cache("amires.telekom").get_statistics()
+"""
+import sys
 import time
 import functools
+from threading import Lock, Event
+from weakref import WeakValueDictionary
+from collections import OrderedDict
+
+
+class _Call(object):
+    """ Load of a key which is currently in progress. """
+
+    def __init__(self):
+        self.event = Event()
+        self.value = None
+        self.error = None
+        self.valid = True
+
+
+class Cache(object):
+    """
+    Size bounded LRU cache with per-entry expiry.
+
+    ============ ============
+    Parameter    Description
+    ============ ============
+    size         maximum number of entries, the least recently used ones are evicted
+    ttl          time to keep entries in seconds, *None* keeps them until evicted
+    negative_ttl time to keep *None* results in seconds, defaults to *ttl*, 0 disables caching them
+    name         register the cache using this name
+    ============ ============
+    """
+    __caches = WeakValueDictionary()
+    __caches_lock = Lock()
+
+    def __init__(self, size=1000, ttl=None, negative_ttl=None, name=None):
+        self.size = size
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.name = name
+
+        self.__lock = Lock()
+        self.__data = OrderedDict()
+        self.__pending = {}
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+        self.__expired = 0
+        self.__waits = 0
+
+        if name:
+            with Cache.__caches_lock:
+                Cache.__caches[name] = self
+
+    def get(self, key, default=None):
+        """
+        Return the cached value for *key*.
+
+        ========= ============
+        Parameter Description
+        ========= ============
+        key       hashable key
+        default   value to return if the key is not cached
+        ========= ============
+
+        ``Return:`` cached value or *default*
+        """
+        with self.__lock:
+            found, value = self.__lookup(key)
+            if found:
+                self.__hits += 1
+                return value
+
+            self.__misses += 1
+            return default
+
+    def load(self, key, loader):
+        """
+        Return the cached value for *key*, calling *loader* to create it
+        if it is not cached. Only one thread calls the loader for a key
+        at a time, the others wait for its result.
+
+        ========= ============
+        Parameter Description
+        ========= ============
+        key       hashable key
+        loader    callable without arguments which returns the value
+        ========= ============
+
+        ``Return:`` cached or loaded value
+        """
+        with self.__lock:
+            found, value = self.__lookup(key)
+            if found:
+                self.__hits += 1
+                return value
+
+            call = self.__pending.get(key)
+            if call:
+                self.__waits += 1
+                leader = False
+            else:
+                call = self.__pending[key] = _Call()
+                self.__misses += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error:
+                raise call.error[0], call.error[1], call.error[2]
+            return call.value
+
+        try:
+            call.value = loader()
+
+        except:
+            call.error = sys.exc_info()
+            raise
+
+        finally:
+            with self.__lock:
+                del self.__pending[key]
+                if call.valid and not call.error:
+                    self.__store(key, call.value)
+            call.event.set()
+
+        return call.value
+
+    def set(self, key, value):
+        """
+        Put *value* into the cache.
+
+        ========= ============
+        Parameter Description
+        ========= ============
+        key       hashable key
+        value     value to cache, *None* is cached as negative result
+        ========= ============
+        """
+        with self.__lock:
+            call = self.__pending.get(key)
+            if call:
+                call.valid = False
+            self.__store(key, value)
+
+    def invalidate(self, key):
+        """
+        Remove *key* from the cache. A load of the key which is in
+        progress is not cached.
+
+        ========= ============
+        Parameter Description
+        ========= ============
+        key       hashable key
+        ========= ============
+
+        ``Return:`` True if the key was cached
+        """
+        with self.__lock:
+            call = self.__pending.get(key)
+            if call:
+                call.valid = False
+            return self.__data.pop(key, None) is not None
+
+    def clear(self):
+        """
+        Remove all entries from the cache.
+        """
+        with self.__lock:
+            for call in self.__pending.values():
+                call.valid = False
+            self.__data.clear()
+
+    def sweep(self):
+        """
+        Remove the expired entries.
+
+        ``Return:`` number of removed entries
+        """
+        now = time.time()
+        with self.__lock:
+            expired = [k for k, (v, expires) in self.__data.iteritems()
+                       if expires is not None and expires <= now]
+            for key in expired:
+                del self.__data[key]
+            self.__expired += len(expired)
+
+        return len(expired)
+
+    def get_statistics(self):
+        """
+        Return statistics about the cache usage:
+
+        ========== =============
+        Key        Description
+        ========== =============
+        size       Number of cached entries
+        max_size   Maximum number of entries
+        hits       Number of lookups answered from the cache
+        misses     Number of lookups not found in the cache
+        waits      Number of lookups which waited for a concurrent load
+        evictions  Number of entries removed to stay within *max_size*
+        expired    Number of entries removed after their time to live
+        ========== =============
+
+        ``Return:`` dict with statistics
+        """
+        with self.__lock:
+            return {
+                'size': len(self.__data),
+                'max_size': self.size,
+                'hits': self.__hits,
+                'misses': self.__misses,
+                'waits': self.__waits,
+                'evictions': self.__evictions,
+                'expired': self.__expired}
+
+    def __lookup(self, key):
+        entry = self.__data.pop(key, None)
+        if entry is None:
+            return False, None
+
+        value, expires = entry
+        if expires is not None and expires <= time.time():
+            self.__expired += 1
+            return False, None
+
+        # Re-insert to mark it as most recently used
+        self.__data[key] = entry
+        return True, value
+
+    def __store(self, key, value):
+        ttl = self.ttl if value is not None else self.negative_ttl
+        if ttl == 0:
+            self.__data.pop(key, None)
+            return
+
+        self.__data.pop(key, None)
+        self.__data[key] = (value, time.time() + ttl if ttl is not None else None)
+
+        while len(self.__data) > self.size:
+            self.__data.popitem(last=False)
+            self.__evictions += 1
+
+    def __contains__(self, key):
+        with self.__lock:
+            entry = self.__data.get(key)
+            return entry is not None and (entry[1] is None or entry[1] > time.time())
+
+    def __len__(self):
+        return len(self.__data)
+
+    @staticmethod
+    def get_cache(name):
+        """
+        Return the registered cache *name*.
+
+        ========= ============
+        Parameter Description
+        ========= ============
+        name      name of the cache
+        ========= ============
+
+        ``Return:`` :class:`Cache` or None
+        """
+        with Cache.__caches_lock:
+            return Cache.__caches.get(name)
+
+    @staticmethod
+    def get_caches():
+        """
+        Return the registered caches.
+
+        ``Return:`` dict of name and :class:`Cache`
+        """
+        with Cache.__caches_lock:
+            return dict(Cache.__caches.items())
+
 
 class cache(object):
     """
-    Caching decorator basically taken from the
-    `Python Wiki <http://wiki.python.org/moin/PythonDecoratorLibrary>`_.
+    Caching decorator, storing the results in a :class:`Cache` which is
+    keyed by the arguments of the call.
 
     >>> @cache(ttl=60)
     >>> def fibonacci(n):
@@ -14,38 +306,44 @@ class cache(object):
     ...    return fibonacci(n-1) + fibonacci(n-2)
     >>>
     >>> fibonacci(12)
+    >>> fibonacci.invalidate(12)
+
+    Calls with unhashable arguments are not cached. The cache is available
+    as the ``cache`` attribute of the decorated function.
 
-    ========= ============
-    Parameter Description
-    ========= ============
-    ttl       time to cache results in seconds
-    ========= ============
+    ============ ============
+    Parameter    Description
+    ============ ============
+    ttl          time to cache results in seconds
+    size         maximum number of cached results
+    negative_ttl time to cache *None* results in seconds, defaults to *ttl*
+    name         name to register the cache with, defaults to module and function name
+    ============ ============
     """
 
-    def __init__(self,  ttl=None):
+    def __init__(self, ttl=None, size=1000, negative_ttl=None, name=None):
         self.ttl = ttl
-        self.cache = {}
+        self.size = size
+        self.negative_ttl = negative_ttl
+        self.name = name
 
     def __call__(self, func):
+        store = Cache(self.size, self.ttl, self.negative_ttl,
+                      self.name or "%s.%s" % (func.__module__, func.__name__))
 
-        def wrap(*args):
-            now = time.time()
+        def key(args, kwargs):
+            return args + tuple(sorted(kwargs.items())) if kwargs else args
 
+        @functools.wraps(func)
+        def wrap(*args, **kwargs):
+            k = key(args, kwargs)
             try:
-                rep = str(args)
-                if rep in self.cache and (not self.ttl or (now -
-                        self.cache[rep][1] < self.ttl)):
-                    return self.cache[rep][0]
-                else:
-                    value = func(*args)
-                    self.cache[rep] = (value, now)
-                    return value
-
+                hash(k)
             except TypeError:
-                return func(*args)
+                return func(*args, **kwargs)
 
-        return wrap
+            return store.load(k, lambda: func(*args, **kwargs))
 
-    def __get__(self, obj, objtype):
-        """Support instance methods."""
-        return functools.partial(self.__call__, obj)
+        wrap.cache = store
+        wrap.invalidate = lambda *args, **kwargs: store.invalidate(key(args, kwargs))
+        return wrap
@@ -16,6 +16,24 @@ class JSONRPCException(Exception):
 
 
 class ObjectFactory(object):
+    """
+    Local representation of an object opened on the agent side.
+
+    Property changes are collected and sent with a single
+    ``setObjectProperties`` call, when :meth:`_flush` is called or right
+    before a method of the object is dispatched::
+
+        >>> user = proxy.openObject('object.user', dn)
+        >>> user.givenName = u"Klaus"
+        >>> user.sn = u"Mustermann"
+        >>> user._flush()
+
+    Properties which could not be set are reverted to their previous
+    values and reported by a :class:`JSONRPCException`.
+    """
+
+    #: Methods available thru the proxy object
+    _internal = ('_flush', '_refresh')
 
     def __init__(self, proxy, ref, oid, methods, properties, data):
         object.__setattr__(self, "proxy", proxy)
@@ -23,19 +41,58 @@ class ObjectFactory(object):
         object.__setattr__(self, "oid", oid)
         object.__setattr__(self, "methods", methods)
         object.__setattr__(self, "properties", properties)
+        object.__setattr__(self, "dirty", {})
 
         for prop in properties:
             object.__setattr__(self, "_" + prop, None if not prop in data else data[prop])
 
     def _call(self, name, *args, **kwargs):
+        object.__getattribute__(self, "_flush")()
         ref = object.__getattribute__(self, "ref")
         return object.__getattribute__(self, "proxy").dispatchObjectMethod(ref,
                 name, *args, **kwargs)
 
+    def _flush(self):
+        """
+        Send the collected property changes to the agent.
+        """
+        dirty = object.__getattribute__(self, "dirty")
+        if not dirty:
+            return
+
+        ref = object.__getattribute__(self, "ref")
+        values = dict([(name, object.__getattribute__(self, "_" + name)) for name in dirty])
+
+        # Keep the changes if the call fails, so that they can be sent again
+        errors = object.__getattribute__(self, "proxy").setObjectProperties(ref, values)
+        object.__setattr__(self, "dirty", {})
+
+        if errors:
+            for name in errors:
+                if name in dirty:
+                    object.__setattr__(self, "_" + name, dirty[name])
+
+            raise JSONRPCException(errors)
+
+    def _refresh(self):
+        """
+        Drop the collected property changes and reload all property
+        values from the agent.
+        """
+        ref = object.__getattribute__(self, "ref")
+        values = object.__getattribute__(self, "proxy").getObjectProperties(ref)
+        object.__setattr__(self, "dirty", {})
+
+        for prop, value in values.items():
+            object.__setattr__(self, "_" + prop, value)
+
     def __getattribute__(self, name):
         if name in object.__getattribute__(self, "methods"):
             return lambda *f: object.__getattribute__(self, "_call")(*[name] + list(f))
 
+        if name in ObjectFactory._internal:
+            return object.__getattribute__(self, name)
+
         if not name in object.__getattribute__(self, "properties"):
             raise AttributeError("'%s' object has no attribute '%s'" %
                 (type(self).__name__, name))
@@ -47,8 +104,11 @@ class ObjectFactory(object):
             raise AttributeError("'%s' object has no attribute '%s'" %
                 (type(self).__name__, name))
 
-        ref = object.__getattribute__(self, "ref")
-        object.__getattribute__(self, "proxy").setObjectProperty(ref, name, value)
+        # Remember the value known by the agent to be able to revert
+        dirty = object.__getattribute__(self, "dirty")
+        if not name in dirty:
+            dirty[name] = object.__getattribute__(self, "_" + name)
+
         object.__setattr__(self, "_" + name, value)
 
     def __repr__(self):
@@ -121,14 +121,78 @@ class PluginRegistry(object):
         return PluginRegistry.modules[name]
 
     @staticmethod
-    def getEventSchema():
+    def getEventDependencies(event):
+        """
+        Return the events whose schemas define types used by the schema
+        of the given event.
+
+        =============== ============
+        Parameter       Description
+        =============== ============
+        event           event name
+        =============== ============
+
+        ``Return:`` set of event names
+        """
+        # Collect defined and referenced types of all events. Types are
+        # used by 'type' and 'base', elements and groups by 'ref'.
+        types = {}
+        refs = {}
+        for name, file_path in PluginRegistry.evreg.iteritems():
+            xsd = etree.parse(file_path).getroot()
+            for node in xsd.iterchildren(tag=etree.Element):
+                kind = 'type' if etree.QName(node).localname in ('complexType', 'simpleType') else 'ref'
+                if node.get('name'):
+                    types[(kind, node.get('name'))] = name
+
+            refs[name] = set()
+            for node in xsd.iter(tag=etree.Element):
+                for attr, kind in (('type', 'type'), ('base', 'type'), ('ref', 'ref')):
+                    value = node.get(attr)
+                    if value and value.startswith('gosa:'):
+                        refs[name].add((kind, value[5:]))
+
+        res = set()
+        todo = [event]
+        while todo:
+            for ref in refs.get(todo.pop(), ()):
+                dep = types.get(ref)
+                if dep and dep != event and not dep in res:
+                    res.add(dep)
+                    todo.append(dep)
+
+        return res
+
+    @staticmethod
+    def getEventSchema(events=None):
+        """
+        Return the XSD which validates the registered events.
+
+        =============== ============
+        Parameter       Description
+        =============== ============
+        events          list of event names to include, defaults to all events
+        =============== ============
+
+        ``Return:`` XSD string
+        """
         stylesheet = resource_filename('gosa.common', 'data/events/events.xsl')
         eventsxml = "<events>"
 
-        for file_path in PluginRegistry.evreg.values():
+        # Include the events defining types used by the requested ones
+        needed = None
+        if events is not None:
+            needed = set(events)
+            for event in events:
+                needed |= PluginRegistry.getEventDependencies(event)
+
+        for event, file_path in PluginRegistry.evreg.iteritems():
+            if needed is not None and not event in needed:
+                continue
 
             # Build a tree of all event paths
-            eventsxml += '<path name="%s">%s</path>' % (os.path.splitext(os.path.basename(file_path))[0], file_path)
+            eventsxml += '<path name="%s"%s>%s</path>' % (os.path.splitext(os.path.basename(file_path))[0],
+                ' dependency="true"' if events is not None and not event in events else '', file_path)
 
         eventsxml += '</events>'
 
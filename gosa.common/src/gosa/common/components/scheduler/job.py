@@ -130,6 +130,7 @@ class Job(object):
         state = self.__dict__.copy()
         state.pop('instances', None)
         state.pop('func', None)
+        state.pop('callback', None)
         state.pop('_lock', None)
         state['func_ref'] = obj_to_ref(self.func)
         state['callback_ref'] = obj_to_ref(self.callback) if self.callback else None
@@ -138,7 +139,8 @@ class Job(object):
     def __setstate__(self, state):
         state['instances'] = 0
         state['func'] = ref_to_obj(state.pop('func_ref'))
-        state['callback'] = ref_to_obj(state.pop('callback_ref'))
+        callback_ref = state.pop('callback_ref', None)
+        state['callback'] = ref_to_obj(callback_ref) if callback_ref else None
         state['_lock'] = Lock()
         #pylint: disable=W0201
         self.__dict__ = state
@@ -19,7 +19,12 @@ class JobStore(object):
         raise NotImplementedError
 
     def load_jobs(self):
-        """Loads jobs from this store into memory."""
+        """
+        Loads jobs from this store into memory.
+
+        :return: tuple of the jobs which have been loaded and the jobs
+            which have been dropped
+        """
         raise NotImplementedError
 
     def migrate_jobs(self, job, origin):
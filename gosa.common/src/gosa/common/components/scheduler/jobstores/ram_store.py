@@ -20,7 +20,7 @@ class RAMJobStore(JobStore):
         self.jobs.remove(job)
 
     def load_jobs(self):
-        pass
+        return [], []
 
     def migrate_jobs(self, job, origin):
         pass
@@ -1,14 +1,29 @@
 """
 Stores jobs in a database table using SQLAlchemy.
+
+Updates of the run state of jobs - which happen on every execution - are
+collected and written in one transaction every ``flush_interval`` seconds.
+Every write bumps the ``version`` and ``updated`` columns of a row, so
+that reloading the jobs only needs to read the rows which have changed
+since the last load. Removed jobs are recorded in a second table
+(``<tablename>_removed``) for ``removed_ttl`` seconds, so that other
+nodes find them without reading the ids of all jobs.
+
+If an ``origin`` is given, only the jobs of this origin and the jobs of
+other origins which are due within ``foreign_window`` seconds are kept in
+memory.
 """
+import time
 import pickle
 import logging
+from threading import Thread, Event, Lock
+from datetime import datetime, timedelta
 
 from gosa.common.components.scheduler.jobstores.base import JobStore
 from gosa.common.components.scheduler.job import Job, JOB_WAITING, JOB_ERROR
 
 try:
-    from sqlalchemy import create_engine, Table, MetaData, Column, Integer, Sequence, PickleType, Boolean, BigInteger, select, and_, String, Unicode, DateTime
+    from sqlalchemy import create_engine, Table, MetaData, Column, Integer, Sequence, PickleType, Boolean, BigInteger, select, and_, or_, String, Unicode, DateTime, Float, bindparam, func
 except ImportError:  # pragma: nocover
     raise ImportError('SQLAlchemyJobStore requires SQLAlchemy installed')
 
@@ -16,10 +31,28 @@ logger = logging.getLogger(__name__)
 
 
 class SQLAlchemyJobStore(JobStore):
+
+    #: Seconds the ``updated`` column may lag behind due to clock skew
+    #: between nodes or long running transactions
+    update_margin = 10
+
+    #: Seconds to keep the records of removed jobs
+    removed_ttl = 86400
+
     def __init__(self, url=None, engine=None, tablename='gosa.common.components.scheduler_jobs',
-                 metadata=None, pickle_protocol=pickle.HIGHEST_PROTOCOL):
+                 metadata=None, pickle_protocol=pickle.HIGHEST_PROTOCOL,
+                 flush_interval=5, origin=None, foreign_window=120):
         self.jobs = []
         self.pickle_protocol = pickle_protocol
+        self.flush_interval = flush_interval
+        self.origin = origin
+        self.foreign_window = foreign_window
+
+        self._lock = Lock()
+        self._dirty = {}
+        self._loaded = {}
+        self._last_update = None
+        self._horizon = None
 
         if engine:
             self.engine = engine
@@ -28,7 +61,8 @@ class SQLAlchemyJobStore(JobStore):
         else:
             raise ValueError('Need either "engine" or "url" defined')
 
-        self.jobs_t = Table(tablename, metadata or MetaData(),
+        metadata = metadata or MetaData()
+        self.jobs_t = Table(tablename, metadata,
             Column('id', Integer,
                    Sequence(tablename + '_id_seq', optional=True),
                    primary_key=True),
@@ -51,58 +85,264 @@ class SQLAlchemyJobStore(JobStore):
             Column('status', Integer, nullable=False),
             Column('max_runs', Integer),
             Column('max_instances', Integer),
-            Column('next_run_time', DateTime, nullable=False),
-            Column('runs', BigInteger))
+            Column('next_run_time', DateTime, nullable=False, index=True),
+            Column('runs', BigInteger),
+            Column('uuid', String(64), nullable=True),
+            Column('job_type', String(64), nullable=True),
+            Column('version', Integer, nullable=True),
+            Column('updated', Float, nullable=True, index=True))
+        self.removed_t = Table(tablename + '_removed', metadata,
+            Column('id', Integer, primary_key=True, autoincrement=False),
+            Column('removed', Float, nullable=False, index=True))
 
         self.jobs_t.create(self.engine, True)
+        self.removed_t.create(self.engine, True)
+        self._upgrade_table()
+
+        # Background writer for the collected job updates
+        self._stopped = Event()
+        if self.flush_interval:
+            self._flusher = Thread(target=self._flush_loop, name='SQLAlchemyJobStore')
+            self._flusher.setDaemon(True)
+            self._flusher.start()
+
+    def _upgrade_table(self):
+        """
+        Add columns and indexes which are missing in tables created by
+        older versions and mark the rows written by them as changed.
+        """
+        t = self.jobs_t
+        existing = Table(t.name, MetaData(), autoload=True,
+                         autoload_with=self.engine)
+
+        for column in t.columns:
+            if not column.name in existing.columns:
+                logger.info('adding column "%s" to table "%s"', column.name, t.name)
+                self.engine.execute('ALTER TABLE %s ADD COLUMN %s %s' % (
+                    self.engine.dialect.identifier_preparer.format_table(t), column.name,
+                    column.type.compile(dialect=self.engine.dialect)))
+
+        indexes = set(index.name for index in existing.indexes)
+        for index in t.indexes:
+            if not index.name in indexes:
+                logger.info('adding index "%s" to table "%s"', index.name, t.name)
+                index.create(self.engine)
+
+        # Rows without change tracking would never be refreshed
+        self.engine.execute(t.update().where(t.c.updated == None).values(
+            version=func.coalesce(t.c.version, 0), updated=time.time()))
 
     def add_job(self, job):
+        job.version = 0
+        job.updated = time.time()
         job_dict = job.__getstate__()
+        if job_dict.get('id') is None:
+            job_dict.pop('id', None)
+
         result = self.engine.execute(self.jobs_t.insert().values(**job_dict))
         job.id = result.inserted_primary_key[0]
-        self.jobs.append(job)
+
+        with self._lock:
+            self.jobs.append(job)
+            self._loaded[job.id] = job
 
     def remove_job(self, job):
-        delete = self.jobs_t.delete().where(self.jobs_t.c.id == job.id)
-        self.engine.execute(delete)
-        self.jobs.remove(job)
+        with self._lock:
+            self._dirty.pop(job.id, None)
+            self._loaded.pop(job.id, None)
+            self.jobs.remove(job)
 
-    def load_jobs(self):
-        jobs = []
-        for row in self.engine.execute(select([self.jobs_t])):
+        now = time.time()
+        r = self.removed_t
+        conn = self.engine.connect()
+        try:
+            trans = conn.begin()
             try:
-                job = Job.__new__(Job)
+                conn.execute(self.jobs_t.delete().where(self.jobs_t.c.id == job.id))
+                conn.execute(r.delete().where(or_(r.c.id == job.id,
+                                                  r.c.removed < now - self.removed_ttl)))
+                conn.execute(r.insert().values(id=job.id, removed=now))
+                trans.commit()
+            except:
+                trans.rollback()
+                raise
+        finally:
+            conn.close()
+
+    def load_jobs(self):
+        """
+        Loads the jobs from the database. The first call reads the whole
+        table, later calls only read the rows which have changed or have
+        been removed since.
+
+        :return: tuple of the jobs which have been loaded and the jobs
+            which have been dropped. Changed jobs are replaced by new
+            objects, so they show up in both lists.
+        """
+        # Don't let pending updates get overwritten by older states
+        self.flush()
+
+        now = time.time()
+        horizon = datetime.now() + timedelta(seconds=self.foreign_window)
+        t = self.jobs_t
+
+        if self._last_update is None:
+            query = select([t])
+
+        else:
+            # Changed rows and foreign jobs which got into the window
+            changed = t.c.updated > self._last_update - self.update_margin
+            if self.origin:
+                changed = or_(changed, and_(t.c.next_run_time <= horizon,
+                                            t.c.next_run_time > self._horizon))
+            query = select([t]).where(changed)
+
+        if self.origin and self._last_update is None:
+            query = query.where(or_(t.c.origin == self.origin,
+                                    t.c.next_run_time <= horizon))
+
+        # Read the removals first, a row removed in between is found by the
+        # next call
+        removed = []
+        if self._last_update is not None:
+            r = self.removed_t
+            removed = [row[0] for row in self.engine.execute(select([r.c.id]).where(
+                r.c.removed > self._last_update - self.update_margin))]
+
+        rows = self.engine.execute(query).fetchall()
+        loaded = []
+        dropped = []
+
+        with self._lock:
+            for job_id in removed:
+                if job_id in self._loaded:
+                    dropped.append(self._forget(self._loaded[job_id]))
+
+            for row in rows:
                 job_dict = dict(row.items())
-                job.__setstate__(job_dict)
+                current = self._loaded.get(job_dict['id'])
+                version = job_dict['version']
 
-                # Set jobs that have not been executed completely to ERROR
-                if job.status != JOB_WAITING:
-                    job.status = JOB_ERROR
+                # Skip rows we already know in this version
+                if current and version is not None and version == getattr(current, 'version', None):
+                    continue
 
-                # Treat our local jobs differently
-                jobs.append(job)
+                # Drop jobs we're not interested in anymore
+                if self.origin and job_dict['origin'] != self.origin and \
+                        job_dict['next_run_time'] > horizon:
+                    if current:
+                        dropped.append(self._forget(current))
+                    continue
 
-            except Exception:
-                job_name = job_dict.get('name', '(unknown)')
-                logger.exception('Unable to restore job "%s"', job_name)
+                job = self._restore(job_dict)
+                if job:
+                    if current:
+                        self.jobs[self.jobs.index(current)] = job
+                        dropped.append(current)
+                    else:
+                        self.jobs.append(job)
+                    self._loaded[job.id] = job
+                    loaded.append(job)
+
+        self._last_update = now
+        self._horizon = horizon
+        return loaded, dropped
+
+    def _restore(self, job_dict):
+        try:
+            job = Job.__new__(Job)
+            job.__setstate__(job_dict)
 
-        self.jobs = jobs
+            # Set jobs that have not been executed completely to ERROR
+            if job.status != JOB_WAITING:
+                job.status = JOB_ERROR
+
+            return job
+
+        except Exception:
+            job_name = job_dict.get('name', '(unknown)')
+            logger.exception('Unable to restore job "%s"', job_name)
+
+        return None
+
+    def _forget(self, job):
+        self._loaded.pop(job.id, None)
+        self._dirty.pop(job.id, None)
+        self.jobs.remove(job)
+        return job
 
     def migrate_jobs(self, job, origin):
         # Migrate job only if it still has it's original origin, elseways
         # someone else already migrated it...
         update = self.jobs_t.update().where(and_(self.jobs_t.c.origin ==
-            job.origin, self.jobs_t.c.id == job.id)).values(origin=origin)
-        self.engine.execute(update)
+            job.origin, self.jobs_t.c.id == job.id)).values(origin=origin,
+            version=(getattr(job, 'version', None) or 0) + 1, updated=time.time())
+
+        if self.engine.execute(update).rowcount == 1:
+            job.origin = origin
+            job.version = (getattr(job, 'version', None) or 0) + 1
+            return True
+
+        return False
 
     def update_job(self, job):
-        job_dict = job.__getstate__()
-        update = self.jobs_t.update().where(self.jobs_t.c.id == job.id).\
-            values(next_run_time=job_dict['next_run_time'],
-                   runs=job_dict['runs'])
-        self.engine.execute(update)
+        with self._lock:
+            job.version = (getattr(job, 'version', None) or 0) + 1
+            self._dirty[job.id] = job
+
+        if not self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the collected job updates in a single transaction.
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+
+            now = time.time()
+            jobs = self._dirty.values()
+            updates = [{'_id': job.id, 'next_run_time': job.next_run_time,
+                        'runs': job.runs, 'version': job.version, 'updated': now}
+                       for job in jobs]
+            self._dirty = {}
+
+        update = self.jobs_t.update().where(self.jobs_t.c.id == bindparam('_id')).\
+            values(next_run_time=bindparam('next_run_time'),
+                   runs=bindparam('runs'),
+                   version=bindparam('version'),
+                   updated=bindparam('updated'))
+
+        conn = self.engine.connect()
+        try:
+            trans = conn.begin()
+            try:
+                conn.execute(update, updates)
+                trans.commit()
+            except:
+                trans.rollback()
+
+                # Keep the updates for the next try
+                with self._lock:
+                    for job in jobs:
+                        if job.id in self._loaded:
+                            self._dirty.setdefault(job.id, job)
+                raise
+        finally:
+            conn.close()
+
+    def _flush_loop(self):
+        while not self._stopped.is_set():
+            self._stopped.wait(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Unable to write job updates')
 
     def close(self):
+        self._stopped.set()
+        self.flush()
         self.engine.dispose()
 
     def __repr__(self):
@@ -1,11 +1,17 @@
 """
 This module is the main part of the library. It houses the Scheduler class
 and related exceptions.
+
+The scheduler keeps the jobs of all job stores in a priority queue ordered
+by their next run time, so a wakeup only needs to look at the jobs which
+are actually due. Jobs are additionally indexed by their id, tag and owner.
 """
 
 from threading import Thread, Event, Lock
 from datetime import datetime, timedelta
 from logging import getLogger
+from itertools import count
+import heapq
 import os
 import sys
 import inspect
@@ -46,6 +52,18 @@ class Scheduler(object):
         self._listeners = []
         self._listeners_lock = Lock()
         self._pending_jobs = []
+
+        # Job queue and indexes, protected by the jobstores lock
+        self._queue = []
+        self._queue_seq = count()
+        self._queue_stale = 0
+        self._entries = {}
+        self._aliases = {}
+        self._parked = {}
+        self._ids = {}
+        self._tags = {}
+        self._owners = {}
+
         self.configure(gconfig, **options)
 
     def configure(self, gconfig={}, **options):
@@ -148,6 +166,7 @@ class Scheduler(object):
                 raise KeyError('Alias "%s" is already in use' % alias)
             self._jobstores[alias] = jobstore
             jobstore.load_jobs()
+            self._index_jobstore(alias)
         finally:
             self._jobstores_lock.release()
 
@@ -162,8 +181,18 @@ class Scheduler(object):
         self._wakeup.set()
 
     def refresh(self):
-        for jobstore in itervalues(self._jobstores):
-            jobstore.load_jobs()
+        self._jobstores_lock.acquire()
+        try:
+            for alias, jobstore in iteritems(self._jobstores):
+                loaded, dropped = jobstore.load_jobs()
+
+                # Only touch the queue entries of changed jobs
+                for job in dropped:
+                    self._unindex_job(job)
+                for job in loaded:
+                    self._index_job(job, alias)
+        finally:
+            self._jobstores_lock.release()
 
         self._wakeup.set()
 
@@ -176,11 +205,14 @@ class Scheduler(object):
         self._jobstores_lock.acquire()
         try:
             try:
-                del self._jobstores[alias]
+                jobstore = self._jobstores.pop(alias)
 
             except KeyError:
                 raise ValueError('No such job store: %s' % alias)
 
+            for job in jobstore.jobs:
+                self._unindex_job(job)
+
         finally:
             self._jobstores_lock.release()
 
@@ -242,6 +274,7 @@ class Scheduler(object):
             except KeyError:
                 raise KeyError('No such job store: %s' % jobstore)
             store.add_job(job)
+            self._index_job(job, jobstore)
         finally:
             self._jobstores_lock.release()
 
@@ -281,6 +314,7 @@ class Scheduler(object):
 
     def _remove_job(self, job, alias, jobstore):
         jobstore.remove_job(job)
+        self._unindex_job(job)
 
         # Notify listeners that a job has been removed
         event = JobStoreEvent(EVENT_JOBSTORE_JOB_REMOVED, alias, job)
@@ -406,10 +440,10 @@ class Scheduler(object):
         """
         self._jobstores_lock.acquire()
         try:
-            for alias, jobstore in iteritems(self._jobstores):
-                if job in list(jobstore.jobs):
-                    self._remove_job(job, alias, jobstore)
-                    return
+            if id(job) in self._aliases:
+                alias = self._aliases[id(job)][1]
+                self._remove_job(job, alias, self._jobstores[alias])
+                return
         finally:
             self._jobstores_lock.release()
 
@@ -435,24 +469,62 @@ class Scheduler(object):
                            'scheduler')
 
     def get_job_by_id(self, job_id):
-        job_object = None
-
+        """
+        Returns the job with the given id or None.
+        """
         self._jobstores_lock.acquire()
         try:
-            for alias, jobstore in iteritems(self._jobstores):
-                if jobstore.jobs:
-                    for job in jobstore.jobs:
-                        if job.uuid == job_id:
-                            job_object = job
-                            break
+            return self._ids.get(job_id)
+        finally:
+            self._jobstores_lock.release()
 
-                if job_object:
-                    break
+    def get_jobs_by_tag(self, tag):
+        """
+        Returns a list of jobs having the given tag.
+        """
+        self._jobstores_lock.acquire()
+        try:
+            return list(self._tags.get(tag, ()))
+        finally:
+            self._jobstores_lock.release()
 
+    def get_jobs_by_owner(self, owner):
+        """
+        Returns a list of jobs owned by the given owner.
+        """
+        self._jobstores_lock.acquire()
+        try:
+            return list(self._owners.get(owner, ()))
         finally:
             self._jobstores_lock.release()
 
-        return job_object
+    def get_due_jobs(self, before):
+        """
+        Returns a list of jobs which are due to run before the given time,
+        including jobs of other origins which have not been run yet.
+
+        :param before: :class:`datetime.datetime` to compare with
+        """
+        self._jobstores_lock.acquire()
+        try:
+            jobs = [job for job in itervalues(self._parked)
+                    if job.next_run_time and job.next_run_time < before]
+
+            # Walk the heap, but only descend into due entries
+            queue = self._queue
+            stack = [0] if queue else []
+            while stack:
+                i = stack.pop()
+                entry = queue[i]
+                if entry[0] >= before:
+                    continue
+                if entry[2] is not None:
+                    jobs.append(entry[2])
+                stack.extend(c for c in (2 * i + 1, 2 * i + 2) if c < len(queue))
+
+            return jobs
+        finally:
+            self._jobstores_lock.release()
 
     def print_jobs(self, out=None):
         """
@@ -545,51 +617,141 @@ class Scheduler(object):
                     break
 
     def migrate_job(self, job):
-        for alias, jobstore in iteritems(self._jobstores):
-            if jobstore.jobs and job in jobstore.jobs:
-                jobstore.migrate_job(job, self.origin)
-                break
+        self._jobstores_lock.acquire()
+        try:
+            if id(job) in self._aliases:
+                alias = self._aliases[id(job)][1]
+                self._jobstores[alias].migrate_jobs(job, self.origin)
+                self._schedule_job(job)
+        finally:
+            self._jobstores_lock.release()
 
         self.reschedule()
 
+    def _index_job(self, job, alias):
+        """
+        Adds the job to the queue and the indexes. The jobstores lock
+        must be held.
+        """
+        self._aliases[id(job)] = (job, alias)
+
+        job_id = getattr(job, 'uuid', None)
+        if job_id:
+            self._ids[job_id] = job
+        if job.tag is not None:
+            self._tags.setdefault(job.tag, set()).add(job)
+        if job.owner is not None:
+            self._owners.setdefault(job.owner, set()).add(job)
+
+        self._schedule_job(job)
+
+    def _unindex_job(self, job):
+        """
+        Removes the job from the queue and the indexes. The jobstores lock
+        must be held.
+        """
+        if self._aliases.pop(id(job), None) is None:
+            return
+
+        self._unschedule_job(job)
+
+        job_id = getattr(job, 'uuid', None)
+        if job_id and self._ids.get(job_id) is job:
+            del self._ids[job_id]
+
+        for index, key in ((self._tags, job.tag), (self._owners, job.owner)):
+            jobs = index.get(key)
+            if jobs is not None:
+                jobs.discard(job)
+                if not jobs:
+                    del index[key]
+
+    def _index_jobstore(self, alias):
+        """
+        Rebuilds the queue entries and indexes for all jobs of a job store,
+        i.e. after it has been added. The jobstores lock must be
+        held.
+        """
+        for job, job_alias in list(itervalues(self._aliases)):
+            if job_alias == alias:
+                self._unindex_job(job)
+
+        for job in self._jobstores[alias].jobs:
+            self._index_job(job, alias)
+
+    def _schedule_job(self, job):
+        """
+        (Re)inserts the job into the queue according to its next run time.
+        Old queue entries are invalidated, not removed.
+        """
+        self._unschedule_job(job)
+        if job.next_run_time:
+            entry = [job.next_run_time, next(self._queue_seq), job]
+            self._entries[id(job)] = entry
+            heapq.heappush(self._queue, entry)
+
+    def _unschedule_job(self, job):
+        self._parked.pop(id(job), None)
+        entry = self._entries.pop(id(job), None)
+        if entry:
+            entry[2] = None
+            self._queue_stale += 1
+
+            # Get rid of the invalidated entries if they're getting too many
+            if self._queue_stale > len(self._queue) / 2 + 100:
+                self._queue = [e for e in self._queue if e[2] is not None]
+                heapq.heapify(self._queue)
+                self._queue_stale = 0
+
     def _process_jobs(self, now):
         """
-        Iterates through jobs in every jobstore, starts pending jobs
-        and figures out the next wakeup time.
+        Takes the due jobs from the queue, starts them and figures out
+        the next wakeup time.
         """
-        next_wakeup_time = None
         self._jobstores_lock.acquire()
         try:
-            for alias, jobstore in iteritems(self._jobstores):
-                for job in tuple(jobstore.jobs):
-                    run_times = job.get_run_times(now)
-
-                    if run_times:
-                        # Continue if this is not our job. Should be completely handled by
-                        # other nodes.
-                        if job.origin != self.origin:
-                            continue
-
-                        self._threadpool.submit(self._run_job, job, run_times)
-
-                        # Increase the job's run count
-                        if job.coalesce:
-                            job.runs += 1
-                        else:
-                            job.runs += len(run_times)
-
-                        # Update the job, but don't keep finished jobs around
-                        if job.compute_next_run_time(now + timedelta(microseconds=1)):
-                            jobstore.update_job(job)
-                        else:
-                            self._remove_job(job, alias, jobstore)
-
-                    if not next_wakeup_time:
-                        next_wakeup_time = job.next_run_time
-                    elif job.next_run_time:
-                        next_wakeup_time = min(next_wakeup_time,
-                                               job.next_run_time)
-            return next_wakeup_time
+            while self._queue and self._queue[0][0] <= now:
+                entry = heapq.heappop(self._queue)
+                job = entry[2]
+
+                # Skip invalidated entries
+                if job is None:
+                    self._queue_stale -= 1
+                    continue
+                del self._entries[id(job)]
+
+                alias = self._aliases[id(job)][1]
+                jobstore = self._jobstores[alias]
+                run_times = job.get_run_times(now)
+
+                # Park it if there's nothing to run (i.e. max_runs is reached) or
+                # if this is not our job. The latter should be completely handled
+                # by other nodes, or migrated to us.
+                if not run_times or job.origin != self.origin:
+                    self._parked[id(job)] = job
+                    continue
+
+                self._threadpool.submit(self._run_job, job, run_times)
+
+                # Increase the job's run count
+                if job.coalesce:
+                    job.runs += 1
+                else:
+                    job.runs += len(run_times)
+
+                # Update the job, but don't keep finished jobs around
+                if job.compute_next_run_time(now + timedelta(microseconds=1)):
+                    jobstore.update_job(job)
+                    self._schedule_job(job)
+                else:
+                    self._remove_job(job, alias, jobstore)
+
+            # Drop invalidated entries from the top to find the next wakeup
+            while self._queue and self._queue[0][2] is None:
+                heapq.heappop(self._queue)
+                self._queue_stale -= 1
+
+            return self._queue[0][0] if self._queue else None
         finally:
             self._jobstores_lock.release()
 
@@ -25,7 +25,7 @@
 				<choice>
 
 					<!-- Create the possible Events -->
-					<xsl:for-each select="/events/path">
+					<xsl:for-each select="/events/path[not(@dependency)]">
 						<xsl:variable name="nodename">
 							<xsl:value-of select="@name" />
 						</xsl:variable>
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import time
+import unittest
+from threading import Thread
+from gosa.common.components.cache import Cache, cache
+
+
+class TestCache(unittest.TestCase):
+
+    def test_lru(self):
+        c = Cache(size=2)
+        c.set("a", 1)
+        c.set("b", 2)
+        self.assertEqual(c.get("a"), 1)
+        c.set("c", 3)
+        self.assertFalse("b" in c)
+        self.assertEqual(len(c), 2)
+
+        stats = c.get_statistics()
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['hits'], 1)
+
+    def test_ttl(self):
+        c = Cache(ttl=0.05, negative_ttl=0)
+        c.set("a", 1)
+        c.set("b", None)
+        self.assertTrue("a" in c)
+        self.assertFalse("b" in c)
+
+        time.sleep(0.1)
+        self.assertEqual(c.get("a", 0), 0)
+        self.assertEqual(c.get_statistics()['expired'], 1)
+
+    def test_single_flight(self):
+        calls = []
+
+        @cache()
+        def slow(n):
+            calls.append(n)
+            time.sleep(0.1)
+            return n * 2
+
+        threads = [Thread(target=slow, args=(4,)) for i in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(calls, [4])
+        self.assertEqual(slow(4), 8)
+        self.assertEqual(slow.cache.get_statistics()['waits'], 4)
+
+        slow.invalidate(4)
+        self.assertEqual(slow(4), 8)
+        self.assertEqual(calls, [4, 4])
+
+    def test_errors(self):
+        calls = []
+
+        @cache(name="test.errors")
+        def fail(n):
+            calls.append(n)
+            raise ValueError(n)
+
+        self.assertRaises(ValueError, fail, 1)
+        self.assertRaises(ValueError, fail, 1)
+        self.assertEqual(calls, [1, 1])
+        self.assertTrue(Cache.get_cache("test.errors") is fail.cache)
+
+        # Unhashable arguments are passed thru
+        self.assertRaises(ValueError, fail, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+import unittest
+from lxml import etree
+from gosa.common.event import EventMaker
+from gosa.common.components.amqp import EventProvider, EventConsumer
+from gosa.common.components.amqp_proxy import AMQPEventConsumer
+
+
+class Config(object):
+
+    def __init__(self, **values):
+        self.values = values
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+
+class Env(object):
+    domain = "org.gosa"
+
+    def __init__(self, **values):
+        self.config = Config(**values)
+
+
+class Sender(object):
+
+    def __init__(self):
+        self.messages = []
+
+    def send(self, msg):
+        self.messages.append(etree.fromstring(msg.content))
+        return len(self.messages)
+
+
+class Session(object):
+
+    def __init__(self):
+        self.s = Sender()
+
+    def sender(self, address):
+        return self.s
+
+
+class Connection(object):
+    username = "tester"
+
+    def __init__(self):
+        self.ssn = Session()
+
+    def session(self):
+        return self.ssn
+
+
+class Message(object):
+
+    def __init__(self, content):
+        self.content = content
+
+
+class Worker(object):
+
+    def join(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def status(node, load):
+    e = EventMaker()
+    return e.Event(e.NodeStatus(e.Id(node), e.Load(load), e.Latency("0"), e.Workers("1")))
+
+
+def leave(node):
+    e = EventMaker()
+    return e.Event(e.NodeLeave(e.Id(node)))
+
+
+class TestEventBatching(unittest.TestCase):
+
+    def setUp(self):
+        # Don't let the timer interfere, flush manually
+        self.conn = Connection()
+        self.sent = self.conn.ssn.s.messages
+        self.provider = EventProvider(Env(**{"amqp.event-batch-window": "3600",
+            "amqp.event-batch-size": "3"}), self.conn)
+
+    def tearDown(self):
+        self.provider.stop()
+
+    def send(self, xml):
+        return self.provider.send(etree.tostring(xml), xml)
+
+    def test_coalesce(self):
+        self.send(status("node1", "1"))
+        self.send(status("node2", "2"))
+        self.send(status("node1", "3"))
+        self.assertEqual(self.sent, [])
+
+        self.provider.flush()
+        self.assertEqual(len(self.sent), 1)
+
+        events = self.sent[0].getchildren()
+        self.assertEqual([e.findtext("{http://www.gonicus.de/Events}Id") for e in events], ["node2", "node1"])
+        self.assertEqual(events[1].findtext("{http://www.gonicus.de/Events}Load"), "3")
+
+    def test_order(self):
+        self.assertEqual(self.send(status("node1", "1")), None)
+        self.assertEqual(self.send(leave("node1")), 2)
+
+        self.assertEqual(len(self.sent), 2)
+        self.assertEqual(etree.QName(self.sent[0][0]).localname, "NodeStatus")
+        self.assertEqual(etree.QName(self.sent[1][0]).localname, "NodeLeave")
+
+    def test_size(self):
+        results = [self.send(status("node%d" % i, "1")) for i in range(4)]
+        self.assertEqual(results, [None, None, 1, None])
+        self.assertEqual(len(self.sent), 1)
+        self.assertEqual(len(self.sent[0]), 3)
+
+        self.provider.flush()
+        self.assertEqual(len(self.sent), 2)
+        self.assertEqual(len(self.sent[1]), 1)
+
+    def test_unpack(self):
+        received = []
+        consumer = EventConsumer.__new__(EventConsumer)
+        consumer.env = None
+        consumer._EventConsumer__callback = received.append
+        consumer.log = self.provider.log
+
+        for i in range(3):
+            self.send(status("node%d" % i, "1"))
+        self.provider.flush()
+        consumer._EventConsumer__eventProcessor(None, Message(etree.tostring(self.sent[0])))
+
+        self.assertEqual([str(e.NodeStatus.Id) for e in received], ["node0", "node1", "node2"])
+
+    def test_unpack_proxy(self):
+        received = []
+        msg = Message(None)
+        consumer = AMQPEventConsumer.__new__(AMQPEventConsumer)
+        consumer._AMQPEventConsumer__callback = received.append
+        consumer._AMQPEventConsumer__eventWorker = consumer._AMQPEventConsumer__conn = Worker()
+
+        self.send(status("node0", "1"))
+        self.send(leave("node1"))
+        for xml in self.sent:
+            msg.content = etree.tostring(xml)
+            consumer._AMQPEventConsumer__eventProcessor(None, msg)
+        self.assertEqual(len(received), 2)
+
+        for i in range(3):
+            self.send(status("node%d" % i, "1"))
+        self.provider.flush()
+        msg.content = etree.tostring(self.sent[-1])
+        consumer._AMQPEventConsumer__eventProcessor(None, msg)
+
+        self.assertEqual([len(e.getchildren()) for e in received], [1] * 5)
+        self.assertEqual([str(e.NodeStatus.Id) for e in received[2:]], ["node0", "node1", "node2"])
+
+
+if __name__ == '__main__':
+    unittest.main()
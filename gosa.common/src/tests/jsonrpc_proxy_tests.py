@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+import unittest
+from gosa.common.components.jsonrpc_proxy import ObjectFactory, JSONRPCException
+
+
+class Proxy(object):
+    """
+    Service proxy keeping the property values of a single object.
+    """
+
+    def __init__(self, values):
+        self.values = values
+        self.calls = []
+        self.errors = {}
+        self.fail = None
+
+    def setObjectProperties(self, ref, values):
+        self.calls.append(("setObjectProperties", ref, dict(values)))
+        if self.fail:
+            raise self.fail
+
+        errors = dict((name, self.errors[name]) for name in values if name in self.errors)
+        self.values.update((name, value) for name, value in values.iteritems() if not name in errors)
+        return errors
+
+    def getObjectProperties(self, ref):
+        self.calls.append(("getObjectProperties", ref))
+        return dict(self.values)
+
+    def dispatchObjectMethod(self, ref, method, *args):
+        self.calls.append(("dispatchObjectMethod", ref, method, args))
+        return dict(self.values)
+
+
+class TestObjectFactory(unittest.TestCase):
+
+    def setUp(self):
+        self.proxy = Proxy({'givenName': u"Klaus", 'sn': u"Mustermann", 'uid': "klaus"})
+        self.obj = ObjectFactory.get_instance(self.proxy, "User", "ref1", "object.user",
+            ["commit"], ["givenName", "sn", "uid"], dict(self.proxy.values))
+
+    def sent(self):
+        return [call[2] for call in self.proxy.calls if call[0] == "setObjectProperties"]
+
+    def test_flush(self):
+        self.assertEqual(self.obj.givenName, u"Klaus")
+        self.obj.givenName = u"Peter"
+        self.obj.sn = u"Muster"
+        self.obj.givenName = u"Hans"
+        self.assertEqual(self.proxy.calls, [])
+
+        # All changes are sent with a single call
+        self.obj._flush()
+        self.assertEqual(self.sent(), [{'givenName': u"Hans", 'sn': u"Muster"}])
+
+        self.obj._flush()
+        self.assertEqual(len(self.proxy.calls), 1)
+
+        self.assertRaises(AttributeError, getattr, self.obj, "mail")
+        self.assertRaises(AttributeError, setattr, self.obj, "mail", "klaus@example.net")
+
+    def test_method(self):
+        # Pending changes are sent before the method is called
+        self.obj.sn = u"Muster"
+        self.assertEqual(self.obj.commit(1)['sn'], u"Muster")
+        self.assertEqual([call[0] for call in self.proxy.calls], ["setObjectProperties", "dispatchObjectMethod"])
+        self.assertEqual(self.proxy.calls[1][1:], ("ref1", "commit", (1,)))
+
+    def test_errors(self):
+        self.proxy.errors = {'uid': "uid is read only"}
+        self.obj.uid = "peter"
+        self.obj.sn = u"Muster"
+
+        # Failed properties are reverted, the others are kept
+        try:
+            self.obj._flush()
+            self.fail("no exception raised")
+        except JSONRPCException as e:
+            self.assertEqual(e.error, {'uid': "uid is read only"})
+
+        self.assertEqual(self.obj.uid, "klaus")
+        self.assertEqual(self.obj.sn, u"Muster")
+
+        self.obj._flush()
+        self.assertEqual(len(self.sent()), 1)
+
+    def test_failed_call(self):
+        self.obj.givenName = u"Peter"
+        self.proxy.fail = IOError("connection lost")
+        self.assertRaises(IOError, self.obj._flush)
+        self.assertEqual(self.obj.givenName, u"Peter")
+
+        # The changes are sent again and still revert to the agent's value
+        self.obj.sn = u"Muster"
+        self.proxy.fail = None
+        self.proxy.errors = {'givenName': "invalid"}
+        self.assertRaises(JSONRPCException, self.obj._flush)
+        self.assertEqual(self.sent()[-1], {'givenName': u"Peter", 'sn': u"Muster"})
+        self.assertEqual(self.obj.givenName, u"Klaus")
+
+    def test_refresh(self):
+        self.obj.givenName = u"Peter"
+        self.proxy.values['sn'] = u"Other"
+
+        # Changes are dropped and the values reloaded
+        self.obj._refresh()
+        self.assertEqual((self.obj.givenName, self.obj.sn), (u"Klaus", u"Other"))
+
+        self.obj._flush()
+        self.assertEqual(self.sent(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark for the scheduler core. It fills a job store with an increasing
+number of interval jobs spread over one day and measures how long a
+scheduler wakeup takes while only a few of them are due. For comparison,
+the time to scan all jobs - what every wakeup had to do before the job
+queue was introduced - is shown, too.
+
+Run it using::
+
+    $ python scheduler_benchmark.py
+"""
+import time
+from datetime import datetime, timedelta
+from gosa.common.components.scheduler import Scheduler
+from gosa.common.components.scheduler.job import Job
+from gosa.common.components.scheduler.triggers import IntervalTrigger
+from gosa.common.components.scheduler.jobstores.ram_store import RAMJobStore
+
+JOB_COUNTS = [1000, 10000, 50000]
+TICKS = 200
+
+
+class NullPool(object):
+    """ Don't run the jobs, we're only interested in the scheduling. """
+
+    def submit(self, func, *args, **kwargs):
+        pass
+
+
+def noop():
+    pass
+
+
+def setup(count, start):
+    sched = Scheduler(origin='benchmark', threadpool=NullPool())
+    store = RAMJobStore()
+
+    for i in range(count):
+        trigger = IntervalTrigger(timedelta(days=1),
+            start + timedelta(seconds=86400.0 * i / count))
+        job = Job(trigger, noop, [], {}, 1, True, tag="tag%d" % (i % 100),
+            owner="owner%d" % (i % 1000), origin='benchmark')
+        job.compute_next_run_time(start)
+        store.add_job(job)
+
+    sched.add_jobstore(store, 'default')
+    return sched, store
+
+
+def run(count):
+    start = datetime.now()
+    sched, store = setup(count, start)
+
+    # Every tick advances the time by 10 seconds
+    t = time.time()
+    for tick in range(TICKS):
+        sched._process_jobs(start + timedelta(seconds=10 * tick))
+    queued = (time.time() - t) / TICKS
+
+    # Old style: look at every job on every wakeup
+    t = time.time()
+    now = start + timedelta(seconds=10 * TICKS)
+    for tick in range(10):
+        for job in tuple(store.jobs):
+            job.get_run_times(now)
+    scanned = (time.time() - t) / 10
+
+    # Index lookups
+    t = time.time()
+    for i in range(1000):
+        sched.get_job_by_id(store.jobs[i % count].uuid)
+        sched.get_jobs_by_tag("tag%d" % (i % 100))
+    lookup = (time.time() - t) / 1000
+
+    return queued, scanned, lookup
+
+
+if __name__ == '__main__':
+    print "%10s %16s %16s %16s" % ("jobs", "wakeup (ms)", "full scan (ms)", "lookup (ms)")
+    for count in JOB_COUNTS:
+        queued, scanned, lookup = run(count)
+        print "%10d %16.3f %16.3f %16.3f" % (count, queued * 1000, scanned * 1000, lookup * 1000)
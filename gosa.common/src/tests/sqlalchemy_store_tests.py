@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+import time
+import unittest
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from gosa.common.components.scheduler.job import Job
+from gosa.common.components.scheduler.scheduler import Scheduler
+from gosa.common.components.scheduler.triggers import IntervalTrigger
+from gosa.common.components.scheduler.jobstores.sqlalchemy_store import SQLAlchemyJobStore
+
+
+def make_job(origin='node1', start=None):
+    start = start or datetime.now()
+    job = Job(IntervalTrigger(timedelta(minutes=1), start), time.time, [], {}, 1, True,
+              origin=origin)
+    job.compute_next_run_time(start)
+    return job
+
+
+class TestSQLAlchemyJobStore(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        self.store = SQLAlchemyJobStore(engine=self.engine, flush_interval=0)
+
+    def tearDown(self):
+        self.store.close()
+
+    def open(self, **kwargs):
+        # Second store on the same database, like another node would do
+        return SQLAlchemyJobStore(engine=self.engine, flush_interval=0, **kwargs)
+
+    def test_add(self):
+        job = make_job()
+        self.store.add_job(job)
+        self.assertEqual(job.version, 0)
+
+        other = self.open()
+        other.load_jobs()
+        self.assertEqual([j.id for j in other.jobs], [job.id])
+        self.assertEqual(other.jobs[0].func, time.time)
+
+    def test_update(self):
+        job = make_job()
+        self.store.add_job(job)
+        other = self.open()
+        other.load_jobs()
+        loaded = other.jobs[0]
+
+        job.runs = 5
+        self.store.update_job(job)
+        self.assertEqual(other.load_jobs(), (other.jobs, [loaded]))
+        self.assertEqual(other.jobs[0].runs, 5)
+        self.assertEqual(other.jobs[0].version, 1)
+        self.assertFalse(other.jobs[0] is loaded)
+
+        # Unchanged rows are kept as they are
+        current = other.jobs[0]
+        self.assertEqual(other.load_jobs(), ([], []))
+        self.assertTrue(other.jobs[0] is current)
+
+    def test_flush(self):
+        store = SQLAlchemyJobStore(engine=self.engine, flush_interval=3600)
+        job = make_job()
+        store.add_job(job)
+
+        for i in range(3):
+            job.runs += 1
+            store.update_job(job)
+
+        other = self.open()
+        other.load_jobs()
+        self.assertEqual(other.jobs[0].runs, 0)
+
+        store.flush()
+        other.load_jobs()
+        self.assertEqual(other.jobs[0].runs, 3)
+        self.assertEqual(other.jobs[0].version, 3)
+        store.close()
+
+    def test_refresh(self):
+        other = self.open(origin='node2', foreign_window=60)
+        job = make_job()
+        far = make_job(start=datetime.now() + timedelta(hours=1))
+        self.store.add_job(job)
+        self.store.add_job(far)
+
+        # Only foreign jobs which are due soon are loaded
+        other.load_jobs()
+        self.assertEqual([j.id for j in other.jobs], [job.id])
+        loaded = other.jobs[0]
+
+        self.store.remove_job(job)
+        self.assertEqual(other.load_jobs(), ([], [loaded]))
+        self.assertEqual(other.jobs, [])
+
+        # Removals are only read once
+        self.assertEqual(other.load_jobs(), ([], []))
+
+        # Old removal records are purged on the next removal
+        self.store.removed_ttl = 0
+        self.store.remove_job(far)
+        r = self.store.removed_t
+        self.assertEqual([row[0] for row in self.engine.execute(r.select())], [far.id])
+
+    def test_scheduler(self):
+        jobs = [make_job(start=datetime.now() + timedelta(hours=1)) for i in range(3)]
+        for job in jobs:
+            self.store.add_job(job)
+
+        sched = Scheduler(origin='node1')
+        sched.add_jobstore(self.open(), 'default', quiet=True)
+        entries = dict(sched._entries)
+
+        # Refreshing only touches the queue entries of changed jobs
+        jobs[0].runs = 1
+        self.store.update_job(jobs[0])
+        self.store.remove_job(jobs[1])
+        sched.refresh()
+
+        self.assertEqual(sorted(j.id for j in sched.get_jobs()), [jobs[0].id, jobs[2].id])
+        self.assertEqual(sched._queue_stale, 2)
+        for job in sched.get_jobs():
+            self.assertEqual(sched._entries[id(job)] is entries.get(id(job)), job.id == jobs[2].id)
+
+    def test_upgrade(self):
+        self.store.add_job(make_job())
+        other = self.open()
+        other.load_jobs()
+
+        # Simulate a table of an older version and a row written by it
+        t = self.store.jobs_t
+        for index in t.indexes:
+            index.drop(self.engine)
+        job = make_job()
+        self.store.add_job(job)
+        self.engine.execute(t.update().where(t.c.id == job.id).values(version=None, updated=None))
+
+        other.load_jobs()
+        self.assertEqual(len(other.jobs), 1)
+
+        self.open()
+        self.assertEqual(len(self.engine.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ?", t.name).fetchall()),
+            len(t.indexes))
+
+        other.load_jobs()
+        self.assertEqual(len(other.jobs), 2)
+
+if __name__ == '__main__':
+    unittest.main()
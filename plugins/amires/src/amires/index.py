@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+In memory index of the phone numbers exported by the resolvers.
+
+Numbers are normalized to the international format (``+`` followed by
+digits) before they're stored or looked up. Internal extensions get the
+*local* prefix, or are kept as plain digits if there is none.
+
+Lookups try these matches, in this order:
+
+ * the exact number
+ * the longest stored number the number starts with, which finds the
+   entry of a switchboard number for one of its extensions
+ * the single stored number ending with an extension, if there is no
+   *local* prefix
+"""
+import re
+from bisect import bisect_left
+from threading import Lock
+
+
+class NumberIndex(object):
+    """
+    Index of normalized phone numbers.
+
+    ========== ============
+    Parameter  Description
+    ========== ============
+    country    country code used for numbers starting with a single 0
+    local      international prefix which is put in front of short extensions
+    min_prefix minimum length of a stored number to match as prefix
+    min_suffix minimum length of an extension to match as suffix
+    ========== ============
+    """
+    __separators = re.compile(r"[^0-9+]|(?<=.)\+")
+
+    def __init__(self, country="49", local=None, min_prefix=6, min_suffix=3):
+        self.country = country
+        self.local = None
+
+        # Normalize the prefix itself without putting it in front
+        self.local = self.normalize(local) if local else None
+        self.min_prefix = min_prefix
+        self.min_suffix = min_suffix
+
+        self.__lock = Lock()
+        self.__numbers = {}
+        self.__reversed = []
+
+    def normalize(self, number):
+        """
+        Normalize a phone number.
+
+        ========== ============
+        Parameter  Description
+        ========== ============
+        number     phone number in any common notation
+        ========== ============
+
+        ``Return:`` normalized number or None
+        """
+        if not number:
+            return None
+
+        number = self.__separators.sub("", number.replace("(0)", ""))
+        if number.startswith("+"):
+            return number if len(number) > 1 else None
+        if number.startswith("00"):
+            return "+" + number[2:]
+        if number.startswith("0"):
+            return "+" + self.country + number[1:]
+        if number and self.local:
+            return self.local + number
+
+        return number or None
+
+    def rebuild(self, entries):
+        """
+        Replace the content of the index.
+
+        ========== ============
+        Parameter  Description
+        ========== ============
+        entries    iterable of (number, priority, info) tuples
+        ========== ============
+
+        ``Return:`` number of indexed numbers
+        """
+        numbers = {}
+        for number, priority, info in entries:
+            self.__add(numbers, number, priority, info)
+
+        rev = sorted(n[::-1] for n in numbers)
+        with self.__lock:
+            self.__numbers = numbers
+            self.__reversed = rev
+
+        return len(numbers)
+
+    def update(self, entries):
+        """
+        Add or update entries of the index.
+
+        ========== ============
+        Parameter  Description
+        ========== ============
+        entries    iterable of (number, priority, info) tuples
+        ========== ============
+
+        ``Return:`` number of changed numbers
+        """
+        changed = 0
+        with self.__lock:
+            for number, priority, info in entries:
+                n = self.__add(self.__numbers, number, priority, info)
+                if n:
+                    changed += 1
+                    rev = n[::-1]
+                    pos = bisect_left(self.__reversed, rev)
+                    if pos == len(self.__reversed) or self.__reversed[pos] != rev:
+                        self.__reversed.insert(pos, rev)
+
+        return changed
+
+    def lookup(self, number):
+        """
+        Find the entry of a phone number.
+
+        ========== ============
+        Parameter  Description
+        ========== ============
+        number     phone number in any common notation
+        ========== ============
+
+        ``Return:`` (priority, info) tuple or None
+        """
+        n = self.normalize(number)
+        if not n:
+            return None
+
+        with self.__lock:
+            numbers = self.__numbers
+
+            found = numbers.get(n)
+            if found:
+                return found
+
+            if not n.startswith("+"):
+                return self.__suffix(n)
+
+            for length in xrange(len(n) - 1, self.min_prefix - 1, -1):
+                found = numbers.get(n[:length])
+                if found:
+                    return found
+
+        return None
+
+    def __suffix(self, n):
+        if len(n) < self.min_suffix:
+            return None
+
+        rev = n[::-1]
+        pos = bisect_left(self.__reversed, rev)
+        matches = self.__reversed[pos:pos + 2]
+        matches = [m for m in matches if m.startswith(rev)]
+
+        # Ambiguous extensions are not resolved
+        if len(matches) != 1:
+            return None
+
+        return self.__numbers[matches[0][::-1]]
+
+    def __add(self, numbers, number, priority, info):
+        n = self.normalize(number)
+        if not n:
+            return None
+
+        current = numbers.get(n)
+        if current and current[0] < priority:
+            return None
+
+        numbers[n] = (priority, info)
+        return n
+
+    def __len__(self):
+        return len(self.__numbers)
@@ -3,15 +3,21 @@
 import pkg_resources
 import gettext
 import re
+import time
 import logging
-from lxml import etree
+from Queue import Queue, Full, Empty
+from threading import Thread, Lock, Event
 from zope.interface import implements
 from gosa.common.handler import IInterfaceHandler
 from gosa.common import Environment
-from gosa.common.utils import parseURL, makeAuthURL
+from gosa.common.utils import parseURL, makeAuthURL, N_
 from gosa.common.components.registry import PluginRegistry
 from gosa.common.components.amqp import EventConsumer
-from gosa.common.components import AMQPServiceProxy
+from gosa.common.components.cache import Cache
+from gosa.common.components.scheduler.threadpool import ThreadPool
+from gosa.common.components import AMQPServiceProxy, Plugin, Command
+from amires.resolver import PhoneNumberResolver
+from amires.index import NumberIndex
 
 # Set locale domain
 t = gettext.translation('messages', pkg_resources.resource_filename("amires", "locale"),
@@ -19,9 +25,63 @@ t = gettext.translation('messages', pkg_resources.resource_filename("amires", "l
 _ = t.ugettext
 
 
-class AsteriskNotificationReceiver(object):
+class _Lookup(object):
+    """ Lookup of a number by a single resolver. """
+
+    def __init__(self, mod, resolver, timeout):
+        self.mod = mod
+        self.resolver = resolver
+        self.deadline = time.time() + timeout
+        self.done = Event()
+        self.result = None
+        self.error = None
+
+    def __call__(self, number):
+        try:
+            self.result = self.resolver.resolve(number)
+        except Exception, e:
+            self.error = e
+        finally:
+            self.done.set()
+
+
+class AsteriskNotificationReceiver(Plugin):
+    """
+    Resolves the numbers of incoming asterisk events and notifies the
+    users involved.
+
+    Incoming events are queued and processed by a pool of workers. The
+    resolvers of a number are asked in parallel, the answer of the one
+    with the best priority wins. The pipeline is configured in the
+    ``[amires]`` section:
+
+    ================ ============
+    Key              Description
+    ================ ============
+    worker           Number of events processed concurrently
+    queue            Number of queued events, further events are dropped
+    max-age          Seconds after which a queued event is counted as late
+    resolver-timeout Seconds to wait for a resolver which has no own *timeout*
+    render-ttl       Seconds to keep the output of renderers, 0 disables it
+    ================ ============
+
+    The numbers of all resolvers which are able to export them are kept
+    in a :class:`amires.index.NumberIndex`, the others are asked for
+    every call. The index is configured in the ``[resolver-index]``
+    section:
+
+    ========== ============
+    Key        Description
+    ========== ============
+    refresh    Seconds between the updates of changed numbers, 0 disables the index
+    rebuild    Seconds between complete reloads of the index
+    country    Country code used for numbers starting with a single 0
+    local      International number prefix of the local extensions
+    ========== ============
+    """
     implements(IInterfaceHandler)
     _priority_ = 99
+    _target_ = 'amires'
 
     TYPE_MAP = {'CallMissed': _("Missed call"),
                 'CallEnded': _("Call ended"),
@@ -54,8 +114,49 @@ class AsteriskNotificationReceiver(object):
                     'priority': module.priority,
             }
 
+        # Prepare number index
+        get = self.env.config.get
+        self.__refresh = int(get("resolver-index.refresh", default=300))
+        self.__rebuild = int(get("resolver-index.rebuild", default=3600))
+        self.__index = NumberIndex(get("resolver-index.country", default="49"),
+            get("resolver-index.local", default=None))
+        self.__indexed = set()
+        self.__index_lock = Lock()
+        self.__updated = None
+        self.__built = None
+
+        # Prepare event pipeline
+        self.__worker = int(get("amires.worker", default=4))
+        self.__max_age = float(get("amires.max-age", default=30))
+        self.__timeout = float(get("amires.resolver-timeout", default=5))
+        self.__queue = Queue(int(get("amires.queue", default=100)))
+
+        # Every resolver gets its own threads, so a slow one can't
+        # delay the others
+        self.__pools = dict((mod, ThreadPool(max_threads=self.__worker))
+                            for mod in self.resolver)
+        self.__threads = []
+        self.__stopped = Event()
+
+        render_ttl = int(get("amires.render-ttl", default=300))
+        self.__render_cache = Cache(ttl=render_ttl, name="amires.render") if render_ttl else None
+
+        self.__stats_lock = Lock()
+        self.__stats = {'received': 0, 'processed': 0, 'dropped': 0,
+                        'late': 0, 'failures': 0, 'delay_max': 0.0}
+        self.__resolver_stats = dict((mod, {'calls': 0, 'timeouts': 0, 'failures': 0})
+                                     for mod in self.resolver)
+
     def serve(self):
         self.log.info("listening for asterisk events...")
+        self.__cr = PluginRegistry.getInstance("CommandRegistry")
+
+        for i in range(self.__worker):
+            thread = Thread(target=self.__work, name="AsteriskWorker-%d" % i)
+            thread.setDaemon(True)
+            thread.start()
+            self.__threads.append(thread)
+
         amqp = PluginRegistry.getInstance('AMQPHandler')
         EventConsumer(self.env,
             amqp.getConnection(),
@@ -66,36 +167,236 @@ class AsteriskNotificationReceiver(object):
             """,
             callback=self.process)
 
-        self.__cr = PluginRegistry.getInstance("CommandRegistry")
+        # Build the number index in the background, the resolvers are
+        # asked directly until it is ready
+        if self.__refresh:
+            thread = Thread(target=self.refresh_index, name="NumberIndex")
+            thread.setDaemon(True)
+            thread.start()
 
-    # Event callback
-    def process(self, data):
+            sched = PluginRegistry.getInstance('SchedulerService').sched
+            sched.add_interval_job(self.refresh_index, seconds=self.__refresh,
+                tag='_internal')
+
+    def stop(self):
+        if self.__refresh:
+            sched = PluginRegistry.getInstance('SchedulerService').sched
+            try:
+                sched.unschedule_func(self.refresh_index)
+            except KeyError:
+                pass
+
+        # Drop the queued events and wake up the workers
+        self.__stopped.set()
+        while True:
+            try:
+                self.__queue.get_nowait()
+            except Empty:
+                break
+
+            with self.__stats_lock:
+                self.__stats['dropped'] += 1
+
+        for thread in self.__threads:
+            try:
+                self.__queue.put_nowait(None)
+            except Full:
+                break
+        self.__threads = []
+        for pool in self.__pools.values():
+            pool.shutdown(False)
+
+    def refresh_index(self):
+        """
+        Load the numbers which have changed since the last refresh into
+        the index, or reload all numbers if *rebuild* seconds have passed.
+        """
+        # Skip if the previous refresh is still running
+        if not self.__index_lock.acquire(False):
+            return
+
+        try:
+            now = time.time()
+            rebuild = not self.__built or now - self.__built >= self.__rebuild
+
+            # Allow for clock skew between us and the backends
+            since = None if rebuild else self.__updated - 60
+
+            entries = []
+            indexed = set()
+            for mod, info in self.resolver.iteritems():
+                try:
+                    res = info['object'].export(since)
+                except Exception, e:
+                    self.log.error("failed to export numbers of '%s': %s" % (mod, str(e)))
+                    res = None
+
+                if res is None:
+                    continue
+
+                indexed.add(mod)
+                entries += [(number, info['priority'], result) for number, result in res]
+
+            if rebuild:
+                size = self.__index.rebuild(entries)
+                self.__built = now
+                self.log.info("indexed %d numbers of %s in %.2fs" % (size,
+                    ", ".join(sorted(indexed)) or "no resolver", time.time() - now))
+            else:
+                size = self.__index.update(entries)
+                self.log.debug("updated %d numbers in the index" % size)
+
+                # Failed resolvers are not up to date anymore
+                indexed &= self.__indexed
+
+            self.__indexed = indexed
+            self.__updated = now
+
+        finally:
+            self.__index_lock.release()
+
+    def resolve(self, number):
+        """
+        Resolve a number using the index and the resolvers which are
+        not indexed. The resolvers are asked in parallel, the first
+        result by priority wins. Resolvers which don't answer within
+        their timeout are skipped.
+
+        ========== ============
+        Parameter  Description
+        ========== ============
+        number     phone number
+        ========== ============
+
+        ``Return:`` dict with the resolved information or None
+        """
+        found = self.__index.lookup(number)
+        if not found:
+            replaced = PhoneNumberResolver.replaceNumber(number)
+            if replaced != number:
+                found = self.__index.lookup(replaced)
+
+        # Ask the resolvers which may beat the indexed result
+        calls = []
+        indexed = self.__indexed
+        for mod, info in sorted(self.resolver.iteritems(),
+                key=lambda k: k[1]['priority']):
+            if found and info['priority'] >= found[0]:
+                break
+            if mod in indexed:
+                continue
+
+            call = _Lookup(mod, info['object'],
+                getattr(info['object'], 'timeout', None) or self.__timeout)
+            self.__pools[mod].submit(call, number)
+            calls.append(call)
+
+        for call in calls:
+            done = call.done.wait(max(call.deadline - time.time(), 0))
+
+            with self.__stats_lock:
+                stats = self.__resolver_stats.setdefault(call.mod,
+                    {'calls': 0, 'timeouts': 0, 'failures': 0})
+                stats['calls'] += 1
+                if not done:
+                    stats['timeouts'] += 1
+                elif call.error:
+                    stats['failures'] += 1
+
+            if not done:
+                self.log.warning("resolver '%s' did not answer for '%s' in time" % (call.mod, number))
+            elif call.error:
+                self.log.error("resolver '%s' failed for '%s': %s" % (call.mod, number, str(call.error)))
+            elif call.result:
+                return call.result
+
+        return dict(found[1]) if found else None
 
-        # for some reason we need to convert to string and back
-        cstr = etree.tostring(data, pretty_print = True)
-        dat = etree.fromstring(cstr)
+    @Command(__help__=N_("Return statistics about the processed asterisk events."))
+    def getCallStatistics(self):
+        """
+        Return statistics about the asterisk events processed by this
+        node:
 
+        ============== =============
+        Key            Description
+        ============== =============
+        received       Number of received events
+        processed      Number of completely processed events
+        dropped        Number of events dropped because the queue was full
+        late           Number of events which waited longer than *max-age*
+        failures       Number of events which failed to process
+        delay_max      Maximum time in seconds an event waited in the queue
+        queued         Number of events waiting in the queue
+        resolvers      Number of *calls*, *timeouts* and *failures* by resolver
+        ============== =============
+
+        ``Return:`` dict with statistics
+        """
+        with self.__stats_lock:
+            res = dict(self.__stats)
+            res['resolvers'] = dict((mod, dict(stats))
+                for mod, stats in self.__resolver_stats.iteritems())
+
+        res['queued'] = self.__queue.qsize()
+        return res
+
+    # Event callback
+    def process(self, data):
         event = {}
-        for t in dat[0]:
+        for t in data.getchildren()[0].iterchildren():
             tag = re.sub(r"^\{.*\}(.*)$", r"\1", t.tag)
             if t.tag == 'From':
                 event[tag] = t.text.split(" ")[0]
             else:
                 event[tag] = str(t.text)
 
-        # Resolve numbers with all resolvers, sorted by priority
-        i_from = None
-        i_to = None
+        # Hand the event to the workers, don't block the consumer
+        with self.__stats_lock:
+            self.__stats['received'] += 1
 
-        for mod, info in sorted(self.resolver.iteritems(),
-                key=lambda k: k[1]['priority']):
-            if not i_from:
-                i_from = info['object'].resolve(event['From'])
-            if not i_to:
-                i_to = info['object'].resolve(event['To'])
-            if i_from and i_to:
+        try:
+            self.__queue.put_nowait((time.time(), event))
+        except Full:
+            with self.__stats_lock:
+                self.__stats['dropped'] += 1
+            self.log.warning("dropped %s event from '%s': queue is full" % (event.get('Type'), event.get('From')))
+
+    def __work(self):
+        while True:
+            item = self.__queue.get()
+            if item is None or self.__stopped.is_set():
                 break
 
+            received, event = item
+            delay = time.time() - received
+            with self.__stats_lock:
+                self.__stats['delay_max'] = max(self.__stats['delay_max'], delay)
+                if delay > self.__max_age:
+                    self.__stats['late'] += 1
+
+            try:
+                self.__handle(event)
+            except Exception, e:
+                self.log.exception("failed to process %s event: %s" % (event.get('Type'), str(e)))
+                with self.__stats_lock:
+                    self.__stats['failures'] += 1
+            else:
+                with self.__stats_lock:
+                    self.__stats['processed'] += 1
+
+    def __render(self, mod, renderer, info, event):
+        key = renderer.getCacheKey(info, event) if self.__render_cache is not None else None
+        if key is None:
+            return renderer.getHTML(info, event)
+
+        return self.__render_cache.load((mod, key), lambda: renderer.getHTML(info, event))
+
+    def __handle(self, event):
+        # Resolve numbers with all resolvers, sorted by priority
+        i_from = self.resolve(event['From'])
+        i_to = self.resolve(event['To'])
+
         # Fallback to original number if nothing has been found
         if not i_from:
             i_from = {'contact_phone': event['From'], 'contact_name': event['From'],
@@ -110,11 +411,11 @@ class AsteriskNotificationReceiver(object):
                 key=lambda k: k[1]['priority']):
 
             if 'ldap_uid' in i_to and i_to['ldap_uid']:
-                to_msg += info['object'].getHTML(i_from, event)
+                to_msg += self.__render(mod, info['object'], i_from, event)
                 to_msg += "\n\n"
 
             if 'ldap_uid' in i_from and i_from['ldap_uid'] and event['Type'] == 'CallEnded':
-                from_msg += info['object'].getHTML(i_to, event)
+                from_msg += self.__render(mod, info['object'], i_to, event)
                 from_msg += "\n\n"
 
         # Send from/to messages as needed
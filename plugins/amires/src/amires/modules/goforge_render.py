@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import cgi
 import MySQLdb
+from threading import Lock
 import pkg_resources
 import gettext
 from amires.render import BaseRenderer
@@ -26,13 +27,19 @@ class GOForgeRenderer(BaseRenderer):
         db = env.config.get("fetcher-goforge.base",
             default="goforge")
 
-        # connect to GOforge db
+        # connect to GOforge db, the connection must not be used by
+        # several threads at once
+        self.forge_lock = Lock()
         self.forge_db = MySQLdb.connect(host=host,
             user=user, passwd=passwd, db=db)
 
         self.forge_url = self.env.config.get("fetcher-goforge.site_url",
             default="http://localhost/")
 
+    def getCacheKey(self, particiantInfo, event):
+        # The tickets only depend on the company
+        return particiantInfo.get('company_id') or None
+
     def getHTML(self, particiantInfo, event):
         super(GOForgeRenderer, self).getHTML(particiantInfo)
 
@@ -46,41 +53,42 @@ class GOForgeRenderer(BaseRenderer):
         # prepare result
         result = []
 
-        cursor = self.forge_db.cursor()
-
-        try:
-            # obtain GOforge internal customer id
-            leng = cursor.execute("""
-                SELECT customer_id
-                FROM customer
-                WHERE customer_unique_ldap_attribute = %s""",
-                (company_id,))
-            row = cursor.fetchone()
+        with self.forge_lock:
+            cursor = self.forge_db.cursor()
 
-            # if entry for company exists ...
-            if leng == 1:
-                # fetch tickets from database
+            try:
+                # obtain GOforge internal customer id
                 leng = cursor.execute("""
-                    SELECT bug.bug_id, bug.summary,
-                        bug.group_id, user.user_name
-                    FROM bug, user
-                    WHERE bug.status_id = 1
-                        AND bug.assigned_to = user.user_id
-                        AND bug.customer_id = %s
-                    LIMIT 29;""",
-                    (row[0],))
-
-                rows = cursor.fetchall()
-
-                # put results into dictionary
-                for row in rows:
-                    result.append({'id': row[0],
-                        'summary': row[1],
-                        'group_id': row[2],
-                        'assigned': row[3]})
-
-        finally:
-            cursor.close()
+                    SELECT customer_id
+                    FROM customer
+                    WHERE customer_unique_ldap_attribute = %s""",
+                    (company_id,))
+                row = cursor.fetchone()
+
+                # if entry for company exists ...
+                if leng == 1:
+                    # fetch tickets from database
+                    leng = cursor.execute("""
+                        SELECT bug.bug_id, bug.summary,
+                            bug.group_id, user.user_name
+                        FROM bug, user
+                        WHERE bug.status_id = 1
+                            AND bug.assigned_to = user.user_id
+                            AND bug.customer_id = %s
+                        LIMIT 29;""",
+                        (row[0],))
+
+                    rows = cursor.fetchall()
+
+                    # put results into dictionary
+                    for row in rows:
+                        result.append({'id': row[0],
+                            'summary': row[1],
+                            'group_id': row[2],
+                            'assigned': row[3]})
+
+            finally:
+                cursor.close()
 
         if len(result) == 0:
             return ""
@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
+import time
 import ldap
+import ldap.filter
+import ldap.controls
 from gosa.agent.ldap_utils import LDAPHandler
 from amires.resolver import PhoneNumberResolver
 from gosa.common.components.cache import cache
@@ -19,7 +22,9 @@ class LDAPNumberResolver(PhoneNumberResolver):
             # leave default priority
             pass
 
-    @cache(ttl=3600)
+        self.page_size = int(self.env.config.get("ldap.page_size", default=500))
+
+    @cache(ttl=3600, negative_ttl=300, name="amires.ldap")
     def resolve(self, number):
         number = self.replaceNumber(number)
 
@@ -31,18 +36,55 @@ class LDAPNumberResolver(PhoneNumberResolver):
         with lh.get_handle() as conn:
             res = conn.search_s(lh.get_base(), ldap.SCOPE_SUBTREE, filtr, attrs)
             if len(res) == 1:
-                result = {
-                        'company_id': '',
-                        'company_name': 'Intern',
-                        'company_phone': '',
-                        'company_detail_url': '',
-                        'contact_id': res[0][1]['uid'][0],
-                        'contact_name': unicode(res[0][1]['cn'][0], 'UTF-8'),
-                        'contact_phone': res[0][1]['telephoneNumber'][0],
-                        'contact_detail_url': '',
-                        'ldap_uid': res[0][1]['uid'][0],
-                        'resource': 'ldap',
-                }
-                return result
+                return self.__result(res[0][1], res[0][1]['telephoneNumber'][0])
             else:
                 return None
+
+    def export(self, since=None):
+        filtr = "(&(uid=*)(telephoneNumber=*))"
+        if since:
+            filtr = "(&(uid=*)(telephoneNumber=*)(modifyTimestamp>=%s))" % \
+                time.strftime("%Y%m%d%H%M%SZ", time.gmtime(since))
+        attrs = ['cn', 'uid', 'telephoneNumber']
+
+        # Use a paged search, the directory may hold more entries than the
+        # server's size limit
+        res = []
+        page = ldap.controls.SimplePagedResultsControl(True, size=self.page_size, cookie='')
+
+        lh = LDAPHandler.get_instance()
+        with lh.get_handle() as conn:
+            while True:
+                msgid = conn.search_ext(lh.get_base(), ldap.SCOPE_SUBTREE, filtr, attrs,
+                    serverctrls=[page])
+                rtype, rdata, rmsgid, rctrls = conn.result3(msgid)
+
+                # Skip referrals
+                res.extend(entry for dn, entry in rdata if dn is not None)
+
+                cookie = None
+                for ctrl in rctrls:
+                    if ctrl.controlType == ldap.controls.SimplePagedResultsControl.controlType:
+                        cookie = ctrl.cookie
+
+                if not cookie:
+                    break
+
+                page.cookie = cookie
+
+        return [(number, self.__result(entry, number))
+                for entry in res for number in entry['telephoneNumber']]
+
+    def __result(self, entry, number):
+        return {
+                'company_id': '',
+                'company_name': 'Intern',
+                'company_phone': '',
+                'company_detail_url': '',
+                'contact_id': entry['uid'][0],
+                'contact_name': unicode(entry['cn'][0], 'UTF-8'),
+                'contact_phone': number,
+                'contact_detail_url': '',
+                'ldap_uid': entry['uid'][0],
+                'resource': 'ldap',
+        }
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 import re
+import time
 import MySQLdb
+from threading import Lock
 from amires.resolver import PhoneNumberResolver
 from gosa.common.components.cache import cache
 
@@ -28,7 +30,9 @@ class SugarNumberResolver(PhoneNumberResolver):
             # leave default priority
             pass
 
-        # connect to sugar db
+        # connect to sugar db, the connection must not be used by
+        # several threads at once
+        self.sugar_lock = Lock()
         self.sugar_db = MySQLdb.connect(host=host,
             user=user, passwd=passwd, db=base)
         self.sugar_db.set_character_set('utf8')
@@ -40,7 +44,7 @@ class SugarNumberResolver(PhoneNumberResolver):
         if hasattr(self, 'sugar_db') and self.sugar_db is not None:
             self.sugar_db.close()
 
-    @cache(ttl=3600)
+    @cache(ttl=3600, negative_ttl=300, name="amires.sugar")
     def resolve(self, number):
         number = self.replaceNumber(number)
 
@@ -70,95 +74,57 @@ class SugarNumberResolver(PhoneNumberResolver):
         regex += "$"
 
         # query database
-        result = {
-            'company_id': '',
-            'company_name': '',
-            'company_phone': '',
-            'company_detail_url': '',
-            'contact_id': '',
-            'contact_name': '',
-            'contact_phone': '',
-            'contact_detail_url': '',
-            'ldap_uid': '',
-            'resource': 'sugar'}
+        result = self.__result()
 
-        cursor = self.sugar_db.cursor()
+        with self.sugar_lock:
+            cursor = self.sugar_db.cursor()
 
-        try:
-            # query for accounts
-            cursor.execute("""
-                SELECT id, name, phone_office
-                FROM accounts
-                WHERE phone_office REGEXP '%s'""" % (regex))
-            dat = cursor.fetchone()
-
-            if dat is not None:
-                # fill result data with found data
-                if dat[0] is not None:
-                    result['company_id'] = dat[0]
-                    result['company_detail_url'] = self.sugar_url \
-                        + 'index.php?module=Accounts&action=DetailView' \
-                        + '&record=' + dat[0]
-                if dat[1] is not None:
-                    result['company_name'] = unicode(dat[1], "UTF-8")
-                if dat[2] is not None:
-                    result['company_phone'] = dat[2]
-
-                found = True
-            else:
-                # query for contacts
-                cursor.execute("""SELECT id, first_name, last_name, phone_work
-                    FROM contacts
-                    WHERE phone_work REGEXP '%s'
-                    OR phone_home REGEXP '%s'
-                    OR phone_mobile REGEXP '%s'
-                    OR phone_other REGEXP '%s'""" %
-                    (regex, regex, regex, regex))
+            try:
+                # query for accounts
+                cursor.execute("""
+                    SELECT id, name, phone_office
+                    FROM accounts
+                    WHERE phone_office REGEXP '%s'""" % (regex))
                 dat = cursor.fetchone()
 
                 if dat is not None:
                     # fill result data with found data
-                    result['contact_id'] = dat[0]
-                    if dat[1] is not None:
-                        result['contact_name'] = unicode(dat[1], "UTF-8")
-                    if dat[2] is not None:
-                        if not result['contact_name'] == '':
-                            result['contact_name'] += ' '
-                        result['contact_name'] += unicode(dat[2], "UTF-8")
-                    if dat[3] is not None:
-                        result['contact_phone'] = dat[3]
-                    result['contact_detail_url'] = self.sugar_url \
-                        + 'index.php?module=Contacts&action=DetailView' \
-                        + '&record=' + dat[0]
-
+                    self.__fill_account(result, dat)
                     found = True
-
-                    cursor.execute("""SELECT account_id
-                        FROM accounts_contacts
-                        WHERE contact_id = %s """,
-                        (dat[0],))
+                else:
+                    # query for contacts
+                    cursor.execute("""SELECT id, first_name, last_name, phone_work
+                        FROM contacts
+                        WHERE phone_work REGEXP '%s'
+                        OR phone_home REGEXP '%s'
+                        OR phone_mobile REGEXP '%s'
+                        OR phone_other REGEXP '%s'""" %
+                        (regex, regex, regex, regex))
                     dat = cursor.fetchone()
 
                     if dat is not None:
-                        cursor.execute("""SELECT id, name, phone_office
-                            FROM accounts
-                            WHERE id = %s""",
+                        # fill result data with found data
+                        self.__fill_contact(result, dat)
+                        found = True
+
+                        cursor.execute("""SELECT account_id
+                            FROM accounts_contacts
+                            WHERE contact_id = %s """,
                             (dat[0],))
                         dat = cursor.fetchone()
 
                         if dat is not None:
-                            if dat[0] is not None:
-                                result['company_id'] = dat[0]
-                                result['company_detail_url'] = self.sugar_url \
-                                    + 'index.php?module=Accounts&action=DetailView'\
-                                    + '&record=' + dat[0]
-                            if dat[1] is not None:
-                                result['company_name'] = unicode(dat[1], "UTF-8")
-                            if dat[2] is not None:
-                                result['company_phone'] = dat[2]
-        finally:
-            # clean up
-            cursor.close()
+                            cursor.execute("""SELECT id, name, phone_office
+                                FROM accounts
+                                WHERE id = %s""",
+                                (dat[0],))
+                            dat = cursor.fetchone()
+
+                            if dat is not None:
+                                self.__fill_account(result, dat)
+            finally:
+                # clean up
+                cursor.close()
 
         # return what was found
         if found == False:
@@ -166,3 +132,86 @@ class SugarNumberResolver(PhoneNumberResolver):
 
         result['resource'] = 'sugar'
         return result
+
+    def export(self, since=None):
+        accounts = """SELECT id, name, phone_office
+            FROM accounts
+            WHERE deleted = 0 AND phone_office <> ''"""
+        contacts = """SELECT c.id, c.first_name, c.last_name, c.phone_work,
+                a.id, a.name, a.phone_office,
+                c.phone_home, c.phone_mobile, c.phone_other
+            FROM contacts c
+            LEFT JOIN accounts_contacts ac
+                ON ac.contact_id = c.id AND ac.deleted = 0
+            LEFT JOIN accounts a
+                ON a.id = ac.account_id
+            WHERE c.deleted = 0"""
+        args = None
+
+        # sugar keeps the modification dates in UTC
+        if since:
+            accounts += " AND date_modified >= %s"
+            contacts += " AND c.date_modified >= %s"
+            args = (time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(since)),)
+
+        res = []
+        with self.sugar_lock:
+            cursor = self.sugar_db.cursor()
+
+            try:
+                # contacts first, so that accounts win for shared numbers
+                cursor.execute(contacts, args)
+                for dat in cursor.fetchall():
+                    result = self.__result()
+                    self.__fill_contact(result, dat[0:4])
+                    if dat[4] is not None:
+                        self.__fill_account(result, dat[4:7])
+                    res += [(n, result) for n in dat[3:4] + dat[7:10] if n]
+
+                cursor.execute(accounts, args)
+                for dat in cursor.fetchall():
+                    result = self.__result()
+                    self.__fill_account(result, dat)
+                    res.append((dat[2], result))
+            finally:
+                cursor.close()
+
+        return res
+
+    def __result(self):
+        return {
+            'company_id': '',
+            'company_name': '',
+            'company_phone': '',
+            'company_detail_url': '',
+            'contact_id': '',
+            'contact_name': '',
+            'contact_phone': '',
+            'contact_detail_url': '',
+            'ldap_uid': '',
+            'resource': 'sugar'}
+
+    def __fill_account(self, result, dat):
+        if dat[0] is not None:
+            result['company_id'] = dat[0]
+            result['company_detail_url'] = self.sugar_url \
+                + 'index.php?module=Accounts&action=DetailView' \
+                + '&record=' + dat[0]
+        if dat[1] is not None:
+            result['company_name'] = unicode(dat[1], "UTF-8")
+        if dat[2] is not None:
+            result['company_phone'] = dat[2]
+
+    def __fill_contact(self, result, dat):
+        result['contact_id'] = dat[0]
+        if dat[1] is not None:
+            result['contact_name'] = unicode(dat[1], "UTF-8")
+        if dat[2] is not None:
+            if not result['contact_name'] == '':
+                result['contact_name'] += ' '
+            result['contact_name'] += unicode(dat[2], "UTF-8")
+        if dat[3] is not None:
+            result['contact_phone'] = dat[3]
+        result['contact_detail_url'] = self.sugar_url \
+            + 'index.php?module=Contacts&action=DetailView' \
+            + '&record=' + dat[0]
@@ -4,15 +4,18 @@ import urllib
 import urllib2
 from urlparse import urlparse, parse_qs
 from amires.resolver import PhoneNumberResolver
+from gosa.common import Environment
 from gosa.common.components.cache import cache
 
 
 class TelekomNumberResolver(PhoneNumberResolver):
     priority = 99
+    timeout = 10
 
     def __init__(self):
         #TODO: calling super will replace number with not international format
         #super(TelekomNumberResolver, self).__init__()
+        self.env = Environment.getInstance()
 
         try:
             self.priority = float(self.env.config.get("resolver-telekom.priority",
@@ -21,6 +24,9 @@ class TelekomNumberResolver(PhoneNumberResolver):
             # leave default priority
             pass
 
+        self.timeout = float(self.env.config.get("resolver-telekom.timeout",
+            default=str(self.timeout)))
+
         #TODO: internal
         self.internal = 4
 
@@ -33,7 +39,7 @@ class TelekomNumberResolver(PhoneNumberResolver):
                 filter(lambda k: k in src, keys))),
             'latin1').encode('utf-8')
 
-    @cache()
+    @cache(ttl=86400, negative_ttl=3600, name="amires.telekom")
     def resolve(self, number):
         """
         Probe a couple of numbers in order to find one which is
@@ -77,7 +83,7 @@ class TelekomNumberResolver(PhoneNumberResolver):
         # POST request and prepare response
         data = urllib.urlencode(values)
         req = urllib2.Request(url, data)
-        response = urllib2.urlopen(req)
+        response = urllib2.urlopen(req, timeout=self.timeout)
 
         loc = re.compile(r'.*href="([^"]+)".*')
         lin = re.compile(r'.*[^_]nachname=.*')
@@ -43,10 +43,20 @@ class XMLNumberResolver (PhoneNumberResolver):
 
                 self.numbers[number][e.tag] = e.text
 
-    @cache()
+    @cache(name="amires.xml")
     def resolve(self, number):
         if number in self.numbers:
             self.numbers[number]['resource'] = "xml"
             return self.numbers[number]
         else:
             return None
+
+    def export(self, since=None):
+        # The numbers are only read on startup
+        if since:
+            return []
+
+        for info in self.numbers.values():
+            info['resource'] = "xml"
+
+        return self.numbers.items()
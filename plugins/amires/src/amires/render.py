@@ -12,3 +12,10 @@ class BaseRenderer(object):
             raise RuntimeError("particiantInfo must not be None.")
         if type(particiantInfo) is not dict:
             raise TypeError("particiant Info must be a dictionary.")
+
+    def getCacheKey(self, particiantInfo, event):
+        """
+        Return a hashable key which identifies the output of getHTML for
+        this participant and event, or None if it must not be cached.
+        """
+        return None
@@ -7,6 +7,9 @@ class PhoneNumberResolver(object):
     priority = 10
     replace = []
 
+    #: Seconds to wait for resolve(), None uses *amires.resolver-timeout*
+    timeout = None
+
     def __init__(self):
         self.env = env = Environment.getInstance()
 
@@ -20,7 +23,8 @@ class PhoneNumberResolver(object):
                 if res:
                     PhoneNumberResolver.replace.append([res.group(1), res.group(2)])
 
-    def replaceNumber(self, number):
+    @classmethod
+    def replaceNumber(cls, number):
         # Apply configured substitutions on number
         for rep in PhoneNumberResolver.replace:
             number = re.sub(rep[0], rep[1], number)
@@ -29,3 +33,19 @@ class PhoneNumberResolver(object):
 
     def resolve(self):
         raise NotImplementedError("resolve is not implemented")
+
+    def export(self, since=None):
+        """
+        Return the numbers known by the resolver in order to put them
+        into the :class:`amires.index.NumberIndex`. Resolvers which can't
+        list their numbers return None and are asked for every call.
+
+        ========== ============
+        Parameter  Description
+        ========== ============
+        since      only return entries changed after this timestamp
+        ========== ============
+
+        ``Return:`` list of (number, result) tuples or None
+        """
+        return None
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+import unittest
+from amires.index import NumberIndex
+
+
+class TestNumberIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = NumberIndex("49", "+49293291")
+
+    def test_normalize(self):
+        n = self.index.normalize
+        self.assertEqual(n("+49 (0)2932 91-123"), "+49293291123")
+        self.assertEqual(n("0049 2932 91123"), "+49293291123")
+        self.assertEqual(n("02932/91123"), "+49293291123")
+        self.assertEqual(n("123"), "+49293291123")
+        self.assertEqual(n("+"), None)
+        self.assertEqual(n(""), None)
+
+        # Without local prefix, extensions are kept as they are
+        self.assertEqual(NumberIndex().normalize("123"), "123")
+
+    def test_lookup(self):
+        self.index.rebuild([
+            ("+49 2932 91-0", 5, "switchboard"),
+            ("0211 4711", 5, "customer"),
+            ("+49 2932 91-123", 5, "user")])
+        self.assertEqual(len(self.index), 3)
+
+        # Exact matches, internal extensions included
+        self.assertEqual(self.index.lookup("0211-4711"), (5, "customer"))
+        self.assertEqual(self.index.lookup("123"), (5, "user"))
+
+        # The longest stored prefix wins
+        self.assertEqual(self.index.lookup("+49 2932 91 0 55"), (5, "switchboard"))
+        self.assertEqual(self.index.lookup("0211 4711 12"), (5, "customer"))
+        self.assertEqual(self.index.lookup("0211 47"), None)
+
+        # Too short to be used as prefix
+        index = NumberIndex("49", min_prefix=8)
+        index.rebuild([("+49211", 1, "city")])
+        self.assertEqual(index.lookup("+492114711"), None)
+
+    def test_suffix(self):
+        index = NumberIndex("49")
+        index.rebuild([
+            ("+49 2932 91123", 5, "user"),
+            ("+49 211 4711", 5, "customer"),
+            ("+49 30 1711", 5, "other")])
+
+        # Extensions are found by their unique suffix
+        self.assertEqual(index.lookup("123"), (5, "user"))
+        self.assertEqual(index.lookup("91123"), (5, "user"))
+
+        # Ambiguous and too short extensions are not resolved
+        self.assertEqual(index.lookup("711"), None)
+        self.assertEqual(index.lookup("23"), None)
+
+    def test_priority(self):
+        # The entry with the best priority wins, regardless of the order
+        self.index.rebuild([
+            ("0211 4711", 9, "low"),
+            ("+49 211 4711", 1, "high"),
+            ("0211/4711", 5, "mid")])
+        self.assertEqual(self.index.lookup("02114711"), (1, "high"))
+
+        self.assertEqual(self.index.update([("0211 4711", 5, "other")]), 0)
+        self.assertEqual(self.index.lookup("02114711"), (1, "high"))
+
+    def test_update(self):
+        index = NumberIndex("49")
+        index.rebuild([("+49 211 4711", 5, "customer")])
+
+        self.assertEqual(index.update([
+            ("+49 211 4711", 5, "renamed"),
+            ("+49 30 1234", 5, "new"),
+            ("", 5, "empty")]), 2)
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.lookup("02114711"), (5, "renamed"))
+        self.assertEqual(index.lookup("030 1234"), (5, "new"))
+
+        # Suffixes of added numbers are found, too
+        self.assertEqual(index.lookup("1234"), (5, "new"))
+
+        # A rebuild drops what is not exported anymore
+        index.rebuild([("+49 30 1234", 5, "new")])
+        self.assertEqual(index.lookup("02114711"), None)
+        self.assertEqual(index.lookup("4711"), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
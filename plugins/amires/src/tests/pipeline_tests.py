@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import unittest
+import pkg_resources
+from threading import Thread
+from lxml import objectify
+from gosa.common import Environment
+from gosa.common.components.registry import PluginRegistry
+from amires.main import AsteriskNotificationReceiver
+from amires.resolver import PhoneNumberResolver
+from amires.render import BaseRenderer
+
+Environment.reset()
+Environment.config = os.path.join(os.path.dirname(os.path.realpath(__file__)), "test.conf")
+Environment.noargs = True
+
+
+class Resolver(PhoneNumberResolver):
+
+    def __init__(self, priority, numbers, delay=0, timeout=None):
+        self.priority = priority
+        self.numbers = numbers
+        self.delay = delay
+        self.timeout = timeout
+        self.calls = 0
+
+    def resolve(self, number):
+        self.calls += 1
+        time.sleep(self.delay)
+        if number == "fail":
+            raise ValueError(number)
+        return self.numbers.get(number)
+
+
+class Renderer(BaseRenderer):
+    priority = 1
+
+    def __init__(self):
+        self.calls = 0
+
+    def getCacheKey(self, info, event):
+        return info['contact_name']
+
+    def getHTML(self, info, event):
+        self.calls += 1
+        return "Call of %s" % info['contact_name']
+
+
+class EntryPoint(object):
+    """ Entry point which loads the given object. """
+
+    def __init__(self, name, obj):
+        self.name = name
+        self.obj = obj
+
+    def load(self):
+        factory = lambda: self.obj
+        factory.__name__ = self.name
+        factory.priority = self.obj.priority
+        return factory
+
+
+class CommandRegistry(object):
+
+    def __init__(self):
+        self.calls = []
+
+    def dispatch(self, user, queue, func, *args):
+        self.calls.append((func,) + args)
+
+
+class AMQPHandler(object):
+    url = {'user': 'agent'}
+
+
+def event(From, To, Type="IncomingCall"):
+    return objectify.fromstring("""<Event xmlns="http://www.gonicus.de/Events">
+        <AsteriskNotification><Type>%s</Type><From>%s</From><To>%s</To></AsteriskNotification>
+        </Event>""" % (Type, From, To))
+
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.resolvers = {
+            'slow': Resolver(1, {'100': {'contact_name': 'slow', 'ldap_uid': 'slow'}}, delay=1),
+            'fast': Resolver(5, {'100': {'contact_name': 'fast', 'ldap_uid': 'fast'},
+                                 '200': {'contact_name': 'user', 'ldap_uid': 'user'}}, delay=0.05),
+            'low': Resolver(9, {'100': {'contact_name': 'low', 'ldap_uid': 'low'}})}
+        self.renderer = Renderer()
+        self.entry_points = {
+            'phone.resolver': [EntryPoint(n, r) for n, r in self.resolvers.items()],
+            'notification.renderer': [EntryPoint('render', self.renderer)]}
+
+        self.__iter_entry_points = pkg_resources.iter_entry_points
+        pkg_resources.iter_entry_points = lambda group: self.entry_points.get(group, [])
+
+        AsteriskNotificationReceiver.resolver = {}
+        AsteriskNotificationReceiver.renderer = {}
+        self.receiver = AsteriskNotificationReceiver()
+
+        self.cr = CommandRegistry()
+        self.receiver._AsteriskNotificationReceiver__cr = self.cr
+        PluginRegistry.modules['AMQPHandler'] = AMQPHandler()
+
+    def tearDown(self):
+        pkg_resources.iter_entry_points = self.__iter_entry_points
+        self.receiver.stop()
+        PluginRegistry.modules.pop('AMQPHandler', None)
+
+    def start(self, run=True):
+        # Run the workers without listening to the bus
+        threads = []
+        for i in range(2):
+            thread = Thread(target=self.receiver._AsteriskNotificationReceiver__work)
+            thread.setDaemon(True)
+            if run:
+                thread.start()
+            threads.append(thread)
+
+        self.receiver._AsteriskNotificationReceiver__threads += threads
+        return threads
+
+    def test_priority(self):
+        # The slow resolver times out, the next one by priority wins
+        start = time.time()
+        self.assertEqual(self.receiver.resolve('100')['contact_name'], 'fast')
+        self.assertTrue(time.time() - start < 0.5)
+
+        self.resolvers['slow'].timeout = 2
+        self.assertEqual(self.receiver.resolve('100')['contact_name'], 'slow')
+
+        stats = self.receiver.getCallStatistics()['resolvers']
+        self.assertEqual(stats['slow'], {'calls': 2, 'timeouts': 1, 'failures': 0})
+
+    def test_failure(self):
+        self.assertEqual(self.receiver.resolve('fail'), None)
+        self.assertEqual(self.receiver.resolve('300'), None)
+
+        stats = self.receiver.getCallStatistics()['resolvers']
+        self.assertEqual(stats['low'], {'calls': 2, 'timeouts': 0, 'failures': 1})
+
+    def test_process(self):
+        self.start()
+        self.receiver.process(event('100', '200'))
+        self.receiver.process(event('100', '200'))
+
+        for i in range(50):
+            if self.receiver.getCallStatistics()['processed'] == 2:
+                break
+            time.sleep(0.1)
+
+        message = ("notifyUser", "user", AsteriskNotificationReceiver.TYPE_MAP['IncomingCall'], "Call of fast")
+        self.assertEqual(self.cr.calls, [message, message])
+        self.assertEqual(self.renderer.calls, 1)
+
+        stats = self.receiver.getCallStatistics()
+        self.assertEqual((stats['received'], stats['processed'], stats['dropped']), (2, 2, 0))
+
+    def test_queue(self):
+        # Without workers, the queue runs full
+        for i in range(5):
+            self.receiver.process(event('100', '200'))
+
+        stats = self.receiver.getCallStatistics()
+        self.assertEqual((stats['received'], stats['queued'], stats['dropped']), (5, 3, 2))
+
+    def test_stop(self):
+        # Stopping must not block on a full queue
+        threads = self.start(False)
+        for i in range(5):
+            self.receiver.process(event('100', '200'))
+
+        stopper = Thread(target=self.receiver.stop)
+        stopper.setDaemon(True)
+        stopper.start()
+        stopper.join(2)
+        self.assertFalse(stopper.is_alive())
+        self.assertEqual(self.receiver.getCallStatistics()['dropped'], 2 + 3)
+
+        # The workers leave without processing anything
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(2)
+            self.assertFalse(thread.is_alive())
+        self.assertEqual(self.cr.calls, [])
+
+
+if __name__ == '__main__':
+    unittest.main()